@@ -0,0 +1,579 @@
+#!/usr/bin/env python3
+"""SQLite-backed local store that mirrors the Cloudflare D1 schema.
+
+The Python stand-in servers use this to serve realistic data volumes.
+The store applies ``schema/d1/schema.sql`` followed by
+``schema/d1/migrations/*.sql`` to a local SQLite file (WAL mode). Each
+thread gets its own connection, and queries go through constant SQL so
+sqlite3's statement cache can reuse the prepared statements.
+
+Usage:
+  python3 local_store.py path/to/local.sqlite [--stats]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_SCHEMA_DIR = BASE_DIR / "schema" / "d1"
+STATEMENT_CACHE_SIZE = 256
+
+SQL_INSERT_FACILITY = """
+INSERT INTO facilities (
+  id, external_id, name, short_name, kana_name, prefecture_code, prefecture,
+  city_code, city, address, postal_code, latitude, longitude, facility_type,
+  source, phone, fax, website, metadata, created_at, updated_at
+) VALUES (
+  :id, :external_id, :name, :short_name, :kana_name, :prefecture_code, :prefecture,
+  :city_code, :city, :address, :postal_code, :latitude, :longitude, :facility_type,
+  :source, :phone, :fax, :website, :metadata, :created_at, :updated_at
+)
+ON CONFLICT(id) DO UPDATE SET
+  external_id = excluded.external_id,
+  name = excluded.name,
+  short_name = excluded.short_name,
+  kana_name = excluded.kana_name,
+  prefecture_code = excluded.prefecture_code,
+  prefecture = excluded.prefecture,
+  city_code = excluded.city_code,
+  city = excluded.city,
+  address = excluded.address,
+  postal_code = excluded.postal_code,
+  latitude = excluded.latitude,
+  longitude = excluded.longitude,
+  facility_type = excluded.facility_type,
+  source = excluded.source,
+  phone = excluded.phone,
+  fax = excluded.fax,
+  website = excluded.website,
+  metadata = excluded.metadata,
+  updated_at = excluded.updated_at
+"""
+
+SQL_SELECT_FACILITIES = """
+SELECT id, name, address, postal_code, latitude, longitude, phone, fax, website,
+       metadata, created_at, updated_at
+FROM facilities
+ORDER BY id
+"""
+
+SQL_SELECT_FACILITY = """
+SELECT id, name, address, postal_code, latitude, longitude, phone, fax, website,
+       metadata, created_at, updated_at
+FROM facilities
+WHERE id = ?
+"""
+
+SQL_DELETE_COLLECTION = {
+    "facility_services": "DELETE FROM facility_services WHERE facility_id = ?",
+    "facility_tests": "DELETE FROM facility_tests WHERE facility_id = ?",
+}
+
+SQL_INSERT_COLLECTION = {
+    "facility_services": """
+INSERT OR REPLACE INTO facility_services (id, facility_id, master_id, name, category, source, notes)
+VALUES (:id, :facility_id, :master_id, :name, :category, :source, :notes)
+""",
+    "facility_tests": """
+INSERT OR REPLACE INTO facility_tests (id, facility_id, master_id, name, category, source, notes)
+VALUES (:id, :facility_id, :master_id, :name, :category, :source, :notes)
+""",
+}
+
+SQL_SELECT_COLLECTION = {
+    "facility_services": """
+SELECT id, facility_id, master_id, name, category, source, notes
+FROM facility_services
+WHERE facility_id = ?
+ORDER BY name
+""",
+    "facility_tests": """
+SELECT id, facility_id, master_id, name, category, source, notes
+FROM facility_tests
+WHERE facility_id = ?
+ORDER BY name
+""",
+}
+
+SQL_SELECT_ALL_COLLECTION = {
+    "facility_services": """
+SELECT id, facility_id, master_id, name, category, source, notes
+FROM facility_services
+ORDER BY facility_id, name
+""",
+    "facility_tests": """
+SELECT id, facility_id, master_id, name, category, source, notes
+FROM facility_tests
+ORDER BY facility_id, name
+""",
+}
+
+# functions/lib/masterStore.js の listMasterItemsD1 と同じ並び順（type=NULL なら全種別を種別順に）
+SQL_SELECT_MASTER_ITEMS = """
+SELECT *
+FROM master_items
+WHERE (?1 IS NULL OR type = ?1)
+  AND (
+    (?2 IS NULL AND organization_id IS NULL)
+    OR organization_id = ?2
+  )
+  AND (?3 IS NULL OR status = ?3)
+ORDER BY
+  type,
+  CASE WHEN organization_id = ?2 THEN 0 ELSE 1 END,
+  CASE WHEN sort_order IS NULL THEN 1 ELSE 0 END,
+  sort_order,
+  name COLLATE NOCASE
+"""
+
+SQL_INSERT_MASTER_ITEM = """
+INSERT INTO master_items (
+  id, organization_id, type, category, name, status, sort_group, sort_order,
+  description, notes, reference_url, count, metadata, legacy_key, comparable_key,
+  normalized_name, normalized_category
+) VALUES (
+  :id, :organization_id, :type, :category, :name, :status, :sort_group, :sort_order,
+  :description, :notes, :reference_url, :count, :metadata, :legacy_key, :comparable_key,
+  :normalized_name, :normalized_category
+)
+ON CONFLICT(id) DO UPDATE SET
+  category = excluded.category,
+  name = excluded.name,
+  status = excluded.status,
+  sort_group = excluded.sort_group,
+  sort_order = excluded.sort_order,
+  description = excluded.description,
+  notes = excluded.notes,
+  reference_url = excluded.reference_url,
+  count = excluded.count,
+  metadata = excluded.metadata,
+  normalized_name = excluded.normalized_name,
+  normalized_category = excluded.normalized_category
+"""
+
+# updateMasterItem で書き換えられる API キー → 列名
+MASTER_UPDATE_COLUMNS = {
+    "status": "status",
+    "sortGroup": "sort_group",
+    "sortOrder": "sort_order",
+    "desc": "description",
+    "notes": "notes",
+    "referenceUrl": "reference_url",
+}
+
+SQL_SELECT_MASTER_CATEGORIES = """
+SELECT name, organization_id, display_order
+FROM master_categories
+WHERE type = ?1
+  AND (
+    (?2 IS NULL AND organization_id IS NULL)
+    OR organization_id = ?2
+  )
+ORDER BY
+  CASE WHEN organization_id = ?2 THEN 0 ELSE 1 END,
+  CASE WHEN display_order IS NULL THEN 1 ELSE 0 END,
+  display_order,
+  name COLLATE NOCASE
+"""
+
+SQL_INSERT_MASTER_CATEGORY = """
+INSERT INTO master_categories (organization_id, type, name, display_order)
+VALUES (:organization_id, :type, :name, :display_order)
+ON CONFLICT(organization_id, type, name) DO UPDATE SET
+  display_order = excluded.display_order
+"""
+
+
+def parse_json(value, fallback):
+    if not value:
+        return fallback
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return fallback
+
+
+def facility_row_from_clinic(clinic):
+    """スタンドイン形式の診療所レコードを facilities 行に変換する（全体は metadata に JSON で保持）。"""
+    location = clinic.get("location") or {}
+    homepage = clinic.get("homepage") or {}
+    now = int(time.time())
+    return {
+        "id": clinic["id"],
+        "external_id": clinic.get("externalId") or clinic.get("mhlwFacilityId"),
+        "name": clinic.get("name") or "",
+        "short_name": clinic.get("shortName"),
+        "kana_name": clinic.get("kanaName"),
+        "prefecture_code": clinic.get("prefectureCode"),
+        "prefecture": clinic.get("prefecture"),
+        "city_code": clinic.get("cityCode"),
+        "city": clinic.get("city"),
+        "address": clinic.get("address") or "",
+        "postal_code": clinic.get("postalCode") or "",
+        "latitude": clinic.get("latitude", location.get("lat")),
+        "longitude": clinic.get("longitude", location.get("lng")),
+        "facility_type": clinic.get("facilityType") or "clinic",
+        "source": clinic.get("source") or "manual",
+        "phone": clinic.get("phone") or "",
+        "fax": clinic.get("fax") or "",
+        "website": homepage.get("url") or "",
+        "metadata": json.dumps(clinic, ensure_ascii=False),
+        # 列は NOT NULL なので、時刻の無い診療所は D1 の DEFAULT と同じく現在時刻にする
+        "created_at": clinic.get("created_at") or now,
+        "updated_at": clinic.get("updated_at") or now,
+    }
+
+
+def clinic_from_facility_row(row):
+    clinic = parse_json(row["metadata"], None)
+    if not isinstance(clinic, dict):
+        clinic = {
+            "id": row["id"],
+            "name": row["name"] or "",
+            "address": row["address"] or "",
+            "postalCode": row["postal_code"] or "",
+            "phone": row["phone"] or "",
+            "fax": row["fax"] or "",
+            "homepage": {"available": bool(row["website"]), "url": row["website"] or ""},
+            "latitude": row["latitude"],
+            "longitude": row["longitude"],
+            "location": {"lat": row["latitude"], "lng": row["longitude"]},
+            "schema_version": 2,
+        }
+    clinic.setdefault("id", row["id"])
+    clinic.setdefault("updated_at", row["updated_at"])
+    clinic.setdefault("created_at", row["created_at"])
+    return clinic
+
+
+def collection_rows(facility_id, entries):
+    rows = []
+    for index, entry in enumerate(entries or ()):
+        if not isinstance(entry, dict) or not entry.get("name"):
+            continue
+        rows.append({
+            "id": entry.get("id") or f"{facility_id}:{entry.get('masterId') or index}",
+            "facility_id": facility_id,
+            "master_id": entry.get("masterId"),
+            "name": entry["name"],
+            "category": entry.get("category"),
+            "source": entry.get("source"),
+            "notes": entry.get("notes"),
+        })
+    return rows
+
+
+def collection_entry(row):
+    entry = {"id": row["id"], "name": row["name"]}
+    for column, key in (("master_id", "masterId"), ("category", "category"),
+                        ("source", "source"), ("notes", "notes")):
+        if row[column]:
+            entry[key] = row[column]
+    return entry
+
+
+def group_by_facility(rows):
+    """facility_id 順の行を (facility_id, [entry, ...]) にまとめて順に返す。"""
+    current_id = None
+    entries = []
+    for row in rows:
+        if row["facility_id"] != current_id:
+            if entries:
+                yield current_id, entries
+            current_id, entries = row["facility_id"], []
+        entries.append(collection_entry(row))
+    if entries:
+        yield current_id, entries
+
+
+# masterStore.js の applyMasterMetadata と同じく metadata 列に入れて、読み出し時に展開する項目
+MASTER_METADATA_FIELDS = (
+    "synonyms", "defaultServices", "defaultTests", "bodySiteRefs", "severityTags", "icd10", "patientLabel",
+)
+
+
+def master_row_from_item(item, organization_id=None):
+    master_type = item["type"]
+    category = item.get("category") or ""
+    name = item.get("name") or ""
+    legacy_key = item.get("_key") or f"master:{master_type}:{category}|{name}"
+    return {
+        "id": item.get("id") or legacy_key[len("master:"):],
+        "organization_id": organization_id,
+        "type": master_type,
+        "category": category,
+        "name": name,
+        "status": item.get("status") or "candidate",
+        "sort_group": item.get("sortGroup"),
+        "sort_order": item.get("sortOrder"),
+        "description": item.get("desc"),
+        "notes": item.get("notes"),
+        "reference_url": item.get("referenceUrl"),
+        "count": item.get("count") or 0,
+        "metadata": json.dumps({key: item[key] for key in MASTER_METADATA_FIELDS if key in item},
+                               ensure_ascii=False) if any(key in item for key in MASTER_METADATA_FIELDS) else None,
+        "legacy_key": legacy_key,
+        "comparable_key": f"{master_type}:{category}|{name}",
+        "normalized_name": name,
+        "normalized_category": category,
+    }
+
+
+def master_item_from_row(row):
+    """D1 の mapMasterRow に合わせ、API が返すキー名に変換する。"""
+    item = {
+        "_key": row["legacy_key"] or f"master:{row['type']}:{row['id']}",
+        "id": row["id"],
+        "type": row["type"],
+        "category": row["category"] or "",
+        "name": row["name"] or "",
+        "status": row["status"] or "candidate",
+        "count": row["count"] or 0,
+    }
+    optional = (
+        ("description", "desc"),
+        ("notes", "notes"),
+        ("reference_url", "referenceUrl"),
+        ("sort_group", "sortGroup"),
+        ("sort_order", "sortOrder"),
+        ("organization_id", "organizationId"),
+    )
+    for column, key in optional:
+        if row[column] is not None:
+            item[key] = row[column]
+    metadata = parse_json(row["metadata"], {})
+    if not isinstance(metadata, dict):
+        metadata = {}
+    for key in MASTER_METADATA_FIELDS:
+        if key in metadata and key not in item:
+            item[key] = metadata[key]
+    return item
+
+
+class ConnectionOwner:
+    """スレッドローカルにだけ置く目印。スレッド終了で回収されたら、その接続を閉じる。"""
+
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn):
+        self.conn = conn
+
+
+class LocalStore:
+    """D1 互換スキーマの SQLite ファイル。接続はスレッドごとに 1 本を使い回し、スレッドが終わったら閉じる。"""
+
+    def __init__(self, path, schema_dir=DEFAULT_SCHEMA_DIR):
+        self.path = str(path)
+        self.schema_dir = Path(schema_dir)
+        self._local = threading.local()
+        self._connections = []
+        # release はスレッド終了時の後始末で呼ばれるので、ロック保持中に割り込まれても固まらないよう RLock にする
+        self._connections_lock = threading.RLock()
+
+    def connect(self):
+        owner = getattr(self._local, "owner", None)
+        if owner is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA foreign_keys = ON")
+            conn.execute("PRAGMA busy_timeout = 5000")
+            owner = self._local.owner = ConnectionOwner(conn)
+            weakref.finalize(owner, self.release, conn)
+            with self._connections_lock:
+                self._connections.append(conn)
+        return owner.conn
+
+    def release(self, conn):
+        """スレッドが終わった接続を閉じて一覧から外す（close 済みなら何もしない）。"""
+        with self._connections_lock:
+            self._connections = [live for live in self._connections if live is not conn]
+        conn.close()
+
+    def close(self):
+        """全スレッドの接続を閉じる。fork 前に呼び、子プロセスでは新しく接続させる。"""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def migration_files(self):
+        files = [self.schema_dir / "schema.sql"]
+        files.extend(sorted((self.schema_dir / "migrations").glob("*.sql")))
+        return files
+
+    def migrate(self):
+        """未適用の schema.sql / migrations/*.sql を順に適用し、適用済みの一覧を返す。"""
+        conn = self.connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS _local_schema_migrations ("
+            " name TEXT PRIMARY KEY,"
+            " applied_at INTEGER NOT NULL DEFAULT (strftime('%s','now')))"
+        )
+        applied = {row[0] for row in conn.execute("SELECT name FROM _local_schema_migrations")}
+        newly_applied = []
+        for path in self.migration_files():
+            name = path.name
+            if name in applied:
+                continue
+            script = path.read_text(encoding="utf-8")
+            conn.executescript("BEGIN;\n" + script + "\nCOMMIT;")
+            with conn:
+                conn.execute("INSERT INTO _local_schema_migrations (name) VALUES (?)", (name,))
+            newly_applied.append(name)
+        return newly_applied
+
+    def count(self, table):
+        if not table.isidentifier():
+            raise ValueError(f"invalid table name: {table}")
+        return self.connect().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    # --- facilities ---
+
+    def upsert_clinics(self, clinics):
+        conn = self.connect()
+        count = 0
+        with conn:
+            for clinic in clinics:
+                conn.execute(SQL_INSERT_FACILITY, facility_row_from_clinic(clinic))
+                for table, key in (("facility_services", "services"), ("facility_tests", "tests")):
+                    if key in clinic:
+                        conn.execute(SQL_DELETE_COLLECTION[table], (clinic["id"],))
+                        conn.executemany(SQL_INSERT_COLLECTION[table],
+                                         collection_rows(clinic["id"], clinic.get(key)))
+                count += 1
+        return count
+
+    def upsert_clinic(self, clinic):
+        self.upsert_clinics([clinic])
+
+    def get_clinic(self, clinic_id):
+        conn = self.connect()
+        row = conn.execute(SQL_SELECT_FACILITY, (clinic_id,)).fetchone()
+        if row is None:
+            return None
+        clinic = clinic_from_facility_row(row)
+        for table, key in (("facility_services", "services"), ("facility_tests", "tests")):
+            entries = [collection_entry(r) for r in conn.execute(SQL_SELECT_COLLECTION[table], (clinic_id,))]
+            if entries:
+                clinic[key] = entries
+        return clinic
+
+    def iter_clinics(self):
+        """全施設を id 順に返す。services/tests は facility_id 順のカーソルと突き合わせるので、
+        件数によらずメモリに載るのは 1 施設分だけ。"""
+        conn = self.connect()
+        collections = [
+            (key, group_by_facility(conn.execute(SQL_SELECT_ALL_COLLECTION[table])))
+            for table, key in (("facility_services", "services"), ("facility_tests", "tests"))
+        ]
+        pending = {key: next(groups, None) for key, groups in collections}
+        for row in conn.execute(SQL_SELECT_FACILITIES):
+            clinic = clinic_from_facility_row(row)
+            for key, groups in collections:
+                group = pending[key]
+                # 施設の無い孤立行は読み飛ばす
+                while group is not None and group[0] < clinic["id"]:
+                    group = next(groups, None)
+                if group is not None and group[0] == clinic["id"]:
+                    clinic[key] = group[1]
+                    group = next(groups, None)
+                pending[key] = group
+            yield clinic
+
+    # --- masters ---
+
+    def upsert_master_items(self, items, organization_id=None):
+        conn = self.connect()
+        rows = [master_row_from_item(item, organization_id) for item in items]
+        with conn:
+            conn.executemany(SQL_INSERT_MASTER_ITEM, rows)
+        return len(rows)
+
+    def iter_master_items(self, master_type=None, status=None, organization_id=None):
+        """master_type が None なら全種別を返す。iter_clinics と同じくジェネレーターなので、
+        クエリは最初に読み出したスレッドの接続で実行される。"""
+        for row in self.connect().execute(SQL_SELECT_MASTER_ITEMS, (master_type, organization_id, status)):
+            yield master_item_from_row(row)
+
+    def list_master_items(self, master_type, status=None, organization_id=None):
+        return list(self.iter_master_items(master_type, status, organization_id))
+
+    def update_master_item(self, master_type, category, name, changes, organization_id=None):
+        """(type, category, name) で特定した項目の一部の列だけを更新する。更新件数を返す。"""
+        columns = {MASTER_UPDATE_COLUMNS[key]: value for key, value in changes.items()
+                   if key in MASTER_UPDATE_COLUMNS}
+        if not columns:
+            return 0
+        assignments = ", ".join(f"{column} = :{column}" for column in columns)
+        sql = (f"UPDATE master_items SET {assignments} "
+               "WHERE type = :type AND name = :name "
+               "AND (:category IS NULL OR category = :category) "
+               "AND ((:organization_id IS NULL AND organization_id IS NULL) OR organization_id = :organization_id)")
+        params = dict(columns, type=master_type, name=name, category=category, organization_id=organization_id)
+        conn = self.connect()
+        with conn:
+            return conn.execute(sql, params).rowcount
+
+    def replace_master_categories(self, master_type, categories, organization_id=None):
+        conn = self.connect()
+        with conn:
+            if organization_id is None:
+                conn.execute("DELETE FROM master_categories WHERE type = ? AND organization_id IS NULL",
+                             (master_type,))
+            else:
+                conn.execute("DELETE FROM master_categories WHERE type = ? AND organization_id = ?",
+                             (master_type, organization_id))
+            conn.executemany(SQL_INSERT_MASTER_CATEGORY, [
+                {"organization_id": organization_id, "type": master_type, "name": name, "display_order": order}
+                for order, name in enumerate(categories)
+            ])
+
+    def list_master_categories(self, master_type, organization_id=None):
+        rows = self.connect().execute(SQL_SELECT_MASTER_CATEGORIES, (master_type, organization_id))
+        seen = set()
+        categories = []
+        for row in rows:
+            name = (row["name"] or "").strip()
+            if name and name not in seen:
+                seen.add(name)
+                categories.append(name)
+        return categories
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or migrate a local D1-compatible SQLite store")
+    parser.add_argument("path", help="SQLite file to create or migrate")
+    parser.add_argument("--schema-dir", default=str(DEFAULT_SCHEMA_DIR), help="Directory holding schema.sql and migrations/")
+    parser.add_argument("--stats", action="store_true", help="Print row counts after migrating")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.path)), exist_ok=True)
+    store = LocalStore(args.path, args.schema_dir)
+    applied = store.migrate()
+    for name in applied:
+        print(f"applied {name}")
+    if args.stats:
+        for table in ("facilities", "facility_services", "facility_tests", "master_items", "master_categories"):
+            print(f"{table}: {store.count(table)}")
+    store.close()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nInterrupted", file=sys.stderr)
+        sys.exit(1)
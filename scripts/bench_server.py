@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""Load-test the local API stand-in (simple_server.py) and record the results.
+
+Usage:
+  python3 scripts/bench_server.py [--clinics 10000] [--concurrency 16] [--duration 10]
+  python3 scripts/bench_server.py --rate 500 --duration 30          # open loop
+  python3 scripts/bench_server.py --isolate --compare reports/bench/previous.json
+  python3 scripts/bench_server.py --base-url http://localhost:7000  # already running
+
+By default the server is booted on a free port against a temporary SQLite
+store seeded by scripts/generate_clinics.py. Pass extra server flags after
+``--`` (for example ``-- --engine asyncio --workers 2``). A weighted mix
+of listClinics, clinicDetail, listMaster, todo/save and static fetches is
+then driven in one of two ways:
+
+  closed loop  --concurrency workers each send their next request as soon
+               as the previous answer arrives (default)
+  open loop    --rate requests/s are scheduled on a fixed timetable, and
+               latency is measured from the scheduled start, so a stalled
+               server is not hidden by coordinated omission
+
+Per route, the report gives request/error counts, throughput and
+p50/p95/p99/max latency. It also gives the server's RSS (the process and
+its pre-forked workers; Linux /proc only) before and after the run and
+at its peak. With --isolate, each route runs in its own phase, so the RSS
+growth can be attributed to a route. Results are written as JSON to
+reports/bench/ (or --output), and --compare prints the change against an
+earlier result file.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from generate_clinics import DEFAULT_BATCH_SIZE, generate_clinics, load_store  # noqa: E402
+from script_utils import percentile  # noqa: E402
+
+USER_AGENT = "NCD-Script/bench/1.0"
+DEFAULT_MIX = "listClinics=35,clinicDetail=25,listMaster=15,todoSave=5,static=20"
+ROUTES = ("listClinics", "clinicDetail", "listMaster", "todoSave", "static")
+MASTER_TYPES = ("test", "service", "qual", "department", "facility", "vaccination", "checkup", "symptom")
+STATIC_MAX_BYTES = 256 * 1024
+READY_TIMEOUT = 120.0
+RSS_SAMPLE_INTERVAL = 0.5
+
+
+# --- サーバーの起動とメモリ計測 ---
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_tree(pid: int) -> list[int]:
+    pids = [pid]
+    for current in pids:
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def rss_bytes(pid: int) -> int | None:
+    """pid と子プロセス（--workers）の VmRSS の合計。/proc が無ければ None。"""
+    total = None
+    for current in process_tree(pid):
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total = (total or 0) + int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class RssSampler:
+    """計測中のサーバーの RSS を定期的に読み、最大値を覚えておく。"""
+
+    def __init__(self, pid: int | None):
+        self.pid = pid
+        self.peak = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def sample(self) -> int | None:
+        if self.pid is None:
+            return None
+        value = rss_bytes(self.pid)
+        if value is not None:
+            self.peak = max(self.peak or 0, value)
+        return value
+
+    def run(self) -> None:
+        while not self.stopped.wait(RSS_SAMPLE_INTERVAL):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.sample()
+
+
+def seed_database(path: str, clinics: int, seed: int) -> float:
+    started = time.perf_counter()
+    load_store(path, generate_clinics(clinics, seed), DEFAULT_BATCH_SIZE, truncate=False)
+    return time.perf_counter() - started
+
+
+def start_server(port: int, db_path: str, server_args: list[str], log_path: str) -> subprocess.Popen:
+    # stderr はパイプにせずファイルへ流す（誰も読まないパイプが埋まるとサーバーが止まる）
+    command = [sys.executable, str(ROOT / "simple_server.py"), str(port), "--host", "127.0.0.1",
+               "--quiet", "--db", db_path, *server_args]
+    with open(log_path, "wb") as log:
+        return subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=log)
+
+
+def wait_ready(base_url: str, process: subprocess.Popen | None, log_path: str | None = None) -> float:
+    parts = urlsplit(base_url)
+    started = time.perf_counter()
+    while time.perf_counter() - started < READY_TIMEOUT:
+        if process is not None and process.poll() is not None:
+            log = Path(log_path).read_text(encoding="utf-8", errors="replace") if log_path else ""
+            raise SystemExit(f"server exited during startup:\n{log}")
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=2)
+            conn.request("GET", "/api/modes")
+            if conn.getresponse().status == 200:
+                conn.close()
+                return time.perf_counter() - started
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"server at {base_url} did not become ready within {READY_TIMEOUT:.0f}s")
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# --- リクエストの組み立て ---
+
+class Workload:
+    """ルート名から (メソッド, パス, 本文) を作る。ID や静的ファイルは起動後のサーバーから集める。"""
+
+    def __init__(self, clinic_ids: list[str], static_paths: list[str], list_limit: int):
+        self.clinic_ids = clinic_ids or ["test-clinic-1"]
+        self.static_paths = static_paths or ["/"]
+        self.list_limit = list_limit
+        self.todos = json.dumps({"todos": [
+            {"category": "bench", "title": "負荷試験", "status": "open", "priority": "P3", "createdBy": "bench"},
+        ]}, ensure_ascii=False).encode("utf-8")
+
+    def request(self, route: str, rng: random.Random):
+        if route == "listClinics":
+            return "GET", f"/api/listClinics?limit={self.list_limit}", None
+        if route == "clinicDetail":
+            return "GET", f"/api/clinicDetail?id={quote(rng.choice(self.clinic_ids))}", None
+        if route == "listMaster":
+            return "GET", f"/api/listMaster?type={rng.choice(MASTER_TYPES)}", None
+        if route == "todoSave":
+            return "POST", "/api/todo/save", self.todos
+        return "GET", rng.choice(self.static_paths), None
+
+
+def collect_clinic_ids(base_url: str, limit: int = 1000) -> list[str]:
+    parts = urlsplit(base_url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+    conn.request("GET", f"/api/listClinics?fields=id&limit={limit}")
+    payload = json.loads(conn.getresponse().read() or b"{}")
+    conn.close()
+    return [clinic["id"] for clinic in payload.get("clinics", []) if clinic.get("id")]
+
+
+def collect_static_paths(web_root: Path) -> list[str]:
+    paths = []
+    for path in sorted(web_root.rglob("*")):
+        if path.is_file() and path.stat().st_size <= STATIC_MAX_BYTES and not path.name.startswith("."):
+            paths.append("/" + path.relative_to(web_root).as_posix())
+    return paths
+
+
+def parse_mix(text: str) -> dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise argparse.ArgumentTypeError(f"unknown route {name!r} (choose from {', '.join(ROUTES)})")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid weight for {name}: {weight!r}")
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("the mix needs at least one route with a positive weight")
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+# --- 負荷の生成 ---
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.bytes: dict[str, int] = {}
+
+    def add(self, route: str, latency: float, ok: bool, size: int) -> None:
+        with self.lock:
+            self.latencies.setdefault(route, []).append(latency)
+            self.bytes[route] = self.bytes.get(route, 0) + size
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+class Connection:
+    """ワーカー 1 本分の keep-alive 接続。切断されたら次のリクエストで張り直す。"""
+
+    def __init__(self, host: str, port: int, headers: dict[str, str], timeout: float = 30.0):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.headers = headers
+        self.conn = None
+        self.opened = 0
+
+    def send(self, method: str, path: str, body: bytes | None) -> tuple[int, int]:
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.opened += 1
+        headers = dict(self.headers)
+        if body is not None:
+            headers["Content-Type"] = "application/json; charset=utf-8"
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            if response.will_close:
+                self.close()
+            return response.status, len(data)
+        except (http.client.HTTPException, OSError):
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def drive(base_url: str, workload: Workload, mix: dict[str, float], args, seed: int) -> dict:
+    """closed loop（--rate 0）または open loop で duration 秒間リクエストを送る。"""
+    parts = urlsplit(base_url)
+    headers = {"User-Agent": USER_AGENT, "Connection": "keep-alive"}
+    if args.gzip:
+        headers["Accept-Encoding"] = "gzip"
+    names, weights = list(mix), list(mix.values())
+    recorder = Recorder()
+    schedule_lock = threading.Lock()
+    ticket = [0]
+    started = time.perf_counter()
+    deadline = started + args.duration
+    connections = []
+
+    def next_start() -> float | None:
+        # open loop: i 番目のリクエストは started + i / rate に送る予定
+        with schedule_lock:
+            index = ticket[0]
+            ticket[0] += 1
+        scheduled = started + index / args.rate
+        return scheduled if scheduled < deadline else None
+
+    def worker(worker_id: int) -> None:
+        rng = random.Random(seed * 1000 + worker_id)
+        conn = Connection(parts.hostname, parts.port, headers)
+        connections.append(conn)
+        while True:
+            if args.rate:
+                scheduled = next_start()
+                if scheduled is None:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                scheduled = time.perf_counter()
+                if scheduled >= deadline:
+                    break
+            route = rng.choices(names, weights)[0]
+            method, path, body = workload.request(route, rng)
+            try:
+                status, size = conn.send(method, path, body)
+                ok = status < 400
+            except (http.client.HTTPException, OSError):
+                size, ok = 0, False
+            recorder.add(route, time.perf_counter() - scheduled, ok, size)
+        conn.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return summarize(recorder, elapsed, sum(conn.opened for conn in connections))
+
+
+def route_stats(latencies: list[float], errors: int, size: int, elapsed: float) -> dict:
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "bytes": size,
+        "mean_ms": round(sum(values) / len(values) * 1000, 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p95_ms": round(percentile(values, 95) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+def summarize(recorder: Recorder, elapsed: float, connections: int) -> dict:
+    routes = {
+        route: route_stats(latencies, recorder.errors.get(route, 0), recorder.bytes.get(route, 0), elapsed)
+        for route, latencies in sorted(recorder.latencies.items())
+    }
+    everything = [value for latencies in recorder.latencies.values() for value in latencies]
+    total = route_stats(everything, sum(recorder.errors.values()), sum(recorder.bytes.values()), elapsed)
+    total["connections"] = connections
+    return {"elapsed_s": round(elapsed, 3), "routes": routes, "total": total}
+
+
+# --- 結果の出力 ---
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def mib(value: int | None) -> str:
+    return "-" if value is None else f"{value / 1048576:.1f}MiB"
+
+
+def print_phase(name: str, phase: dict) -> None:
+    rss = phase.get("rss", {})
+    print(f"\n[{name}] {phase['elapsed_s']:.1f}s, {phase['total']['connections']} connections, "
+          f"RSS {mib(rss.get('before'))} -> {mib(rss.get('after'))} (peak {mib(rss.get('peak'))})")
+    print(f"  {'route':<14}{'reqs':>8}{'errs':>6}{'rps':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for route, stats in [*phase["routes"].items(), ("total", phase["total"])]:
+        print(f"  {route:<14}{stats['requests']:>8}{stats['errors']:>6}{stats['rps']:>9.1f}"
+              f"{stats['p50_ms']:>8.2f}ms{stats['p95_ms']:>8.2f}ms{stats['p99_ms']:>8.2f}ms{stats['max_ms']:>8.1f}ms")
+
+
+def print_comparison(result: dict, baseline: dict) -> None:
+    print(f"\nCompared with {baseline['meta'].get('revision') or '?'} ({baseline['meta'].get('started')}):")
+    for name, phase in result["phases"].items():
+        before = baseline.get("phases", {}).get(name)
+        if not before:
+            continue
+        for route, stats in [*phase["routes"].items(), ("total", phase["total"])]:
+            old = before["routes"].get(route) if route != "total" else before.get("total")
+            if not old:
+                continue
+            changes = []
+            for key in ("rps", "p50_ms", "p99_ms"):
+                if old[key]:
+                    changes.append(f"{key} {old[key]:g} -> {stats[key]:g} ({(stats[key] / old[key] - 1) * 100:+.1f}%)")
+            print(f"  [{name}] {route:<14}" + ", ".join(changes))
+
+
+def default_output() -> Path:
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return ROOT / "reports" / "bench" / f"bench-{git_revision() or 'unknown'}-{stamp}.json"
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark the local API stand-in (simple_server.py)")
+    parser.add_argument("--base-url", help="Benchmark an already running server instead of booting one")
+    parser.add_argument("--clinics", type=int, default=10000, help="Synthetic clinics to seed (default: 10000)")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the dataset and the request mix (default: 1)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Route weights (default: {DEFAULT_MIX})")
+    parser.add_argument("--concurrency", type=int, default=16, help="Client worker threads (default: 16)")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="Open-loop request rate per second across all workers; 0 = closed loop (default: 0)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per measured phase (default: 10)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Unrecorded warm-up seconds (default: 2)")
+    parser.add_argument("--isolate", action="store_true",
+                        help="Also run each route alone after the mix to attribute latency and RSS per route")
+    parser.add_argument("--list-limit", type=int, default=100, help="limit= for listClinics requests (default: 100)")
+    parser.add_argument("--gzip", action="store_true", help="Send Accept-Encoding: gzip")
+    parser.add_argument("--output", help="Result JSON path (default: reports/bench/bench-<rev>-<time>.json)")
+    parser.add_argument("--compare", help="Earlier result JSON to compare against")
+    parser.add_argument("server_args", nargs="*", help="Extra simple_server.py flags, after --")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.concurrency < 1 or args.duration <= 0 or args.rate < 0:
+        raise SystemExit("--concurrency and --duration must be positive and --rate non-negative")
+
+    process = None
+    tmpdir = None
+    log_path = None
+    base_url = args.base_url
+    meta = {
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+    }
+    try:
+        if base_url is None:
+            tmpdir = tempfile.TemporaryDirectory(prefix="ncd-bench-")
+            db_path = os.path.join(tmpdir.name, "bench.sqlite")
+            seeded = seed_database(db_path, args.clinics, args.seed)
+            print(f"Seeded {args.clinics} synthetic clinics in {seeded:.1f}s", file=sys.stderr)
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            log_path = os.path.join(tmpdir.name, "server.log")
+            process = start_server(port, db_path, args.server_args, log_path)
+        meta["startup_s"] = round(wait_ready(base_url, process, log_path), 3)
+        meta["base_url"] = base_url
+        workload = Workload(collect_clinic_ids(base_url), collect_static_paths(ROOT / "web"), args.list_limit)
+        sampler_pid = process.pid if process is not None else None
+
+        phases = [("mix", args.mix)]
+        if args.isolate:
+            phases.extend((route, {route: 1.0}) for route in args.mix)
+        result = {"meta": meta, "phases": {}}
+        if args.warmup > 0:
+            drive(base_url, workload, args.mix, argparse.Namespace(**{**vars(args), "duration": args.warmup}),
+                  args.seed + 1)
+        for name, mix in phases:
+            with RssSampler(sampler_pid) as sampler:
+                before = sampler.peak
+                phase = drive(base_url, workload, mix, args, args.seed)
+            phase["rss"] = {"before": before, "after": sampler.sample(), "peak": sampler.peak}
+            result["phases"][name] = phase
+            print_phase(name, phase)
+    finally:
+        if process is not None:
+            stop_server(process)
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+    output = Path(args.output) if args.output else default_output()
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    print(f"\nSaved {output}")
+    if args.compare:
+        print_comparison(result, json.loads(Path(args.compare).read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nInterrupted", file=sys.stderr)
+        sys.exit(1)
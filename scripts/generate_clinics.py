@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""Generate synthetic clinics for scale testing the local API stand-in.
+
+Usage:
+  python3 scripts/generate_clinics.py 100000 --ndjson .local/clinics.ndjson
+  python3 scripts/generate_clinics.py 100000 --ndjson - | gzip > clinics.ndjson.gz
+  python3 scripts/generate_clinics.py 1000000 --db .local/ncd.sqlite --truncate
+  python3 simple_server.py --db .local/ncd.sqlite
+
+Records have the same shape as SAMPLE_CLINICS in simple_server.py:
+schedule patterns and days, departments, modes, vaccinations/checkups
+and tests referencing the sample master keys (so the master reference,
+symptom and schedule indexes all get hits), and media blocks. Locations
+are scattered around the 23 Tokyo wards with a matching address, postal
+code and nearest station.
+
+Output is deterministic: clinic N depends only on --seed and N, so
+slices taken with --offset and the positional count reproduce the same
+rows as one full run. Rows
+are streamed, so memory stays flat at any count. Generated facilities
+have source "synthetic", which lets --truncate remove them again.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from local_store import LocalStore  # noqa: E402
+from simple_server import SAMPLE_MASTER_ITEMS, SAMPLE_MODES  # noqa: E402
+from script_utils import Progress  # noqa: E402
+
+DEFAULT_BATCH_SIZE = 5000
+EPOCH = 1672498800  # 2023-01-01T00:00:00+09:00
+SPAN = 3 * 365 * 86400
+
+# 区名: (中心の緯度, 経度, 郵便番号の上 3 桁, 町名, 最寄り駅)
+WARDS = {
+    "千代田区": (35.6940, 139.7536, "101", ("神田小川町", "九段北", "麹町"), ("JR神田駅", "東京メトロ九段下駅")),
+    "中央区": (35.6707, 139.7720, "104", ("日本橋人形町", "銀座", "月島"), ("東京メトロ人形町駅", "都営月島駅")),
+    "港区": (35.6581, 139.7516, "105", ("芝", "赤坂", "白金"), ("JR田町駅", "東京メトロ赤坂駅")),
+    "新宿区": (35.6938, 139.7034, "160", ("西新宿", "高田馬場", "神楽坂"), ("JR新宿駅 西口", "JR高田馬場駅")),
+    "文京区": (35.7081, 139.7522, "112", ("本郷", "小石川", "千駄木"), ("東京メトロ本郷三丁目駅", "東京メトロ茗荷谷駅")),
+    "台東区": (35.7126, 139.7800, "110", ("上野", "浅草", "谷中"), ("JR上野駅 不忍口", "東京メトロ浅草駅")),
+    "墨田区": (35.7107, 139.8015, "130", ("錦糸", "押上", "向島"), ("JR錦糸町駅 北口", "東武押上駅")),
+    "江東区": (35.6731, 139.8171, "135", ("亀戸", "豊洲", "門前仲町"), ("JR亀戸駅", "東京メトロ豊洲駅")),
+    "品川区": (35.6092, 139.7302, "140", ("大井", "五反田", "戸越"), ("JR大井町駅", "JR五反田駅")),
+    "目黒区": (35.6413, 139.6981, "152", ("自由が丘", "中目黒", "祐天寺"), ("東急自由が丘駅", "東急中目黒駅")),
+    "大田区": (35.5613, 139.7160, "143", ("蒲田", "大森北", "田園調布"), ("JR蒲田駅 東口", "JR大森駅")),
+    "世田谷区": (35.6464, 139.6533, "154", ("三軒茶屋", "下北沢", "成城"), ("東急三軒茶屋駅", "小田急成城学園前駅")),
+    "渋谷区": (35.6640, 139.6982, "150", ("恵比寿", "代々木", "笹塚"), ("JR恵比寿駅", "京王笹塚駅")),
+    "中野区": (35.7074, 139.6638, "164", ("中央", "本町", "野方"), ("JR中野駅 北口", "東京メトロ中野坂上駅")),
+    "杉並区": (35.6995, 139.6364, "166", ("阿佐谷北", "高円寺南", "荻窪"), ("JR阿佐ケ谷駅", "JR荻窪駅")),
+    "豊島区": (35.7263, 139.7166, "170", ("東池袋", "巣鴨", "目白"), ("JR池袋駅 東口", "JR巣鴨駅")),
+    "北区": (35.7528, 139.7337, "114", ("赤羽", "王子", "田端"), ("JR赤羽駅", "JR王子駅")),
+    "荒川区": (35.7361, 139.7834, "116", ("南千住", "町屋", "日暮里"), ("JR南千住駅", "京成町屋駅")),
+    "板橋区": (35.7512, 139.7093, "173", ("大山町", "成増", "高島平"), ("東武大山駅", "都営高島平駅")),
+    "練馬区": (35.7356, 139.6517, "176", ("練馬", "石神井町", "光が丘"), ("西武練馬駅", "都営光が丘駅")),
+    "足立区": (35.7750, 139.8045, "120", ("千住", "西新井", "竹ノ塚"), ("JR北千住駅 西口", "東武竹ノ塚駅")),
+    "葛飾区": (35.7436, 139.8473, "124", ("立石", "亀有", "金町"), ("京成立石駅", "JR亀有駅")),
+    "江戸川区": (35.7066, 139.8683, "132", ("小岩", "葛西", "船堀"), ("JR小岩駅", "東京メトロ葛西駅")),
+}
+WARD_NAMES = tuple(WARDS)
+# 区ごとの件数の偏り（都心・人口の多い区ほど多い）
+WARD_WEIGHTS = (6, 5, 7, 8, 4, 4, 3, 5, 4, 3, 6, 8, 5, 3, 5, 4, 3, 2, 4, 5, 5, 3, 5)
+
+DEPARTMENTS = (
+    ("内科", 30), ("小児科", 10), ("整形外科", 8), ("皮膚科", 8), ("眼科", 6), ("耳鼻咽喉科", 6),
+    ("精神科", 4), ("心療内科", 4), ("消化器内科", 5), ("循環器内科", 4), ("呼吸器内科", 3),
+    ("糖尿病内科", 3), ("泌尿器科", 3), ("婦人科", 3), ("アレルギー科", 3), ("リハビリテーション科", 3),
+    ("歯科", 6), ("形成外科", 1),
+)
+OTHER_DEPARTMENTS = ("訪問診療", "予防接種専門", "睡眠外来", "禁煙外来", "漢方外来", "女性外来")
+NAME_SUFFIXES = (("クリニック", 10), ("医院", 4), ("診療所", 2), ("内科クリニック", 3), ("ファミリークリニック", 1))
+FAMILY_NAMES = ("佐藤", "鈴木", "高橋", "田中", "伊藤", "渡辺", "山本", "中村", "小林", "加藤", "吉田", "山田",
+                "松本", "井上", "木村", "林", "斎藤", "清水", "山口", "森")
+QUALIFICATIONS = ("日本内科学会 認定内科医", "日本小児科学会 専門医", "日本整形外科学会 専門医",
+                  "日本皮膚科学会 専門医", "日本眼科学会 専門医", "日本プライマリ・ケア連合学会 認定医")
+BARRIER_FREE = ("入口段差なし", "エレベーターあり", "車椅子対応トイレ", "キッズスペースあり", "授乳室あり")
+BUS_LINES = ("都営バス", "関東バス", "京王バス", "東急バス", "西武バス")
+
+SCHEDULE_DAYS = ("月曜", "火曜", "水曜", "木曜", "金曜", "土曜", "日曜", "祝日")
+AM_STARTS = ("08:30", "09:00", "09:30", "10:00")
+AM_ENDS = ("12:00", "12:30", "13:00")
+PM_STARTS = ("14:00", "14:30", "15:00", "16:00")
+PM_ENDS = ("17:00", "18:00", "18:30", "19:00", "20:00")
+
+MODES = {mode["id"]: mode for mode in SAMPLE_MODES}
+MASTER_ITEMS = {
+    master_type: tuple(item for item in items if item.get("_key"))
+    for master_type, items in SAMPLE_MASTER_ITEMS.items()
+}
+
+
+def weighted(rng: random.Random, choices):
+    values, weights = zip(*choices)
+    return rng.choices(values, weights)[0]
+
+
+def make_schedule(rng: random.Random) -> dict:
+    patterns = {
+        "amA": [rng.choice(AM_STARTS[:2]), rng.choice(AM_ENDS)],
+        "amB": [rng.choice(AM_STARTS[2:]), rng.choice(AM_ENDS)],
+        "pmA": [rng.choice(PM_STARTS[:2]), rng.choice(PM_ENDS[:3])],
+        "pmB": [rng.choice(PM_STARTS[2:]), rng.choice(PM_ENDS[2:])],
+    }
+    closed_weekday = rng.choice(("水曜", "木曜", None))
+    days = {}
+    for day in SCHEDULE_DAYS:
+        if day == closed_weekday or (day in ("日曜", "祝日") and rng.random() < 0.9):
+            days[day] = {"am": "休診", "pm": "休診"}
+        elif day == "土曜":
+            days[day] = {"am": rng.choice(("午前A", "午前B")), "pm": "休診" if rng.random() < 0.7 else "午後A"}
+        else:
+            days[day] = {"am": rng.choice(("午前A", "午前B")), "pm": rng.choice(("午後A", "午後B"))}
+    return {"patterns": patterns, "days": days}
+
+
+def master_selection(rng: random.Random, master_type: str, probability: float) -> dict | None:
+    items = [item for item in MASTER_ITEMS.get(master_type, ()) if rng.random() < probability]
+    if not items:
+        return None
+    return {
+        "selected": [item["_key"] for item in items],
+        "meta": {
+            item["_key"]: {"category": item.get("category"), "name": item.get("name"), "desc": item.get("desc", "")}
+            for item in items
+        },
+    }
+
+
+def make_clinic(seed: int, index: int) -> dict:
+    """seed と index だけで決まる施設レコード（SAMPLE_CLINICS と同じ形）。"""
+    rng = random.Random((seed << 40) | index)
+    cid = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    ward = rng.choices(WARD_NAMES, WARD_WEIGHTS)[0]
+    center_lat, center_lng, postal_prefix, towns, stations = WARDS[ward]
+    town = rng.choice(towns)
+    address = f"東京都{ward}{town}{rng.randint(1, 6)}-{rng.randint(1, 30)}-{rng.randint(1, 20)}"
+    lat = round(center_lat + rng.gauss(0, 0.008), 6)
+    lng = round(center_lng + rng.gauss(0, 0.01), 6)
+
+    departments = []
+    while not departments or (len(departments) < 4 and rng.random() < 0.35):
+        department = weighted(rng, DEPARTMENTS)
+        if department not in departments:
+            departments.append(department)
+    others = [name for name in OTHER_DEPARTMENTS if rng.random() < 0.08]
+    prefix = rng.choice((rng.choice(FAMILY_NAMES), town, stations[0].split()[0].removeprefix("JR")
+                         .removeprefix("東京メトロ").removeprefix("都営").removesuffix("駅")))
+    name = f"{prefix}{departments[0] if rng.random() < 0.3 else ''}{weighted(rng, NAME_SUFFIXES)}"
+
+    selected_modes = ["outpatient"] + (["homecare"] if "訪問診療" in others or rng.random() < 0.15 else [])
+    homepage = f"https://{cid[:8]}.clinic.example.jp" if rng.random() < 0.7 else ""
+    created_at = EPOCH + rng.randint(0, SPAN)
+    updated_at = created_at + rng.randint(0, EPOCH + SPAN - created_at)
+    media = {}
+    if rng.random() < 0.4:
+        media["logoSmall"] = {
+            "key": f"clinic/{cid}/logo-small.webp",
+            "contentType": "image/webp",
+            "width": 512,
+            "height": 512,
+            "fileSize": rng.randint(8000, 80000),
+            "alt": f"{name} ロゴ",
+            "uploadedAt": updated_at,
+        }
+    if rng.random() < 0.25:
+        media["exterior"] = {
+            "key": f"clinic/{cid}/exterior.webp",
+            "contentType": "image/webp",
+            "width": 1280,
+            "height": 960,
+            "fileSize": rng.randint(80000, 400000),
+            "alt": f"{name} 外観",
+            "uploadedAt": updated_at,
+        }
+    parking = rng.random() < 0.3
+    tests = [
+        {"masterKey": item["_key"], "category": item.get("category"), "name": item.get("name")}
+        for item in MASTER_ITEMS.get("test", ()) if rng.random() < 0.5
+    ]
+    clinic = {
+        "id": cid,
+        "name": name,
+        "postalCode": f"{postal_prefix}{rng.randint(0, 9999):04d}",
+        "address": address,
+        "prefecture": "東京都",
+        "prefectureCode": "13",
+        "city": ward,
+        "phone": f"03-{rng.randint(1000, 9999)}-{rng.randint(0, 9999):04d}",
+        "fax": f"03-{rng.randint(1000, 9999)}-{rng.randint(0, 9999):04d}" if rng.random() < 0.6 else "",
+        "doctors": {
+            "fulltime": rng.randint(1, 4),
+            "parttime": rng.randint(0, 5),
+            "qualifications": rng.choice(QUALIFICATIONS),
+        },
+        "schedule": make_schedule(rng),
+        "homepage": {"available": bool(homepage), "url": homepage},
+        "reservation": {"available": bool(homepage) and rng.random() < 0.5,
+                        "url": f"{homepage}/reserve" if homepage else ""},
+        "departments": {"master": departments, "others": others},
+        "media": media,
+        "access": {
+            "nearestStation": [f"{rng.choice(stations)} 徒歩{rng.randint(1, 15)}分"],
+            "bus": [f"{rng.choice(BUS_LINES)} {town} 徒歩{rng.randint(1, 5)}分"] if rng.random() < 0.4 else [],
+            "parking": {"available": parking, "capacity": rng.randint(1, 10) if parking else None,
+                        "notes": "近隣コインパーキング提携" if parking and rng.random() < 0.3 else ""},
+            "barrierFree": [item for item in BARRIER_FREE if rng.random() < 0.3],
+            "notes": "",
+        },
+        "modes": {
+            "selected": selected_modes,
+            "meta": {
+                mode_id: {key: MODES[mode_id][key] for key in ("label", "icon", "color", "order")}
+                for mode_id in selected_modes
+            },
+        },
+        "vaccinations": master_selection(rng, "vaccination", 0.5 if "小児科" in departments else 0.2),
+        "checkups": master_selection(rng, "checkup", 0.4 if "内科" in departments else 0.1),
+        "tests": tests,
+        "latitude": lat,
+        "longitude": lng,
+        "location": {
+            "lat": lat,
+            "lng": lng,
+            "formattedAddress": address,
+            "source": "synthetic",
+            "geocodedAt": "2025-01-01T00:00:00+09:00",
+        },
+        "source": "synthetic",
+        "updated_at": updated_at,
+        "created_at": created_at,
+        "schema_version": 2,
+    }
+    return clinic
+
+
+def generate_clinics(count: int, seed: int = 1, offset: int = 0):
+    for index in range(offset, offset + count):
+        yield make_clinic(seed, index)
+
+
+def write_ndjson(path: str, clinics) -> int:
+    progress = Progress("ndjson")
+    out = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+    try:
+        for clinic in clinics:
+            out.write(json.dumps(clinic, ensure_ascii=False))
+            out.write("\n")
+            progress.tick()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        else:
+            out.flush()
+    progress.report()
+    return progress.rows
+
+
+def load_store(path: str, clinics, batch_size: int, truncate: bool) -> int:
+    store = LocalStore(path)
+    store.migrate()
+    conn = store.connect()
+    # 生成データは作り直せるので、取り込み中は耐久性より速度を優先する
+    conn.execute("PRAGMA synchronous = OFF")
+    if truncate:
+        with conn:
+            for table in ("facility_services", "facility_tests"):
+                conn.execute(f"DELETE FROM {table} WHERE facility_id IN "
+                             "(SELECT id FROM facilities WHERE source = 'synthetic')")
+            conn.execute("DELETE FROM facilities WHERE source = 'synthetic'")
+    progress = Progress("store")
+    batch = []
+    for clinic in clinics:
+        batch.append(clinic)
+        if len(batch) >= batch_size:
+            store.upsert_clinics(batch)
+            progress.tick(len(batch))
+            batch = []
+    if batch:
+        store.upsert_clinics(batch)
+        progress.tick(len(batch))
+    conn.execute("PRAGMA synchronous = NORMAL")
+    store.close()
+    progress.report()
+    return progress.rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate deterministic synthetic clinics (NDJSON or local SQLite store)")
+    parser.add_argument("count", type=int, help="Number of clinics to generate")
+    parser.add_argument("--seed", type=int, default=1, help="Dataset seed (default: 1)")
+    parser.add_argument("--offset", type=int, default=0, help="Index of the first clinic, for slices (default: 0)")
+    parser.add_argument("--ndjson", help="Write one clinic per line to this file ('-' for stdout)")
+    parser.add_argument("--db", help="Upsert into this SQLite store (created and migrated if needed)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Clinics per insert transaction (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--truncate", action="store_true", help="Delete previously generated clinics from --db first")
+    args = parser.parse_args()
+
+    if bool(args.ndjson) == bool(args.db):
+        parser.error("choose exactly one of --ndjson / --db")
+    if args.count < 0 or args.offset < 0 or args.batch_size < 1:
+        parser.error("count and --offset must be >= 0 and --batch-size >= 1")
+
+    clinics = generate_clinics(args.count, args.seed, args.offset)
+    if args.ndjson:
+        write_ndjson(args.ndjson, clinics)
+    else:
+        load_store(args.db, clinics, args.batch_size, args.truncate)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nInterrupted", file=sys.stderr)
+        sys.exit(1)
+    except BrokenPipeError:
+        # `| head` などで読み手が先に閉じた。終了時の flush で再び失敗しないよう stdout を /dev/null に向ける
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
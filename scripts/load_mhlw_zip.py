@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""Stream MHLW facility/schedule archives into the local SQLite store.
+
+Usage:
+  python3 scripts/load_mhlw_zip.py .local/ncd.sqlite \
+      --clinic-info data/medical-open-data/02-1_clinic_facility_info_20250601.zip \
+      --clinic-schedule data/medical-open-data/02-2_clinic_speciality_hours_20250601.zip
+
+Rows are read straight out of the ZIP members (no unzip to disk) and
+decoded incrementally (UTF-8 with or without BOM, or CP932). Inserts go
+into ``facilities`` / ``facility_schedule`` in large batched
+transactions. Memory stays flat apart from the set of loaded facility
+IDs. Plain ``.csv`` files are accepted too.
+"""
+
+from __future__ import annotations
+
+import argparse
+import codecs
+import csv
+import io
+import json
+import sys
+import time
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from local_store import LocalStore  # noqa: E402
+from script_utils import Progress  # noqa: E402
+
+DEFAULT_BATCH_SIZE = 5000
+
+FACILITY_FIELD_ALIASES = {
+    "facility_id": ["ID", "医療機関コード", "medicalinstitutioncode"],
+    "official_name": ["正式名称"],
+    "official_name_kana": ["正式名称（フリガナ）", "正式名称(フリガナ)"],
+    "short_name": ["略称"],
+    "prefecture_code": ["都道府県コード"],
+    "city_code": ["市区町村コード"],
+    "address": ["所在地"],
+    "latitude": ["所在地座標（緯度）", "緯度"],
+    "longitude": ["所在地座標（経度）", "経度"],
+    "homepage_url": ["案内用ホームページアドレス", "案内用ホームページ", "ホームページアドレス"],
+}
+
+SCHEDULE_FIELD_ALIASES = {
+    "facility_id": ["ID", "医療機関コード", "medicalinstitutioncode", "facilityid"],
+    "department_code": ["診療科目コード", "診療科コード", "departmentcode"],
+    "department_name": ["診療科目名", "診療科名", "department"],
+    "slot_type": ["診療時間帯", "区分", "slot", "pattern"],
+}
+
+# scripts/importMhlwToD1.mjs と同じく 月=0 … 日=6。祝日は day_of_week に収まらないため読み飛ばす
+SCHEDULE_DAYS = (
+    ("月", "月曜", 0),
+    ("火", "火曜", 1),
+    ("水", "水曜", 2),
+    ("木", "木曜", 3),
+    ("金", "金曜", 4),
+    ("土", "土曜", 5),
+    ("日", "日曜", 6),
+)
+
+PREFECTURES = (
+    "北海道", "青森県", "岩手県", "宮城県", "秋田県", "山形県", "福島県", "茨城県",
+    "栃木県", "群馬県", "埼玉県", "千葉県", "東京都", "神奈川県", "新潟県", "富山県",
+    "石川県", "福井県", "山梨県", "長野県", "岐阜県", "静岡県", "愛知県", "三重県",
+    "滋賀県", "京都府", "大阪府", "兵庫県", "奈良県", "和歌山県", "鳥取県", "島根県",
+    "岡山県", "広島県", "山口県", "徳島県", "香川県", "愛媛県", "高知県", "福岡県",
+    "佐賀県", "長崎県", "熊本県", "大分県", "宮崎県", "鹿児島県", "沖縄県",
+)
+
+SQL_INSERT_SCHEDULE = """
+INSERT INTO facility_schedule (
+  facility_id, department_code, department_name, slot_type, day_of_week,
+  start_time, end_time, reception_start, reception_end, day_label, source
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'mhlw')
+"""
+
+SQL_INSERT_FACILITY = """
+INSERT INTO facilities (
+  id, external_id, name, short_name, kana_name, prefecture_code, prefecture,
+  city_code, city, address, postal_code, latitude, longitude, facility_type,
+  source, mhlw_sync_status, website, metadata
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, '', ?, ?, ?, 'mhlw', 'synced', ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+  name = excluded.name,
+  short_name = excluded.short_name,
+  kana_name = excluded.kana_name,
+  prefecture_code = excluded.prefecture_code,
+  prefecture = excluded.prefecture,
+  city_code = excluded.city_code,
+  city = excluded.city,
+  address = excluded.address,
+  latitude = excluded.latitude,
+  longitude = excluded.longitude,
+  facility_type = excluded.facility_type,
+  website = excluded.website,
+  metadata = excluded.metadata,
+  updated_at = excluded.updated_at
+"""
+
+
+def canonical_header(header):
+    """mhlwCsvUtils.js の canonicalizeHeaderName と同じ規則でヘッダー名を揃える。"""
+    value = (header or "").lstrip("﻿").strip().strip('"')
+    for src, dst in (("（", "("), ("）", ")"), ("＿", "_"), ('"', ""), ("'", ""), ("“", ""), ("”", "")):
+        value = value.replace(src, dst)
+    return "".join(value.split()).lower()
+
+
+def resolve_columns(headers, aliases):
+    """エイリアス表を列番号に解決する。行ごとの dict 生成を避けるためファイル単位で一度だけ行う。"""
+    positions = {canonical_header(h): i for i, h in enumerate(headers)}
+    resolved = {}
+    for field, names in aliases.items():
+        resolved[field] = next((positions[canonical_header(n)] for n in names
+                                if canonical_header(n) in positions), None)
+    return resolved
+
+
+def detect_encoding(head):
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        decoder.decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp932"
+
+
+@contextmanager
+def open_csv_stream(path, encoding="auto"):
+    """ZIP 内の最初の CSV（またはプレーン CSV）をテキストストリームとして開く。"""
+    path = Path(path)
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            members = [m for m in archive.infolist() if m.filename.lower().endswith(".csv")]
+            if not members:
+                raise SystemExit(f"{path}: no .csv member found")
+            member = members[0]
+            if encoding == "auto":
+                with archive.open(member) as probe:
+                    encoding = detect_encoding(probe.read(65536))
+            with archive.open(member) as raw:
+                yield io.TextIOWrapper(raw, encoding=encoding, newline="")
+    else:
+        if encoding == "auto":
+            with open(path, "rb") as probe:
+                encoding = detect_encoding(probe.read(65536))
+        with open(path, encoding=encoding, newline="") as stream:
+            yield stream
+
+
+def cell(row, index):
+    if index is None or index >= len(row):
+        return ""
+    return row[index].strip()
+
+
+def parse_float(value):
+    try:
+        return float(value.replace(",", "")) if value else None
+    except ValueError:
+        return None
+
+
+def normalize_time(value):
+    digits = "".join(ch for ch in value if ch.isdigit())
+    if len(digits) == 4:
+        return f"{digits[:2]}:{digits[2:]}"
+    if len(digits) == 3:
+        return f"0{digits[0]}:{digits[1:]}"
+    return value
+
+
+def derive_prefecture(prefecture_code, address):
+    if prefecture_code.isdigit() and 1 <= int(prefecture_code) <= len(PREFECTURES):
+        return PREFECTURES[int(prefecture_code) - 1]
+    return next((name for name in PREFECTURES if address.startswith(name)), "")
+
+
+def derive_city(prefecture, address):
+    rest = address[len(prefecture):] if prefecture and address.startswith(prefecture) else address
+    for i, ch in enumerate(rest):
+        if ch in "市区町村":
+            return rest[:i + 1]
+    return ""
+
+
+def load_facilities(conn, path, facility_type, loaded_ids, args):
+    progress = Progress(f"{facility_type} facilities")
+    with open_csv_stream(path, args.encoding) as stream:
+        reader = csv.reader(stream)
+        headers = next(reader, [])
+        columns = resolve_columns(headers, FACILITY_FIELD_ALIASES)
+        if columns["facility_id"] is None:
+            raise SystemExit(f"{path}: facility ID column not found")
+        batch = []
+        for row in reader:
+            facility_id = "".join(cell(row, columns["facility_id"]).split()).upper()
+            if not facility_id:
+                continue
+            name = cell(row, columns["official_name"])
+            short_name = cell(row, columns["short_name"])
+            kana = "".join(cell(row, columns["official_name_kana"]).split())
+            prefecture_code = cell(row, columns["prefecture_code"]).zfill(2) if cell(row, columns["prefecture_code"]) else ""
+            city_code = cell(row, columns["city_code"]).zfill(5) if cell(row, columns["city_code"]) else ""
+            address = cell(row, columns["address"])
+            latitude = parse_float(cell(row, columns["latitude"]))
+            longitude = parse_float(cell(row, columns["longitude"]))
+            homepage = cell(row, columns["homepage_url"])
+            prefecture = derive_prefecture(prefecture_code, address)
+            city = derive_city(prefecture, address)
+            metadata = json.dumps({
+                "id": facility_id,
+                "name": short_name or name,
+                "officialName": name,
+                "kanaName": kana,
+                "address": address,
+                "postalCode": "",
+                "prefecture": prefecture,
+                "city": city,
+                "facilityType": facility_type,
+                "mhlwFacilityId": facility_id,
+                "homepage": {"available": bool(homepage), "url": homepage},
+                "latitude": latitude,
+                "longitude": longitude,
+                "location": {"lat": latitude, "lng": longitude, "source": "mhlw"} if latitude is not None else None,
+                "source": "mhlw",
+                "schema_version": 2,
+            }, ensure_ascii=False)
+            batch.append((facility_id, facility_id, name or short_name, short_name, kana, prefecture_code,
+                          prefecture, city_code, city, address, latitude, longitude, facility_type,
+                          homepage, metadata))
+            loaded_ids.add(facility_id)
+            if len(batch) >= args.batch_size:
+                flush(conn, SQL_INSERT_FACILITY, batch)
+                progress.tick(len(batch))
+                batch = []
+            if args.limit and len(loaded_ids) >= args.limit:
+                break
+        flush(conn, SQL_INSERT_FACILITY, batch)
+        progress.tick(len(batch))
+    progress.report()
+    return progress.rows
+
+
+def load_schedules(conn, path, facility_type, loaded_ids, args):
+    progress = Progress(f"{facility_type} schedules")
+    skipped = 0
+    with open_csv_stream(path, args.encoding) as stream:
+        reader = csv.reader(stream)
+        headers = next(reader, [])
+        columns = resolve_columns(headers, SCHEDULE_FIELD_ALIASES)
+        if columns["facility_id"] is None:
+            raise SystemExit(f"{path}: facility ID column not found")
+        day_columns = []
+        for prefix, label, day_index in SCHEDULE_DAYS:
+            day_columns.append((label, day_index, resolve_columns(headers, {
+                "start": [f"{prefix}_診療開始時間"],
+                "end": [f"{prefix}_診療終了時間"],
+                "reception_start": [f"{prefix}_外来受付開始時間"],
+                "reception_end": [f"{prefix}_外来受付終了時間"],
+            })))
+        batch = []
+        for row in reader:
+            facility_id = "".join(cell(row, columns["facility_id"]).split()).upper()
+            if facility_id not in loaded_ids:
+                skipped += 1
+                continue
+            department_code = cell(row, columns["department_code"]) or None
+            department_name = cell(row, columns["department_name"]) or None
+            slot_type = cell(row, columns["slot_type"]) or None
+            for label, day_index, day in day_columns:
+                times = [normalize_time(cell(row, day[key])) for key in ("start", "end", "reception_start", "reception_end")]
+                if not any(times):
+                    continue
+                batch.append((facility_id, department_code, department_name, slot_type, day_index,
+                              times[0] or None, times[1] or None, times[2] or None, times[3] or None, label))
+            if len(batch) >= args.batch_size:
+                flush(conn, SQL_INSERT_SCHEDULE, batch)
+                progress.tick(len(batch))
+                batch = []
+        flush(conn, SQL_INSERT_SCHEDULE, batch)
+        progress.tick(len(batch))
+    progress.report()
+    if skipped:
+        print(f"[{facility_type} schedules] skipped {skipped} rows for facilities not loaded", file=sys.stderr)
+    return progress.rows
+
+
+def flush(conn, sql, batch):
+    if not batch:
+        return
+    with conn:
+        conn.executemany(sql, batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream MHLW facility/schedule ZIP archives into the local SQLite store")
+    parser.add_argument("db", help="SQLite file (created and migrated if needed)")
+    parser.add_argument("--clinic-info", help="02-1_clinic_facility_info_*.zip (or .csv)")
+    parser.add_argument("--clinic-schedule", help="02-2_clinic_speciality_hours_*.zip (or .csv)")
+    parser.add_argument("--hospital-info", help="01-1_hospital_facility_info_*.zip (or .csv)")
+    parser.add_argument("--hospital-schedule", help="01-2_hospital_speciality_hours_*.zip (or .csv)")
+    parser.add_argument("--encoding", default="auto", help="CSV encoding: auto, utf-8, utf-8-sig or cp932 (default: auto)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Rows per insert transaction (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--limit", type=int, help="Stop after this many facilities per archive (for testing)")
+    parser.add_argument("--truncate", action="store_true", help="Delete existing MHLW-sourced facilities and schedules first")
+    args = parser.parse_args()
+
+    if not any((args.clinic_info, args.hospital_info)):
+        parser.error("at least one of --clinic-info / --hospital-info is required")
+
+    store = LocalStore(args.db)
+    store.migrate()
+    conn = store.connect()
+    # 取り込み中は耐久性より速度を優先する（失敗したら再実行する前提）
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -65536")
+    started = time.perf_counter()
+
+    if args.truncate:
+        with conn:
+            conn.execute("DELETE FROM facility_schedule WHERE source = 'mhlw'")
+            conn.execute("DELETE FROM facilities WHERE source = 'mhlw'")
+
+    totals = {"facilities": 0, "schedules": 0}
+    for facility_type, info, schedule in (("clinic", args.clinic_info, args.clinic_schedule),
+                                          ("hospital", args.hospital_info, args.hospital_schedule)):
+        if not info:
+            continue
+        loaded_ids = set()
+        totals["facilities"] += load_facilities(conn, info, facility_type, loaded_ids, args)
+        if schedule:
+            with conn:
+                conn.execute(
+                    "DELETE FROM facility_schedule WHERE source = 'mhlw' AND facility_id IN "
+                    "(SELECT id FROM facilities WHERE source = 'mhlw' AND facility_type = ?)",
+                    (facility_type,),
+                )
+            totals["schedules"] += load_schedules(conn, schedule, facility_type, loaded_ids, args)
+
+    conn.execute("PRAGMA synchronous = NORMAL")
+    elapsed = time.perf_counter() - started
+    rows = totals["facilities"] + totals["schedules"]
+    print(f"loaded {totals['facilities']} facilities and {totals['schedules']} schedule rows "
+          f"in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    store.close()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nInterrupted", file=sys.stderr)
+        sys.exit(1)
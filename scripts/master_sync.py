@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""Declarative master sync: apply plan files to any master type.
+
+Usage:
+  python3 scripts/master_sync.py PLAN [PLAN ...] [--base-url https://...] [--dry-run]
+
+Each master type named in the plans is fetched once with listMaster. The
+tool compares the fetched items with the plans and posts only the fields
+that differ to updateMasterItem. Requests run on a small thread pool over
+keep-alive connections and share one rate limit. --base-url can point at
+the Workers API or at the local stand-in
+(``python3 simple_server.py`` → http://localhost:7000). The stand-in only
+carries the sample vaccination/checkup/test/symptom masters (or whatever a
+--db store holds), so entries for other types, such as department, are
+reported as missing there.
+
+Plan files:
+  JSON  {"type": "department", "entries": [{"name": "内科", "sortGroup": "内科系", "sortOrder": 100}]}
+        A bare list of entries (each with "type") or {"plans": [...]} also works.
+  CSV   header row with name, optional type/category, plus one column per field:
+        type,name,sortGroup,sortOrder
+        service,内視鏡検査,消化器,100
+Empty CSV cells are ignored, so a plan only touches the fields it sets.
+
+Write endpoints on the Workers API need a bearer token: pass --token or set AUTH_TOKEN.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+from script_utils import percentile
+
+DEFAULT_BASE_URL = "https://ncd-app.altry.workers.dev"
+USER_AGENT = "NCD-Script/master-sync/1.0"
+
+IDENTITY_FIELDS = ("type", "category", "name")
+INTEGER_FIELDS = {"sortOrder", "count"}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ApiError(RuntimeError):
+    def __init__(self, status, body=b""):
+        super().__init__(f"API returned {status}")
+        self.status = status
+        self.body = body
+
+
+class TokenBucket:
+    """rate 件/秒、最大 burst 件まで貯められるトークンバケット。"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class KeepAliveClient:
+    """スレッドごとに 1 本の HTTP/1.1 接続を張りっぱなしにして使い回すクライアント。"""
+
+    def __init__(self, base_url: str, timeout: float = 30.0, limiter: TokenBucket | None = None,
+                 retries: int = 3, backoff: float = 0.5, token: str = "", user_agent: str = USER_AGENT):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.token = token
+        self.user_agent = user_agent
+        self.local = threading.local()
+        self.latencies: list[float] = []
+        self.latency_lock = threading.Lock()
+
+    def connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            conn = cls(self.host, self.port, timeout=self.timeout)
+            self.local.conn = conn
+        return conn
+
+    def reset(self) -> None:
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+        self.local.conn = None
+
+    def request(self, method: str, path: str, payload=None):
+        body = None
+        headers = {"User-Agent": self.user_agent, "Accept": "application/json", "Connection": "keep-alive"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if payload is not None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            headers["Content-Type"] = "application/json; charset=utf-8"
+        attempt = 0
+        while True:
+            if self.limiter:
+                self.limiter.acquire()
+            started = time.perf_counter()
+            retry_after = None
+            try:
+                conn = self.connection()
+                conn.request(method, self.prefix + path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+                status = resp.status
+                retry_after = resp.getheader("Retry-After")
+                if resp.will_close:
+                    self.reset()
+            except (http.client.HTTPException, OSError) as exc:
+                self.reset()
+                status, data, error = None, b"", exc
+            else:
+                error = None
+            with self.latency_lock:
+                self.latencies.append(time.perf_counter() - started)
+            if status == 200:
+                return json.loads(data.decode("utf-8") or "{}")
+            if attempt >= self.retries or (status is not None and status not in RETRY_STATUSES):
+                if error is not None:
+                    raise error
+                raise ApiError(status, data)
+            attempt += 1
+            delay = self.backoff * (2 ** (attempt - 1)) * (1 + random.random() / 2)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            time.sleep(delay)
+
+    def close(self) -> None:
+        self.reset()
+
+
+def latency_summary(latencies: list[float]) -> str:
+    values = sorted(latencies)
+    if not values:
+        return "no requests"
+    ms = [percentile(values, pct) * 1000 for pct in (50, 90, 99)]
+    return (f"{len(values)} requests: p50={ms[0]:.0f}ms p90={ms[1]:.0f}ms "
+            f"p99={ms[2]:.0f}ms max={values[-1] * 1000:.0f}ms")
+
+
+def normalize_value(field: str, value):
+    if isinstance(value, str):
+        value = value.strip()
+        if value == "":
+            return None
+    if field in INTEGER_FIELDS and value is not None:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    return value
+
+
+def load_plan(path: str, default_type: str | None = None) -> list[dict]:
+    """JSON / CSV のプランファイルを {type, category?, name, fields} のリストに変換する。"""
+    plan_path = Path(path)
+    if plan_path.suffix.lower() == ".csv":
+        with open(plan_path, encoding="utf-8-sig", newline="") as f:
+            raw_entries = [dict(row) for row in csv.DictReader(f)]
+        raw_plans = [{"type": default_type, "entries": raw_entries}]
+    else:
+        data = json.loads(plan_path.read_text(encoding="utf-8"))
+        if isinstance(data, list):
+            raw_plans = [{"type": default_type, "entries": data}]
+        elif "plans" in data:
+            raw_plans = data["plans"]
+        else:
+            raw_plans = [data]
+
+    entries = []
+    for raw_plan in raw_plans:
+        plan_type = raw_plan.get("type") or default_type
+        for raw in raw_plan.get("entries", []):
+            master_type = (raw.get("type") or plan_type or "").strip()
+            name = (raw.get("name") or "").strip()
+            if not master_type or not name:
+                raise SystemExit(f"{path}: every entry needs a type and a name: {raw}")
+            fields = {}
+            for key, value in raw.items():
+                if key in IDENTITY_FIELDS or key is None:
+                    continue
+                if isinstance(value, str) and value.strip() == "":
+                    continue
+                fields[key] = normalize_value(key, value)
+            entries.append({
+                "type": master_type,
+                "category": (raw.get("category") or "").strip() or None,
+                "name": name,
+                "fields": fields,
+                "source": f"{plan_path.name}",
+            })
+    return entries
+
+
+def fetch_master(client: KeepAliveClient, master_type: str) -> list[dict]:
+    data = client.request("GET", f"/api/listMaster?type={quote(master_type)}&includeSimilar=false")
+    return data.get("items", [])
+
+
+def fetch_masters(client: KeepAliveClient, types, concurrency: int) -> dict[str, list[dict]]:
+    """種別ごとに listMaster を 1 回だけ呼ぶ（種別間は並列）。"""
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {pool.submit(fetch_master, client, master_type): master_type for master_type in types}
+        return {futures[future]: future.result() for future in as_completed(futures)}
+
+
+def compute_changes(entries: list[dict], masters: dict[str, list[dict]], include_unchanged: bool = False):
+    """プランとマスターの差分を (entry, current, changed_fields) のリストと未登録項目に分けて返す。"""
+    lookup = {}
+    for master_type, items in masters.items():
+        for item in items:
+            # listMaster が別種別の項目を返すことがある（stand-in は未知の種別に test を返す）ので、項目自身の type で照合する
+            if (item.get("type") or master_type) != master_type:
+                continue
+            name = item.get("name")
+            lookup.setdefault((master_type, item.get("category"), name), item)
+            lookup.setdefault((master_type, None, name), item)
+    changes = []
+    missing = []
+    for entry in entries:
+        current = lookup.get((entry["type"], entry["category"], entry["name"]))
+        if current is None:
+            missing.append(entry)
+            continue
+        changed = {
+            field: value for field, value in entry["fields"].items()
+            if include_unchanged or normalize_value(field, current.get(field)) != value
+        }
+        if changed:
+            changes.append((entry, current, changed))
+    return changes, missing
+
+
+def update_payload(entry: dict, current: dict, changed: dict) -> dict:
+    payload = {"type": entry["type"], "category": current.get("category"), "name": entry["name"]}
+    if current.get("id"):
+        payload["id"] = current["id"]
+    payload.update(changed)
+    return payload
+
+
+def describe(entry: dict, current: dict, changed: dict) -> str:
+    parts = [f"{field}={current.get(field)!r}->{value!r}" for field, value in changed.items()]
+    return f"{entry['type']}:{entry['name']} " + ", ".join(parts)
+
+
+def apply_changes(client: KeepAliveClient, changes, concurrency: int, batch_endpoint: str | None = None):
+    """差分を適用し、失敗した (entry, 例外) のリストを返す。"""
+    if batch_endpoint:
+        by_type: dict[str, list[dict]] = {}
+        for entry, current, changed in changes:
+            by_type.setdefault(entry["type"], []).append(update_payload(entry, current, changed))
+        failures = []
+        for master_type, items in by_type.items():
+            try:
+                client.request("POST", batch_endpoint, {"type": master_type, "items": items})
+                print(f"updated {len(items)} {master_type} entries via {batch_endpoint}")
+            except Exception as exc:  # noqa: BLE001 - 失敗は集計して最後に報告する
+                failures.extend(({"type": master_type, "name": item["name"]}, exc) for item in items)
+                print(f"failed  {master_type} batch: {exc}", file=sys.stderr)
+        return failures
+
+    failures = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = {
+            pool.submit(client.request, "POST", "/api/updateMasterItem", update_payload(entry, current, changed)):
+                (entry, current, changed)
+            for entry, current, changed in changes
+        }
+        for future in as_completed(futures):
+            entry, current, changed = futures[future]
+            try:
+                future.result()
+            except Exception as exc:  # noqa: BLE001 - 失敗は集計して最後に報告する
+                failures.append((entry, exc))
+                print(f"failed  {entry['type']}:{entry['name']}: {exc}", file=sys.stderr)
+            else:
+                print(f"updated {describe(entry, current, changed)}")
+    return failures
+
+
+def build_parser(description: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL, help="Workers (or local stand-in) base URL")
+    parser.add_argument("--token", default=os.environ.get("AUTH_TOKEN", ""),
+                        help="Bearer token for write endpoints (default: $AUTH_TOKEN)")
+    parser.add_argument("--dry-run", action="store_true", help="Only show the changeset without updating")
+    parser.add_argument("--concurrency", type=int, default=4, help="Parallel request workers (default: 4)")
+    parser.add_argument("--rate", type=float, default=5.0, help="Max requests per second across all workers (default: 5)")
+    parser.add_argument("--retries", type=int, default=3, help="Retries on 429/5xx or connection errors (default: 3)")
+    parser.add_argument("--all", action="store_true",
+                        help="Post every planned field even when the master already matches")
+    parser.add_argument("--skip-missing", action="store_true",
+                        help="Ignore plan entries that are not in the master instead of aborting")
+    parser.add_argument("--batch-endpoint",
+                        help="Send each type's changes in one POST {type, items: [...]} to this path")
+    return parser
+
+
+def run(entries: list[dict], args, user_agent: str = USER_AGENT) -> int:
+    limiter = TokenBucket(args.rate, burst=max(1, args.concurrency))
+    client = KeepAliveClient(args.base_url.rstrip("/"), limiter=limiter, retries=args.retries,
+                             token=args.token, user_agent=user_agent)
+
+    types = sorted({entry["type"] for entry in entries})
+    masters = fetch_masters(client, types, args.concurrency)
+    changes, missing = compute_changes(entries, masters, include_unchanged=args.all)
+    if missing:
+        names = [f"{entry['type']}:{entry['name']}" for entry in missing]
+        print("以下の項目がマスターにありません:", names, file=sys.stderr)
+        if not args.skip_missing:
+            return 1
+
+    print(f"{len(changes)} of {len(entries)} planned entries differ from the master "
+          f"({len(types)} master type(s) fetched)", file=sys.stderr)
+    if args.dry_run:
+        for entry, current, changed in changes:
+            print(f"[dry-run] {describe(entry, current, changed)}")
+        return 0
+    failures = apply_changes(client, changes, args.concurrency, args.batch_endpoint) if changes else []
+    print(latency_summary(client.latencies), file=sys.stderr)
+    if failures:
+        print(f"{len(failures)} update(s) failed", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main():
+    parser = build_parser("Apply declarative master plans (JSON/CSV) with a minimal changeset")
+    parser.add_argument("plans", nargs="+", help="Plan files (.json or .csv)")
+    parser.add_argument("--type", help="Default master type for entries/files that omit it")
+    args = parser.parse_args()
+
+    entries = []
+    for path in args.plans:
+        entries.extend(load_plan(path, args.type))
+    sys.exit(run(entries, args))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nInterrupted", file=sys.stderr)
+        sys.exit(1)
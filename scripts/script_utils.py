@@ -0,0 +1,39 @@
+"""scripts/ 配下の Python ツールで共有する小さな補助関数。"""
+
+from __future__ import annotations
+
+import math
+import sys
+import time
+
+PROGRESS_EVERY = 50000
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """昇順に並んだ値から最近傍順位法で pct パーセンタイルを返す（空なら 0）。"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Progress:
+    """取り込んだ行数を every 行ごとに stderr へ報告する。"""
+
+    def __init__(self, label, every=PROGRESS_EVERY):
+        self.label = label
+        self.every = every
+        self.started = time.perf_counter()
+        self.rows = 0
+
+    def tick(self, count=1):
+        before = self.rows
+        self.rows += count
+        if self.rows // self.every != before // self.every:
+            self.report(final=False)
+
+    def report(self, final=True):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        prefix = "done" if final else "..."
+        print(f"[{self.label}] {prefix} {self.rows} rows in {elapsed:.1f}s ({self.rows / elapsed:,.0f} rows/s)",
+              file=sys.stderr)
@@ -2,22 +2,22 @@
 """Apply sort group/order to department master entries.
 
 Usage:
-  python3 scripts/set_department_sort.py [--base-url https://...]
+  python3 scripts/set_department_sort.py [--base-url https://...] [--concurrency 4] [--rate 5]
 
 Requires Internet access to the Cloudflare Workers API. By default uses
 https://ncd-app.altry.workers.dev.  Adjust by passing --base-url.
+
+This is SORT_PLAN expressed as a master_sync plan. Only entries whose
+sortGroup/sortOrder differ from the master are posted; see
+scripts/master_sync.py for the other master types and plan files.
 """
 
 from __future__ import annotations
 
-import argparse
-import json
 import sys
-import time
-import urllib.error
-import urllib.request
 
-DEFAULT_BASE_URL = "https://ncd-app.altry.workers.dev"
+from master_sync import build_parser, run
+
 USER_AGENT = "NCD-Script/department-sort/1.0"
 
 SORT_PLAN = {
@@ -74,60 +74,30 @@ SORT_PLAN = {
 }
 
 
-def fetch_master(base_url: str) -> dict[str, dict]:
-    url = f"{base_url}/api/listMaster?type=department&includeSimilar=false"
-    with urllib.request.urlopen(url) as resp:
-        data = json.load(resp)
-    items = data.get("items", [])
-    return {it["name"]: it for it in items}
-
-
-def update_entry(base_url: str, name: str, category: str, group: str, order: int) -> None:
-    payload = json.dumps(
+def plan_entries() -> list[dict]:
+    return [
         {
             "type": "department",
-            "category": category,
+            "category": None,
             "name": name,
-            "sortGroup": group,
-            "sortOrder": order,
-        },
-        ensure_ascii=False,
-    ).encode("utf-8")
-    req = urllib.request.Request(
-        f"{base_url}/api/updateMasterItem",
-        data=payload,
-        method="POST",
-        headers={
-            "Content-Type": "application/json; charset=utf-8",
-            "User-Agent": USER_AGENT,
-        },
-    )
-    with urllib.request.urlopen(req) as resp:
-        if resp.status != 200:
-            raise RuntimeError(f"API returned {resp.status}")
+            "fields": {"sortGroup": group, "sortOrder": order},
+            "source": "SORT_PLAN",
+        }
+        for name, (order, group) in SORT_PLAN.items()
+    ]
 
 
 def main():
-    parser = argparse.ArgumentParser(description="Set sortGroup/sortOrder for department master entries")
-    parser.add_argument("--base-url", default=DEFAULT_BASE_URL, help="Workers base URL")
-    parser.add_argument("--dry-run", action="store_true", help="Only show actions without updating")
-    parser.add_argument("--sleep", type=float, default=0.2, help="Delay between API calls (seconds)")
+    parser = build_parser("Set sortGroup/sortOrder for department master entries")
+    parser.add_argument("--sleep", type=float, default=0.2,
+                        help="Legacy spacing between API calls in seconds; used as --rate=1/sleep "
+                             "when --rate is omitted (default: 0.2)")
+    # --rate を明示したときだけ --sleep より優先する
+    parser.set_defaults(rate=None)
     args = parser.parse_args()
-
-    master = fetch_master(args.base_url)
-    missing = [name for name in SORT_PLAN if name not in master]
-    if missing:
-        print("以下の診療科がマスターにありません:", missing, file=sys.stderr)
-        sys.exit(1)
-
-    for idx, (name, (order, group)) in enumerate(SORT_PLAN.items(), 1):
-        category = master[name]["category"]
-        if args.dry_run:
-            print(f"[dry-run] {idx:02d}: {name} -> group={group}, order={order}")
-        else:
-            update_entry(args.base_url, name, category, group, order)
-            print(f"updated {idx:02d}: {name}")
-            time.sleep(args.sleep)
+    if args.rate is None:
+        args.rate = 1 / args.sleep if args.sleep > 0 else 0
+    sys.exit(run(plan_entries(), args, user_agent=USER_AGENT))
 
 
 if __name__ == "__main__":
@@ -1,12 +1,46 @@
 #!/usr/bin/env python3
+import argparse
+import asyncio
+import base64
+import binascii
+import cProfile
+import gzip
+import hashlib
+import heapq
+import hmac
+import itertools
 import http.server
 import socketserver
+import io
 import json
+import marshal
+import math
+import mimetypes
 import os
+import posixpath
+import pstats
+import signal
+import socket
 import sys
+import threading
 import time
+import unicodedata
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
-from urllib.parse import urlparse, parse_qs
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import urlparse, parse_qs, unquote
+
+from local_store import LocalStore
+
+try:
+    import brotli  # 任意依存。無ければ gzip のみで応答する
+except ImportError:
+    brotli = None
 
 DEFAULT_TODOS = [
     {
@@ -26,6 +60,8 @@ DEFAULT_TODOS = [
 ]
 
 current_todos = deepcopy(DEFAULT_TODOS)
+# スレッドモードでは複数リクエストが同時に current_todos を読み書きするため保護する
+todos_lock = threading.Lock()
 
 SAMPLE_MODES = [
     {
@@ -46,6 +82,91 @@ SAMPLE_MODES = [
     },
 ]
 
+SAMPLE_CATEGORIES = {
+    "vaccinationType": ["小児定期接種", "任意接種"],
+    "checkupType": ["特定健診", "企業健診", "自治体健診"],
+    "service": ["内科", "外科"],
+    "test": ["血液検査", "画像検査"],
+}
+DEFAULT_CATEGORIES = ["分類A", "分類B", "分類C"]
+
+SAMPLE_MASTER_ITEMS = {
+    "vaccination": [
+        {
+            "_key": "master:vaccination:小児定期接種|麻しん風しん混合",
+            "type": "vaccination",
+            "category": "小児定期接種",
+            "name": "麻しん風しん混合 (MR)",
+            "desc": "1歳・年長時に定期接種",
+            "status": "approved"
+        },
+        {
+            "_key": "master:vaccination:任意接種|おたふくかぜ",
+            "type": "vaccination",
+            "category": "任意接種",
+            "name": "おたふくかぜワクチン",
+            "desc": "任意接種 / 1歳以降",
+            "status": "candidate"
+        }
+    ],
+    "checkup": [
+        {
+            "_key": "master:checkup:特定健診|特定健康診査",
+            "type": "checkup",
+            "category": "特定健診",
+            "name": "特定健康診査",
+            "desc": "40〜74歳対象の生活習慣病予防健診",
+            "status": "approved"
+        },
+        {
+            "_key": "master:checkup:企業健診|雇入時健診",
+            "type": "checkup",
+            "category": "企業健診",
+            "name": "雇入時健康診断",
+            "desc": "労働安全衛生規則に基づく健診",
+            "status": "approved"
+        }
+    ],
+    "test": [
+        {
+            "_key": "master:test:内科一般検査|血液検査",
+            "type": "test",
+            "category": "内科一般検査",
+            "name": "血液検査",
+            "status": "approved",
+            "count": 5
+        }
+    ],
+    "symptom": [
+        {
+            "_key": "master:symptom:全身症状|発熱",
+            "type": "symptom",
+            "category": "全身症状",
+            "name": "発熱",
+            "patientLabel": "熱がある",
+            "status": "approved",
+            "synonyms": ["熱", "高熱"],
+            "defaultTests": ["master:test:内科一般検査|血液検査"],
+        }
+    ],
+}
+
+# /api/thesaurus のサンプル（normalized → entry）。stand-in ではメモリ上にだけ保持する
+SAMPLE_THESAURUS = {
+    "mrワクチン": {
+        "normalized": "mrワクチン",
+        "term": "MRワクチン",
+        "variants": ["麻しん風しん混合 (MR)", "麻疹風疹混合ワクチン"],
+        "context": ["vaccination"],
+    },
+    "特定健診": {
+        "normalized": "特定健診",
+        "term": "特定健診",
+        "variants": ["特定健康診査", "メタボ健診"],
+        "context": ["checkup"],
+    },
+}
+
 SAMPLE_CLINICS = {
     "test-clinic-1": {
         "id": "test-clinic-1",
@@ -125,6 +246,9 @@ SAMPLE_CLINICS = {
                 }
             },
         },
+        "tests": [
+            {"masterKey": "master:test:内科一般検査|血液検査", "category": "内科一般検査", "name": "血液検査"},
+        ],
         "checkups": {
             "selected": ["master:checkup:特定健診|特定健康診査"],
             "meta": {
@@ -227,16 +351,940 @@ SAMPLE_CLINICS = {
 }
 
 
+class FrozenDict(dict):
+    """変更不可の dict。json.dumps はそのまま扱えるので、読み取り時にコピーせず返せる。"""
+
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("clinic snapshots are read-only; use update_clinic() to change them")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+INTERN_MAX_LENGTH = 64
+
+
+def freeze(value):
+    # キーと短い文字列（曜日・「休診」・アイコン名など）は intern して施設間で共有する
+    if isinstance(value, dict):
+        return FrozenDict((sys.intern(key) if isinstance(key, str) else key, freeze(item))
+                          for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, str) and len(value) <= INTERN_MAX_LENGTH:
+        return sys.intern(value)
+    return value
+
+
+def thaw(value):
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+
+# 診療所レコードはイミュータブルなスナップショットとして保持し、更新時のみ丸ごと差し替える
+SAMPLE_CLINICS = {clinic_id: freeze(clinic) for clinic_id, clinic in SAMPLE_CLINICS.items()}
+clinics_lock = threading.Lock()
+
+# 条件付き GET 用の検証子の元。プロセスごとの BOOT_ID を混ぜ、再起動をまたいで ETag が衝突しないようにする
+BOOT_ID = format(time.time_ns(), 'x')
+STARTED_AT = int(time.time())
+clinic_revisions = {}
+clinics_revision = 0
+clinics_last_modified = max((c.get("updated_at") or 0 for c in SAMPLE_CLINICS.values()), default=STARTED_AT)
+
+
+def fold_kana(text):
+    """カタカナをひらがなに寄せる（ァ-ヶ → ぁ-ゖ）。"""
+    return ''.join(chr(ord(ch) - 0x60) if 'ァ' <= ch <= 'ヶ' else ch for ch in text)
+
+
+def normalize_text(text):
+    """NFKC 正規化・小文字化・かな統一・空白除去した検索用キーを返す。"""
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', str(text)).lower()
+    return ''.join(fold_kana(text).split())
+
+
+def normalize_postal_code(value):
+    if not value:
+        return ''
+    return unicodedata.normalize('NFKC', str(value)).replace('-', '').replace('〒', '').strip()
+
+
+def order_key(clinic):
+    """一覧の並び順（updated_at 降順、同時刻は id 昇順）のキー。ページングのカーソルにも使う。"""
+    updated_at = clinic.get('updated_at')
+    try:
+        updated_at = int(updated_at or 0)
+    except (TypeError, ValueError):
+        updated_at = 0
+    return -updated_at, str(clinic.get('id'))
+
+
+class ClinicIndex:
+    """SAMPLE_CLINICS に追随するハッシュインデックス。
+
+    各ポスティングは {clinic_id: None} の dict（挿入順を保つ集合）。単発の更新では
+    ポスティングを作り直して差し替えるため、読み手はロックなしで参照できる。
+    order は order_key のソート済みリストで、こちらも更新時はコピーして差し替える。
+    """
+
+    FIELDS = ('name', 'normalized_name', 'postal_code', 'department', 'mode')
+
+    def __init__(self):
+        self.ids = {}
+        self.postings = {field: {} for field in self.FIELDS}
+        self.order = []
+        self.order_keys = {}
+
+    @staticmethod
+    def keys_for(clinic):
+        departments = (clinic.get('departments') or {}).get('master') or ()
+        modes = (clinic.get('modes') or {}).get('selected') or ()
+        return {
+            'name': {clinic.get('name')} if clinic.get('name') else set(),
+            'normalized_name': {normalize_text(clinic.get('name'))} - {''},
+            'postal_code': {normalize_postal_code(clinic.get('postalCode'))} - {''},
+            'department': set(departments),
+            'mode': set(modes),
+        }
+
+    def rebuild(self, clinics):
+        ids = {}
+        order_keys = {}
+        postings = {field: {} for field in self.FIELDS}
+        for clinic in clinics:
+            clinic_id = clinic.get('id')
+            ids[clinic_id] = None
+            for field, keys in self.keys_for(clinic).items():
+                for key in keys:
+                    postings[field].setdefault(key, {})[clinic_id] = None
+            order_keys[clinic_id] = order_key(clinic)
+        self.ids, self.postings = ids, postings
+        self.order, self.order_keys = sorted(order_keys.values()), order_keys
+
+    def add(self, clinic):
+        clinic_id = clinic.get('id')
+        self.ids = {**self.ids, clinic_id: None}
+        for field, keys in self.keys_for(clinic).items():
+            table = self.postings[field]
+            for key in keys:
+                table[key] = {**table.get(key, {}), clinic_id: None}
+        self.reorder(clinic_id, order_key(clinic))
+
+    def remove(self, clinic):
+        clinic_id = clinic.get('id')
+        self.ids = {cid: None for cid in self.ids if cid != clinic_id}
+        for field, keys in self.keys_for(clinic).items():
+            table = self.postings[field]
+            for key in keys:
+                remaining = {cid: None for cid in table.get(key, ()) if cid != clinic_id}
+                if remaining:
+                    table[key] = remaining
+                else:
+                    table.pop(key, None)
+        self.reorder(clinic_id, None)
+
+    def replace(self, old, new):
+        """更新前後で変化したキーのポスティングだけを差し替える。"""
+        clinic_id = new.get('id')
+        old_keys = self.keys_for(old) if old else {field: set() for field in self.FIELDS}
+        for field, new_keys in self.keys_for(new).items():
+            table = self.postings[field]
+            for key in old_keys[field] - new_keys:
+                remaining = {cid: None for cid in table.get(key, ()) if cid != clinic_id}
+                if remaining:
+                    table[key] = remaining
+                else:
+                    table.pop(key, None)
+            for key in new_keys - old_keys[field]:
+                table[key] = {**table.get(key, {}), clinic_id: None}
+        if clinic_id not in self.ids:
+            self.ids = {**self.ids, clinic_id: None}
+        self.reorder(clinic_id, order_key(new))
+
+    def reorder(self, clinic_id, key):
+        """clinic_id の並び位置を key に移す（None なら外す）。全体を並べ直さず二分探索で差し込む。"""
+        current = self.order_keys.get(clinic_id)
+        if current == key:
+            return
+        order = list(self.order)
+        order_keys = dict(self.order_keys)
+        if current is not None:
+            position = bisect_right(order, current) - 1
+            if 0 <= position < len(order) and order[position] == current:
+                del order[position]
+            del order_keys[clinic_id]
+        if key is not None:
+            insort(order, key)
+            order_keys[clinic_id] = key
+        self.order, self.order_keys = order, order_keys
+
+    def page(self, after=None, limit=None, ids=None):
+        """order 順で after より後ろのキーを最大 limit 件返す。ids を渡すとその集合だけを並べる。"""
+        if ids is None:
+            order = self.order
+        else:
+            order_keys = self.order_keys
+            order = sorted(order_keys[cid] for cid in ids if cid in order_keys)
+        start = bisect_right(order, after) if after is not None else 0
+        return order[start:start + limit] if limit is not None else order[start:]
+
+    def get(self, field, key):
+        return self.postings[field].get(key, {})
+
+    def first(self, field, key):
+        return next(iter(self.get(field, key)), None)
+
+    def lookup(self, name=None, postal_code=None, departments=(), modes=()):
+        """条件すべてに一致する clinic_id を、最小ポスティングの順序で返す。"""
+        postings = []
+        if name:
+            postings.append(self.get('normalized_name', normalize_text(name)))
+        if postal_code:
+            postings.append(self.get('postal_code', normalize_postal_code(postal_code)))
+        postings.extend(self.get('department', department) for department in departments)
+        postings.extend(self.get('mode', mode) for mode in modes)
+        if not postings:
+            return list(self.ids)
+        postings.sort(key=len)
+        smallest, rest = postings[0], postings[1:]
+        return [cid for cid in smallest if all(cid in other for other in rest)]
+
+
+clinic_index = ClinicIndex()
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def clinic_coordinates(clinic):
+    """latitude/longitude（無ければ location.lat/lng）を (lat, lng) で返す。不正値は None。"""
+    location = clinic.get('location') or {}
+    lat = clinic.get('latitude', location.get('lat'))
+    lng = clinic.get('longitude', location.get('lng'))
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or (lat == 0 and lng == 0):
+        return None
+    return lat, lng
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoIndex:
+    """緯度経度の等間隔グリッド（既定 0.01 度 ≒ 1.1km 四方）に clinic_id を振り分ける空間索引。
+
+    セルは {clinic_id: (lat, lng)} で、ClinicIndex と同じく更新時はセルごと差し替える。
+    """
+
+    def __init__(self, cell_degrees=0.01):
+        self.cell_degrees = cell_degrees
+        self.cells = {}
+        self.points = {}
+
+    def cell_of(self, lat, lng):
+        return math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees)
+
+    def rebuild(self, clinics):
+        cells = {}
+        points = {}
+        for clinic in clinics:
+            coordinates = clinic_coordinates(clinic)
+            if coordinates is None:
+                continue
+            clinic_id = clinic.get('id')
+            points[clinic_id] = coordinates
+            cells.setdefault(self.cell_of(*coordinates), {})[clinic_id] = coordinates
+        self.cells, self.points = cells, points
+
+    def replace(self, old, new):
+        clinic_id = (new or old).get('id')
+        before = self.points.get(clinic_id)
+        after = clinic_coordinates(new) if new else None
+        if before == after:
+            return
+        if before is not None:
+            cell = self.cell_of(*before)
+            remaining = {cid: point for cid, point in self.cells.get(cell, {}).items() if cid != clinic_id}
+            if remaining:
+                self.cells[cell] = remaining
+            else:
+                self.cells.pop(cell, None)
+        if after is not None:
+            cell = self.cell_of(*after)
+            self.cells[cell] = {**self.cells.get(cell, {}), clinic_id: after}
+            self.points = {**self.points, clinic_id: after}
+        else:
+            self.points = {cid: point for cid, point in self.points.items() if cid != clinic_id}
+
+    def near(self, lat, lng, radius_m, limit):
+        """半径 radius_m 以内を距離の近い順に最大 limit 件、(distance_m, clinic_id) で返す。"""
+        dlat = radius_m / METERS_PER_DEGREE
+        dlng = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        (y0, x0), (y1, x1) = self.cell_of(lat - dlat, lng - dlng), self.cell_of(lat + dlat, lng + dlng)
+        cells = self.cells
+        if (y1 - y0 + 1) * (x1 - x0 + 1) > len(cells):
+            # 範囲内のセル数より実在セルの方が少なければ、実在セルだけを見る
+            # replace が同時にセルを足し引きするので、ScheduleIndex.open_at と同じく先にスナップショットを取る
+            buckets = [bucket for (y, x), bucket in list(cells.items()) if y0 <= y <= y1 and x0 <= x <= x1]
+        else:
+            buckets = [bucket for bucket in (cells.get(key) for key in
+                                             itertools.product(range(y0, y1 + 1), range(x0, x1 + 1)))
+                       if bucket is not None]
+        candidates = []
+        for bucket in buckets:
+            for clinic_id, (plat, plng) in bucket.items():
+                distance = haversine_m(lat, lng, plat, plng)
+                if distance <= radius_m:
+                    candidates.append((distance, clinic_id))
+        return heapq.nsmallest(limit, candidates)
+
+
+geo_index = GeoIndex()
+
+# schedule.days のキー（0=月曜 … 6=日曜、7=祝日）と午前/午後ラベル → schedule.patterns のキー
+SCHEDULE_DAYS = ("月曜", "火曜", "水曜", "木曜", "金曜", "土曜", "日曜", "祝日")
+HOLIDAY = 7
+SCHEDULE_LABELS = {"午前A": "amA", "午前B": "amB", "午後A": "pmA", "午後B": "pmB"}
+SLOT_MINUTES = 5
+JST = timezone(timedelta(hours=9))
+
+
+def parse_hhmm(value):
+    """'09:00' → 540（分）。不正値は None。"""
+    hours, sep, minutes = str(value or '').strip().partition(':')
+    try:
+        hours, minutes = int(hours), int(minutes)
+    except ValueError:
+        return None
+    if not sep or not (0 <= hours <= 24 and 0 <= minutes < 60):
+        return None
+    return min(hours * 60 + minutes, 24 * 60)
+
+
+def compile_schedule(clinic):
+    """schedule を 5 分枠のビットマスク 8 個（月曜…日曜、祝日）に変換する。行の無い曜日は None。"""
+    schedule = clinic.get('schedule') or {}
+    patterns = schedule.get('patterns') or {}
+    days = schedule.get('days') or {}
+    if not days:
+        return None
+    pattern_masks = {}
+    for key, bounds in patterns.items():
+        if not isinstance(bounds, (list, tuple)) or len(bounds) != 2:
+            continue
+        start, end = parse_hhmm(bounds[0]), parse_hhmm(bounds[1])
+        if start is None or end is None or end <= start:
+            continue
+        first, last = start // SLOT_MINUTES, -(-end // SLOT_MINUTES)
+        pattern_masks[key] = ((1 << (last - first)) - 1) << first
+    masks = []
+    for day in SCHEDULE_DAYS:
+        entry = days.get(day)
+        if not isinstance(entry, dict):
+            masks.append(None)
+            continue
+        mask = 0
+        for label in (entry.get('am'), entry.get('pm')):
+            mask |= pattern_masks.get(SCHEDULE_LABELS.get(label, label), 0)
+        masks.append(mask)
+    return tuple(masks)
+
+
+class ScheduleIndex:
+    """診療時間の索引。曜日ごとに {ビットマスク: {clinic_id: None}} でまとめるので、
+    同じ診療時間の施設が多いほど問い合わせで見るマスクの種類は少なくなる。
+    """
+
+    def __init__(self):
+        self.masks = {}
+        self.groups = [{} for _ in SCHEDULE_DAYS]
+
+    def rebuild(self, clinics):
+        masks = {}
+        groups = [{} for _ in SCHEDULE_DAYS]
+        for clinic in clinics:
+            compiled = compile_schedule(clinic)
+            if compiled is None:
+                continue
+            clinic_id = clinic.get('id')
+            masks[clinic_id] = compiled
+            for day, mask in enumerate(compiled):
+                if mask:
+                    groups[day].setdefault(mask, {})[clinic_id] = None
+        self.masks, self.groups = masks, groups
+
+    def replace(self, old, new):
+        clinic_id = (new or old).get('id')
+        before = self.masks.get(clinic_id)
+        after = compile_schedule(new) if new else None
+        if before == after:
+            return
+        for day, group in enumerate(self.groups):
+            old_mask = before[day] if before else None
+            new_mask = after[day] if after else None
+            if old_mask == new_mask:
+                continue
+            if old_mask:
+                remaining = {cid: None for cid in group.get(old_mask, ()) if cid != clinic_id}
+                if remaining:
+                    group[old_mask] = remaining
+                else:
+                    group.pop(old_mask, None)
+            if new_mask:
+                group[new_mask] = {**group.get(new_mask, {}), clinic_id: None}
+        if after is None:
+            self.masks = {cid: masks for cid, masks in self.masks.items() if cid != clinic_id}
+        else:
+            self.masks = {**self.masks, clinic_id: after}
+
+    def open_at(self, day, minute, weekday=None):
+        """day（0-7）の minute 分に開いている clinic_id → 閉まる時刻（分）を返す。
+
+        day が祝日（7）で weekday を渡した場合、祝日の行が無い施設はその曜日の診療時間で判定する。
+        """
+        slot = minute // SLOT_MINUTES
+        bit = 1 << slot
+        result = {}
+        for mask, ids in list(self.groups[day].items()):
+            if mask & bit:
+                closes = closing_minute(mask, slot)
+                for clinic_id in ids:
+                    result[clinic_id] = closes
+        if day == HOLIDAY and weekday is not None:
+            for mask, ids in list(self.groups[weekday].items()):
+                if mask & bit:
+                    closes = closing_minute(mask, slot)
+                    masks = self.masks
+                    for clinic_id in ids:
+                        compiled = masks.get(clinic_id)
+                        if compiled is not None and compiled[HOLIDAY] is None:
+                            result[clinic_id] = closes
+        return result
+
+
+def closing_minute(mask, slot):
+    """slot から連続して開いている枠の終わり（分）。"""
+    run = (~(mask >> slot)) & ((mask >> slot) + 1)  # 最初の 0 ビット
+    return (slot + run.bit_length() - 1) * SLOT_MINUTES
+
+
+schedule_index = ScheduleIndex()
+
+
+def sanitize_key_segment(value):
+    """functions/index.js の sanitizeKeySegment と同じ正規化（NFKC・小文字・空白除去）。"""
+    if not value:
+        return ''
+    return ''.join(unicodedata.normalize('NFKC', str(value)).strip().lower().split())
+
+
+def comparable_master_key(master_type, category, name):
+    master_type, category, name = (sanitize_key_segment(v) for v in (master_type, category, name))
+    if not master_type or not category or not name:
+        return None
+    return f"{master_type}:{category}|{name}"
+
+
+def parse_master_key(key):
+    """'master:type:category|name' を (type, category, name, comparable) にする。形式外は None。"""
+    raw = str(key or '').strip().removeprefix('master:')
+    master_type, sep, rest = raw.partition(':')
+    category, bar, name = rest.partition('|')
+    if not sep or not bar:
+        return None
+    comparable = comparable_master_key(master_type, category, name)
+    return (master_type, category, name, comparable) if comparable else None
+
+
+def department_key(name):
+    name = sanitize_key_segment(name)
+    return f"department:{name}" if name else None
+
+
+# 施設側でマスターを参照しているコレクション → 既定のマスター種別
+CLINIC_MASTER_REFERENCES = (('services', 'service'), ('tests', 'test'))
+CLINIC_MASTER_SELECTIONS = (('vaccinations', 'vaccination'), ('checkups', 'checkup'))
+
+
+def entry_master_keys(entry, fallback_type):
+    """services/tests の 1 件から比較用キーを集める（extractComparableKeys 相当）。"""
+    if not isinstance(entry, dict):
+        return set()
+    candidates = [entry[prop] for prop in ('masterKey', 'masterkey', 'master_key') if entry.get(prop)]
+    master_type = entry.get('type') or fallback_type
+    if entry.get('category') and entry.get('name'):
+        candidates.append(f"master:{master_type}:{entry['category']}|{entry['name']}")
+    keys = set()
+    for candidate in candidates:
+        parsed = parse_master_key(candidate)
+        if parsed and parsed[0] == fallback_type:
+            keys.add(parsed[3])
+    return keys
+
+
+def clinic_master_refs(clinic):
+    """施設が参照するマスターの比較用キー → 参照元（'services' など）。"""
+    refs = {}
+    for field, master_type in CLINIC_MASTER_REFERENCES:
+        for entry in clinic.get(field) or ():
+            for key in entry_master_keys(entry, master_type):
+                refs.setdefault(key, field)
+    for field, master_type in CLINIC_MASTER_SELECTIONS:
+        for raw in (clinic.get(field) or {}).get('selected') or ():
+            parsed = parse_master_key(raw)
+            if parsed and parsed[0] == master_type:
+                refs.setdefault(parsed[3], field)
+    for name in (clinic.get('departments') or {}).get('master') or ():
+        key = department_key(name)
+        if key:
+            refs.setdefault(key, 'departments')
+    return refs
+
+
+class MasterRefIndex:
+    """マスターの比較用キー → {clinic_id: 参照元} の転置索引。ClinicIndex と同じく差し替えで更新する。"""
+
+    def __init__(self):
+        self.refs = {}
+        self.postings = {}
+
+    def rebuild(self, clinics):
+        refs = {}
+        postings = {}
+        for clinic in clinics:
+            clinic_id = clinic.get('id')
+            clinic_refs = clinic_master_refs(clinic)
+            if clinic_refs:
+                refs[clinic_id] = clinic_refs
+            for key, field in clinic_refs.items():
+                postings.setdefault(key, {})[clinic_id] = field
+        self.refs, self.postings = refs, postings
+
+    def replace(self, old, new):
+        clinic_id = (new or old).get('id')
+        before = self.refs.get(clinic_id, {})
+        after = clinic_master_refs(new) if new else {}
+        if before == after:
+            return
+        for key in before.keys() - after.keys():
+            remaining = {cid: field for cid, field in self.postings.get(key, {}).items() if cid != clinic_id}
+            if remaining:
+                self.postings[key] = remaining
+            else:
+                self.postings.pop(key, None)
+        for key, field in after.items():
+            if before.get(key) != field:
+                self.postings[key] = {**self.postings.get(key, {}), clinic_id: field}
+        if after:
+            self.refs = {**self.refs, clinic_id: after}
+        else:
+            self.refs = {cid: value for cid, value in self.refs.items() if cid != clinic_id}
+
+    def clinics_for(self, key):
+        return self.postings.get(key, {})
+
+
+master_ref_index = MasterRefIndex()
+
+
+def bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class NgramIndex:
+    """normalize_text したフィールドごとの文字 bi-gram 転置索引。
+
+    fields は (名前, 重み, 値を取り出す関数) の組。先頭フィールドには 1 文字の問い合わせ用に 1-gram も、
+    各フィールドには前方一致用に先頭 1〜2 文字の見出しも持つ。順位は 重み×一致度（完全 4 / 前方 2 / 部分 1）に
+    短いテキストほど大きい端数を足したもの（同点の並びは問わない）。候補が少なければ部分文字列で確かめ、
+    多ければ長さ順リストを上位 limit 件が揃うまで走査する。一致が無いときだけ bi-gram の一致率で近いものを返す。
+    """
+
+    FUZZY_MIN_RATIO = 0.6
+    VERIFY_MAX = 2000
+    HEAD = '\x02'
+
+    def __init__(self, fields, key=lambda record: record.get('id')):
+        self.fields = fields
+        self.key = key
+        self.docs = {}
+        self.postings = {}
+        self.by_length = tuple([] for _ in fields)
+
+    def texts(self, record):
+        return tuple(normalize_text(extract(record)) for _, _, extract in self.fields)
+
+    def grams(self, texts):
+        grams = {(0, char) for char in texts[0]} if texts else set()
+        for i, text in enumerate(texts):
+            if text:
+                grams.add((i, self.HEAD + text[:1]))
+                grams.add((i, self.HEAD + text[:2]))
+                grams.update((i, gram) for gram in bigrams(text))
+        return grams
+
+    def rebuild(self, records):
+        docs = {}
+        postings = {}
+        for record in records:
+            doc_id = self.key(record)
+            texts = self.texts(record)
+            if not any(texts):
+                continue
+            docs[doc_id] = texts
+            for gram in self.grams(texts):
+                postings.setdefault(gram, set()).add(doc_id)
+        self.docs, self.postings = docs, postings
+        self.by_length = tuple(
+            sorted((len(texts[i]), texts[i], doc_id) for doc_id, texts in docs.items() if texts[i])
+            for i in range(len(self.fields))
+        )
+
+    def replace(self, old, new):
+        doc_id = self.key(new or old)
+        before = self.docs.get(doc_id)
+        after = self.texts(new) if new else None
+        if after is not None and not any(after):
+            after = None
+        if before == after:
+            return
+        old_grams = self.grams(before) if before else set()
+        new_grams = self.grams(after) if after else set()
+        for gram in old_grams - new_grams:
+            remaining = self.postings.get(gram, set()) - {doc_id}
+            if remaining:
+                self.postings[gram] = remaining
+            else:
+                self.postings.pop(gram, None)
+        for gram in new_grams - old_grams:
+            self.postings[gram] = self.postings.get(gram, set()) | {doc_id}
+        length_lists = list(self.by_length)
+        for i in range(len(self.fields)):
+            old_text = before[i] if before else ''
+            new_text = after[i] if after else ''
+            if old_text == new_text:
+                continue
+            lengths = list(length_lists[i])
+            if old_text:
+                del lengths[bisect_left(lengths, (len(old_text), old_text, doc_id))]
+            if new_text:
+                insort(lengths, (len(new_text), new_text, doc_id))
+            length_lists[i] = lengths
+        self.by_length = tuple(length_lists)
+        if after is None:
+            self.docs = {key: texts for key, texts in self.docs.items() if key != doc_id}
+        else:
+            self.docs = {**self.docs, doc_id: after}
+
+    def lookup(self, keys):
+        postings = sorted((self.postings.get(key, set()) for key in keys), key=len)
+        matched = postings[0]
+        for other in postings[1:]:
+            if not matched:
+                break
+            matched = matched & other
+        return matched
+
+    def search(self, query, limit=20):
+        """(score, doc_id, 一致したフィールド名) を score の高い順に返す。"""
+        needle = normalize_text(query)
+        if not needle:
+            return []
+        grams = bigrams(needle) or {needle}
+        best = {}
+        for i, (name, weight, _) in enumerate(self.fields):
+            candidates = self.lookup([(i, gram) for gram in grams])
+            if not candidates:
+                continue
+            for score, doc_id in self.field_hits(i, weight, needle, candidates, limit):
+                if doc_id not in best or score > best[doc_id][0]:
+                    best[doc_id] = (score, doc_id, name)
+        ranked = list(best.values())
+        if not ranked and len(grams) > 1:
+            ranked = self.fuzzy(grams, limit)
+        return heapq.nlargest(limit, ranked, key=lambda hit: (hit[0], str(hit[1])))
+
+    def field_hits(self, i, weight, needle, candidates, limit):
+        # 部分一致の最高点（重み + 1 未満）は前方一致の最低点（2×重み）に届かないので、
+        # 前方一致が limit 件あれば部分一致は探さなくてよい
+        if len(candidates) <= self.VERIFY_MAX:
+            return self.verify(i, weight, needle, candidates)
+        heads = candidates & self.postings.get((i, self.HEAD + needle[:2]), set())
+        if len(heads) <= self.VERIFY_MAX:
+            hits = [hit for hit in self.verify(i, weight, needle, heads) if hit[0] >= weight * 2]
+        else:
+            hits = self.walk(i, weight, needle, limit, lambda text: text.startswith(needle))
+        if len(hits) < limit:
+            hits += self.walk(i, weight, needle, limit,
+                              lambda text: needle in text and not text.startswith(needle))
+        return hits
+
+    def verify(self, i, weight, needle, candidates):
+        docs = self.docs
+        hits = []
+        for doc_id in candidates:
+            text = docs[doc_id][i]
+            position = text.find(needle)
+            if position < 0:
+                continue
+            quality = 4 if text == needle else 2 if position == 0 else 1
+            hits.append((weight * quality + len(needle) / len(text), doc_id))
+        return hits
+
+    def walk(self, i, weight, needle, limit, matches):
+        # 短い順に並んでいるので、条件に合うものを limit 件拾えばその一致度の上位になる
+        lengths = self.by_length[i]
+        size = len(needle)
+        hits = []
+        for length, text, doc_id in itertools.islice(lengths, bisect_left(lengths, (size,)), None):
+            if not matches(text):
+                continue
+            quality = 4 if text == needle else 2 if text.startswith(needle) else 1
+            hits.append((weight * quality + size / length, doc_id))
+            if len(hits) >= limit:
+                break
+        return hits
+
+    def fuzzy(self, grams, limit):
+        # 多くの文書に出る bi-gram（「東京」など）は数えず、それ以外の一致率で近いものを拾う
+        common = max(1000, len(self.docs) // 20)
+        counts = {}
+        for i in range(len(self.fields)):
+            for gram in grams:
+                posting = self.postings.get((i, gram), ())
+                if len(posting) > common:
+                    continue
+                for doc_id in posting:
+                    counts.setdefault(doc_id, set()).add(gram)
+        threshold = self.FUZZY_MIN_RATIO * len(grams)
+        return [(len(found) / len(grams), doc_id, None) for doc_id, found in counts.items() if len(found) >= threshold]
+
+
+def nearest_station_text(clinic):
+    stations = (clinic.get('access') or {}).get('nearestStation') or ()
+    return ' '.join(stations) if isinstance(stations, (list, tuple)) else str(stations)
+
+
+clinic_text_index = NgramIndex((
+    ('name', 3, lambda clinic: clinic.get('name')),
+    ('access.nearestStation', 2, nearest_station_text),
+    ('address', 1, lambda clinic: clinic.get('address')),
+))
+
+SUMMARY_FIELDS = ("id", "name", "address", "postalCode", "updated_at", "created_at", "schema_version")
+SUMMARY_DEFAULTS = {"address": "", "postalCode": "", "schema_version": 1}
+
+
 def clinic_summary(clinic):
-    return {
-        "id": clinic.get("id"),
-        "name": clinic.get("name"),
-        "address": clinic.get("address", ""),
-        "postalCode": clinic.get("postalCode", ""),
-        "updated_at": clinic.get("updated_at"),
-        "created_at": clinic.get("created_at"),
-        "schema_version": clinic.get("schema_version", 1),
-    }
+    return {field: clinic.get(field, SUMMARY_DEFAULTS.get(field)) for field in SUMMARY_FIELDS}
+
+
+def clinic_projection(clinic, fields):
+    """fields= で指定されたトップレベル項目だけを返す（要約の既定値もそろえる）。"""
+    return {field: clinic.get(field, SUMMARY_DEFAULTS.get(field)) for field in fields}
+
+
+# 列ごとの型コード。欠損は float なら NaN、整数なら MISSING_INT で表す
+CLINIC_COLUMNS = {
+    "latitude": 'd',
+    "longitude": 'd',
+    "updated_at": 'q',
+    "created_at": 'q',
+    "schema_version": 'q',
+}
+MISSING_INT = -(1 << 63)
+
+
+def column_value(clinic, field, typecode):
+    if field in ("latitude", "longitude"):
+        value = clinic_coordinates(clinic)
+        value = value and value[0 if field == "latitude" else 1]
+    else:
+        value = clinic.get(field, SUMMARY_DEFAULTS.get(field))
+    try:
+        return float(value) if typecode == 'd' else int(value)
+    except (TypeError, ValueError):
+        return math.nan if typecode == 'd' else MISSING_INT
+
+
+class ClinicSummary:
+    """一覧用の要約。文字列項目だけを持ち、数値項目は ClinicColumns の列から行番号で読む。"""
+
+    __slots__ = ('id', 'name', 'address', 'postalCode', 'row', 'columns', 'encoded')
+
+    def __init__(self, clinic, row, columns):
+        self.id = clinic.get('id')
+        self.name = clinic.get('name')
+        self.address = clinic.get('address', SUMMARY_DEFAULTS['address'])
+        self.postalCode = clinic.get('postalCode', SUMMARY_DEFAULTS['postalCode'])
+        self.row = row
+        self.columns = columns
+        self.encoded = None
+
+    def get(self, field):
+        column = self.columns.get(field)
+        if column is None:
+            return getattr(self, field, None)
+        value = column[self.row]
+        if value == MISSING_INT or value != value:
+            return None
+        return value
+
+    def as_dict(self):
+        return {field: self.get(field) for field in SUMMARY_FIELDS}
+
+    def to_json(self):
+        # 最初に一覧へ出たときにエンコードして持っておき、以降の一覧は断片をつなぐだけにする
+        encoded = self.encoded
+        if encoded is None:
+            encoded = self.encoded = encode_json(self.as_dict())
+        return encoded
+
+
+class ClinicColumns:
+    """SAMPLE_CLINICS の数値項目を array の列に、文字列項目を __slots__ の ClinicSummary に詰めた表。
+
+    行番号は施設ごとに固定で、更新時はその行の値と ClinicSummary だけを書き換える。
+    rebuild は新しい列を作ってから差し替えるので、古い ClinicSummary は古い列を読み続ける。
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.summaries = []
+        self.columns = {field: array(typecode) for field, typecode in CLINIC_COLUMNS.items()}
+
+    def rebuild(self, clinics):
+        columns = {field: array(typecode) for field, typecode in CLINIC_COLUMNS.items()}
+        rows = {}
+        summaries = []
+        for clinic in clinics:
+            rows[clinic.get('id')] = len(summaries)
+            for field, typecode in CLINIC_COLUMNS.items():
+                columns[field].append(column_value(clinic, field, typecode))
+            summaries.append(ClinicSummary(clinic, len(summaries), columns))
+        self.rows, self.summaries, self.columns = rows, summaries, columns
+
+    def replace(self, old, new):
+        clinic_id = new.get('id')
+        row = self.rows.get(clinic_id)
+        columns = self.columns
+        if row is None:
+            row = len(self.summaries)
+            for field, typecode in CLINIC_COLUMNS.items():
+                columns[field].append(column_value(new, field, typecode))
+            self.summaries = self.summaries + [ClinicSummary(new, row, columns)]
+            self.rows = {**self.rows, clinic_id: row}
+            return
+        for field, typecode in CLINIC_COLUMNS.items():
+            columns[field][row] = column_value(new, field, typecode)
+        summaries = list(self.summaries)
+        summaries[row] = ClinicSummary(new, row, columns)
+        self.summaries = summaries
+
+    def summary(self, clinic_id):
+        row = self.rows.get(clinic_id)
+        return self.summaries[row] if row is not None else None
+
+
+clinic_columns = ClinicColumns()
+
+# SAMPLE_CLINICS に追随する索引。rebuild(clinics) と replace(old, new) を持つ
+CLINIC_INDEXES = (clinic_index, geo_index, schedule_index, master_ref_index, clinic_text_index, clinic_columns)
+
+
+def rebuild_clinic_indexes(clinics):
+    clinics = list(clinics)
+    for index in CLINIC_INDEXES:
+        index.rebuild(clinics)
+
+
+def replace_in_clinic_indexes(old, new):
+    for index in CLINIC_INDEXES:
+        index.replace(old, new)
+
+
+def check_clinic_indexable(clinic):
+    """CLINIC_INDEXES の replace が使うキーを先に計算する。扱えない形の値なら ValueError を送出する。
+
+    replace は索引を 1 つずつ書き換えるので、途中で失敗すると索引どうしが食い違う。その前に弾くためのもの。
+    """
+    try:
+        for keys in ClinicIndex.keys_for(clinic).values():
+            for key in keys:
+                hash(key)
+        clinic_coordinates(clinic)
+        compile_schedule(clinic)
+        clinic_master_refs(clinic)
+        clinic_text_index.texts(clinic)
+        for field, typecode in CLINIC_COLUMNS.items():
+            column_value(clinic, field, typecode)
+    except (TypeError, AttributeError, ValueError) as exc:
+        raise ValueError(f"clinic cannot be indexed: {exc}") from exc
+
+
+rebuild_clinic_indexes(SAMPLE_CLINICS.values())
+
+# --db 指定時に使う LocalStore（local_store.py）。None の間はモジュール内のサンプルデータで応答する
+store = None
+
+
+def seed_store(target):
+    """空のストアにサンプルの診療所・マスター・分類を投入する。"""
+    if target.count("facilities") == 0:
+        target.upsert_clinics(thaw(clinic) for clinic in SAMPLE_CLINICS.values())
+    if target.count("master_items") == 0:
+        for items in SAMPLE_MASTER_ITEMS.values():
+            target.upsert_master_items(items)
+    if target.count("master_categories") == 0:
+        for type_name, categories in SAMPLE_CATEGORIES.items():
+            target.replace_master_categories(type_name, categories)
+
+
+def load_clinics_from_store(target):
+    """ストアの全施設をスナップショットとして読み込み、インデックスを作り直す。"""
+    global clinics_revision, clinics_last_modified
+    clinics = {clinic["id"]: freeze(clinic) for clinic in target.iter_clinics()}
+    with clinics_lock:
+        SAMPLE_CLINICS.clear()
+        SAMPLE_CLINICS.update(clinics)
+        rebuild_clinic_indexes(SAMPLE_CLINICS.values())
+        clinic_revisions.clear()
+        clinics_revision += 1
+        clinics_last_modified = max((c.get("updated_at") or 0 for c in clinics.values()), default=STARTED_AT)
+    bump_data_version()
+    return len(clinics)
+
+
+def open_store(path):
+    global store
+    target = LocalStore(path)
+    target.migrate()
+    seed_store(target)
+    count = load_clinics_from_store(target)
+    store = target
+    return count
 
 
 def find_clinic(id_param=None, name_param=None):
@@ -244,164 +1292,2391 @@ def find_clinic(id_param=None, name_param=None):
     if id_param:
         clinic = SAMPLE_CLINICS.get(id_param)
     if not clinic and name_param:
-        for item in SAMPLE_CLINICS.values():
-            if item.get("name") == name_param:
-                clinic = item
-                break
-    return deepcopy(clinic) if clinic else None
+        # 完全一致を優先し、なければ正規化名（全角/半角・かな違いを吸収）で引く
+        clinic_id = clinic_index.first("name", name_param) or \
+            clinic_index.first("normalized_name", normalize_text(name_param))
+        clinic = SAMPLE_CLINICS.get(clinic_id) if clinic_id else None
+    return clinic
 
 
-class NCDHandler(http.server.SimpleHTTPRequestHandler):
-    def end_headers(self):
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        super().end_headers()
+def update_clinic(clinic_id, changes):
+    """changes をトップレベルでマージした新しいスナップショットに差し替える（copy-on-write）。
 
-    def send_json(self, data, status=200):
-        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
-        self.send_response(status)
-        self.send_header('Content-Type', 'application/json; charset=utf-8')
-        self.send_header('Content-Length', str(len(body)))
-        self.end_headers()
-        self.wfile.write(body)
+    索引が扱えない形の値なら ValueError を送出し、ストアもメモリ上の状態も変更しない。
+    """
+    global clinics_revision, clinics_last_modified
+    with clinics_lock:
+        current = SAMPLE_CLINICS.get(clinic_id)
+        if current is None:
+            return None
+        record = thaw(current)
+        record.update({key: value for key, value in changes.items() if key != "id"})
+        record["updated_at"] = int(time.time())
+        snapshot = freeze(record)
+        check_clinic_indexable(snapshot)
+        if store is not None:
+            store.upsert_clinic(record)
+        SAMPLE_CLINICS[clinic_id] = snapshot
+        replace_in_clinic_indexes(current, snapshot)
+        # 同じ秒に複数回更新されても検証子が変わるようリビジョンも進める
+        clinic_revisions[clinic_id] = clinic_revisions.get(clinic_id, 0) + 1
+        clinics_revision += 1
+        clinics_last_modified = max(clinics_last_modified, record["updated_at"])
+    bump_data_version()
+    return snapshot
 
-    def do_GET(self):
-        parsed = urlparse(self.path)
-        path = parsed.path
-        query = parse_qs(parsed.query)
-
-        if path == '/api/listClinics':
-            clinics = [clinic_summary(data) for data in SAMPLE_CLINICS.values()]
-            self.send_json({"ok": True, "clinics": clinics})
-        elif path == '/api/clinicDetail':
-            id_param = (query.get('id') or [''])[0].strip()
-            name_param = (query.get('name') or [''])[0].strip()
-            clinic = find_clinic(id_param or None, name_param or None)
-            if clinic:
-                self.send_json({"ok": True, "clinic": clinic})
-            else:
-                self.send_json({"ok": False, "error": "clinic not found"}, status=404)
-        elif path == '/api/modes':
-            self.send_json({"ok": True, "modes": SAMPLE_MODES})
-        elif path == '/api/settings':
-            self.send_json({
-                "model": "gpt-4o-mini",
-                "prompt": "医療説明用のサンプルを作ってください",
-                "prompt_exam": "",
-                "prompt_diagnosis": ""
-            })
-        elif path == '/api/listCategories':
-            type_param = (query.get('type') or [''])[0]
-            if type_param == 'vaccinationType':
-                categories = ["小児定期接種", "任意接種"]
-            elif type_param == 'checkupType':
-                categories = ["特定健診", "企業健診", "自治体健診"]
-            elif type_param == 'service':
-                categories = ["内科", "外科"]
-            elif type_param == 'test':
-                categories = ["血液検査", "画像検査"]
-            else:
-                categories = ["分類A", "分類B", "分類C"]
-            self.send_json({
-                "ok": True,
-                "categories": categories
-            })
-        elif path == '/api/listMaster':
-            master_type = (query.get('type') or [''])[0]
-            if master_type == 'vaccination':
-                items = [
-                    {
-                        "_key": "master:vaccination:小児定期接種|麻しん風しん混合",
-                        "type": "vaccination",
-                        "category": "小児定期接種",
-                        "name": "麻しん風しん混合 (MR)",
-                        "desc": "1歳・年長時に定期接種",
-                        "status": "approved"
-                    },
-                    {
-                        "_key": "master:vaccination:任意接種|おたふくかぜ",
-                        "type": "vaccination",
-                        "category": "任意接種",
-                        "name": "おたふくかぜワクチン",
-                        "desc": "任意接種 / 1歳以降",
-                        "status": "candidate"
-                    }
-                ]
-            elif master_type == 'checkup':
-                items = [
-                    {
-                        "_key": "master:checkup:特定健診|特定健康診査",
-                        "type": "checkup",
-                        "category": "特定健診",
-                        "name": "特定健康診査",
-                        "desc": "40〜74歳対象の生活習慣病予防健診",
-                        "status": "approved"
-                    },
-                    {
-                        "_key": "master:checkup:企業健診|雇入時健診",
-                        "type": "checkup",
-                        "category": "企業健診",
-                        "name": "雇入時健康診断",
-                        "desc": "労働安全衛生規則に基づく健診",
-                        "status": "approved"
-                    }
-                ]
-            else:
-                items = [
-                    {
-                        "_key": "master:test:内科一般検査|血液検査",
-                        "type": "test",
-                        "category": "内科一般検査",
-                        "name": "血液検査",
-                        "status": "approved",
-                        "count": 5
-                    }
-                ]
-            self.send_json({"ok": True, "items": items})
-        elif path == '/api/todo/list':
-            self.send_json({
-                "ok": True,
-                "updatedAt": int(time.time()),
-                "todos": current_todos,
-            })
-        else:
-            # 静的ファイル配信
-            super().do_GET()
 
-    def do_POST(self):
-        content_length = self.headers.get('Content-Length')
+CORS_HEADERS = (
+    ('Access-Control-Allow-Origin', '*'),
+    ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS'),
+    ('Access-Control-Allow-Headers', 'Content-Type'),
+)
+
+
+# --- メトリクス（/api/_metrics） ---
+# 集計はスレッドごとのシャードに書き込むのでロックを取らない。読み出し時に全シャードを合算する。
+# --workers で fork した場合は、応答したプロセスの値だけが見える。
+
+LATENCY_BUCKETS = tuple(0.0001 * 2 ** i for i in range(17))  # 0.1ms 〜 約 6.5s（2 倍刻み）
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    __slots__ = ('counts', 'total')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.total += other.total
+
+
+class MetricsShard:
+    __slots__ = ('requests', 'bytes_out', 'latency', 'json_encode', 'cache')
+
+    def __init__(self):
+        self.requests = {}      # (route, method, status) → 件数
+        self.bytes_out = {}     # route → 本文のバイト数
+        self.latency = {}       # route → Histogram
+        self.json_encode = Histogram()
+        self.cache = {}         # 'hit' / 'miss' / 'not_modified' → 件数
+
+    def merge(self, other):
+        # 他スレッドが書き込み中でも dict のコピーは安全（値が 1 件分ずれるだけ）
+        for key, count in dict(other.requests).items():
+            self.requests[key] = self.requests.get(key, 0) + count
+        for route, size in dict(other.bytes_out).items():
+            self.bytes_out[route] = self.bytes_out.get(route, 0) + size
+        for route, histogram in dict(other.latency).items():
+            self.latency.setdefault(route, Histogram()).merge(histogram)
+        for result, count in dict(other.cache).items():
+            self.cache[result] = self.cache.get(result, 0) + count
+        self.json_encode.merge(other.json_encode)
+
+
+class ShardOwner:
+    """スレッドローカルにだけ置く目印。スレッド終了で回収されたら、そのシャードを retired に畳み込む。"""
+
+    __slots__ = ('shard', '__weakref__')
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+class Metrics:
+    """接続やエクスポートごとにスレッドが入れ替わるので、終了したスレッドのシャードは retired に合算して外す。"""
+
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+        self.retired = MetricsShard()
+        # retire はスレッド終了時の後始末で呼ばれるので、ロック保持中に割り込まれても固まらないよう RLock にする
+        self.lock = threading.RLock()
+        self.started = time.time()
+
+    def shard(self):
+        owner = getattr(self.local, 'owner', None)
+        if owner is None:
+            owner = self.local.owner = ShardOwner(MetricsShard())
+            weakref.finalize(owner, self.retire, owner.shard)
+            with self.lock:
+                self.shards = self.shards + [owner.shard]
+        return owner.shard
+
+    def retire(self, shard):
+        with self.lock:
+            self.retired.merge(shard)
+            self.shards = [live for live in self.shards if live is not shard]
+
+    def observe_request(self, route, method, status, seconds, size):
+        shard = self.shard()
+        key = (route, method, status)
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+        shard.bytes_out[route] = shard.bytes_out.get(route, 0) + size
+        histogram = shard.latency.get(route)
+        if histogram is None:
+            histogram = shard.latency[route] = Histogram()
+        histogram.observe(seconds)
+
+    def observe_json(self, seconds):
+        self.shard().json_encode.observe(seconds)
+
+    def count_cache(self, result):
+        cache = self.shard().cache
+        cache[result] = cache.get(result, 0) + 1
+
+    def snapshot(self):
+        total = MetricsShard()
+        # retire と重なると二重計上・取りこぼしになるので、合算の間だけロックを取る
+        with self.lock:
+            total.merge(self.retired)
+            for shard in self.shards:
+                total.merge(shard)
+        return total.requests, total.bytes_out, total.latency, total.json_encode, total.cache
+
+    def render(self):
+        """Prometheus のテキスト形式で返す。"""
+        requests, bytes_out, latency, json_encode, cache = self.snapshot()
+        lines = [
+            '# HELP ncd_http_requests_total Requests served, by route, method and status.',
+            '# TYPE ncd_http_requests_total counter',
+        ]
+        for (route, method, status), count in sorted(requests.items()):
+            lines.append(f'ncd_http_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}')
+        lines += [
+            '# HELP ncd_http_response_bytes_total Response body bytes sent, by route.',
+            '# TYPE ncd_http_response_bytes_total counter',
+        ]
+        lines += [f'ncd_http_response_bytes_total{{route="{route}"}} {size}' for route, size in sorted(bytes_out.items())]
+        lines += [
+            '# HELP ncd_http_request_duration_seconds Time from parsed request to response written, by route.',
+            '# TYPE ncd_http_request_duration_seconds histogram',
+        ]
+        for route, histogram in sorted(latency.items()):
+            lines += self.histogram_lines('ncd_http_request_duration_seconds', histogram, f'route="{route}",')
+        lines += [
+            '# HELP ncd_json_encode_seconds Time spent serializing JSON response bodies.',
+            '# TYPE ncd_json_encode_seconds histogram',
+        ]
+        lines += self.histogram_lines('ncd_json_encode_seconds', json_encode)
+        lines += [
+            '# HELP ncd_response_cache_requests_total Cacheable GET lookups, by result.',
+            '# TYPE ncd_response_cache_requests_total counter',
+        ]
+        for result in ('hit', 'miss', 'not_modified'):
+            lines.append(f'ncd_response_cache_requests_total{{result="{result}"}} {cache.get(result, 0)}')
+        lookups = cache.get('hit', 0) + cache.get('miss', 0)
+        lines += [
+            '# HELP ncd_response_cache_hit_ratio Share of response cache lookups answered from the cache.',
+            '# TYPE ncd_response_cache_hit_ratio gauge',
+            f'ncd_response_cache_hit_ratio {cache.get("hit", 0) / lookups if lookups else 0:.6f}',
+            '# HELP ncd_process_start_time_seconds Start time of the process since the Unix epoch.',
+            '# TYPE ncd_process_start_time_seconds gauge',
+            f'ncd_process_start_time_seconds {self.started:.3f}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def histogram_lines(name, histogram, labels=''):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}le="{bound:g}"}} {cumulative}')
+        cumulative += histogram.counts[-1]
+        lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {cumulative}')
+        labels = labels.rstrip(',')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {histogram.total:.6f}')
+        lines.append(f'{name}_count{suffix} {cumulative}')
+        return lines
+
+
+metrics = Metrics()
+
+
+# --- プロファイル（/api/_profile） ---
+# --profile-sample / --profile-token を指定したときだけ有効になる。無効時は計測用のクラスに差し替えないので
+# 通常のリクエスト経路には分岐すら入らない。集計はルートごと・プロセスごと。
+
+PROFILE_HEADER = 'X-NCD-Profile'
+PROFILE_TEXT_LIMIT = 60      # format=text で表示する関数の数
+COLLAPSED_MIN_SECONDS = 1e-6  # これより短い枝は collapsed 形式に出さない
+COLLAPSED_MAX_DEPTH = 64
+
+
+class RequestProfiler:
+    """1/sample_every のリクエストと、PROFILE_HEADER に token を付けたリクエストを cProfile で計測する。"""
+
+    def __init__(self, sample_every=0, token=None):
+        self.sample_every = sample_every
+        self.token = token
+        self.counter = itertools.count(1)
+        self.lock = threading.Lock()
+        self.stats = {}     # route → pstats.Stats
+        self.samples = {}   # route → 計測したリクエスト数
+
+    def token_matches(self, header):
+        return bool(self.token and header and hmac.compare_digest(header, self.token))
+
+    def start(self, header):
+        """計測対象なら有効化した Profile を返す。"""
+        if not self.token_matches(header):
+            if not self.sample_every or next(self.counter) % self.sample_every:
+                return None
+        profile = cProfile.Profile()
         try:
-            length = int(content_length) if content_length else 0
+            profile.enable()
         except ValueError:
-            length = 0
-        raw_body = self.rfile.read(length) if length > 0 else b''
+            # Python 3.12 以降は同時に 1 つしか有効にできないので、別スレッドで計測中なら見送る
+            return None
+        return profile
 
-        if self.path == '/api/todo/save':
-            try:
-                payload = json.loads(raw_body.decode('utf-8') or '{}')
-            except (json.JSONDecodeError, UnicodeDecodeError):
-                payload = {}
-            todos = payload.get('todos')
-            global current_todos
-            if isinstance(todos, list):
-                current_todos = todos
-            self.send_json({
-                "ok": True,
-                "updatedAt": int(time.time()),
-                "todos": current_todos,
-            })
-        else:
-            self.send_json({"ok": True})
+    def record(self, route, profile):
+        """disable 済みの Profile をルートの集計に加える。"""
+        stats = pstats.Stats(profile)
+        with self.lock:
+            existing = self.stats.get(route)
+            if existing is None:
+                self.stats[route] = stats
+            else:
+                existing.add(stats)
+            self.samples[route] = self.samples.get(route, 0) + 1
 
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.end_headers()
+    def merged(self, route):
+        with self.lock:
+            stats = self.stats.get(route)
+            if stats is None:
+                return None
+            # 集計中の Stats を書き換えられないようコピーを返す
+            merged = pstats.Stats(stream=io.StringIO())
+            merged.add(stats)
+            return merged
+
+    def summary(self):
+        with self.lock:
+            return {route: {"samples": count, "seconds": round(self.stats[route].total_tt, 6)}
+                    for route, count in sorted(self.samples.items())}
+
+
+def profile_label(func):
+    filename, line, name = func
+    if filename == '~':
+        label = name
+    else:
+        label = f'{name} ({os.path.basename(filename)}:{line})'
+    return label.replace(';', ',')
+
+
+def collapsed_stacks(stats):
+    """pstats を flamegraph.pl / speedscope 向けの collapsed 形式（"a;b;c マイクロ秒"）に変換する。
+
+    pstats は呼び出し元→先の辺しか持たないので、各辺の累積時間の比率で自己時間を呼び出し経路に配分する（近似）。
+    """
+    entries = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(func)
+    totals = {}
+
+    def walk(func, path, share, depth):
+        tt, ct = entries[func][2], entries[func][3]
+        ratio = share / ct if ct else 0.0
+        path = path + (profile_label(func),)
+        self_time = tt * ratio
+        if self_time >= COLLAPSED_MIN_SECONDS:
+            key = ';'.join(path)
+            totals[key] = totals.get(key, 0.0) + self_time
+        if depth >= COLLAPSED_MAX_DEPTH:
+            return
+        for callee in callees.get(func, ()):
+            if profile_label(callee) in path:
+                continue  # 再帰は打ち切る
+            edge_ct = entries[callee][4][func][3] * ratio
+            if edge_ct >= COLLAPSED_MIN_SECONDS:
+                walk(callee, path, edge_ct, depth + 1)
+
+    for func, (_, _, _, ct, callers) in entries.items():
+        if not callers:
+            walk(func, (), ct, 0)
+    return ''.join(f'{key} {round(seconds * 1e6)}\n' for key, seconds in sorted(totals.items())
+                   if round(seconds * 1e6) > 0)
+
+
+profiler = None
+
+
+class EncodedList:
+    """エンコード済みの JSON 値（bytes）の列。encode_json が配列としてそのまま埋め込む。"""
+
+    __slots__ = ('items',)
+
+    def __init__(self, items):
+        self.items = items
+
+
+def encode_json(data):
+    started = time.perf_counter()
+    spliced = []
+
+    def placeholder(value):
+        if not isinstance(value, EncodedList):
+            raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+        spliced.append(value)
+        return f"\0{BOOT_ID}:{len(spliced) - 1}\0"
+
+    body = json.dumps(data, ensure_ascii=False, default=placeholder).encode('utf-8')
+    for position, value in enumerate(spliced):
+        token = json.dumps(f"\0{BOOT_ID}:{position}\0").encode('ascii')
+        body = body.replace(token, b'[' + b', '.join(value.items) + b']', 1)
+    metrics.observe_json(time.perf_counter() - started)
+    return body
+
+
+def first_param(query, name, default=''):
+    return (query.get(name) or [default])[0]
+
+
+# --- レスポンスキャッシュ ---
+# 読み取り専用ルートは JSON をエンコード済みバイト列で保持し、ヒット時は再シリアライズしない。
+# データを書き換える処理は bump_data_version() を呼び、古いエントリを無効化する。
+
+CACHEABLE_ROUTES = frozenset({
+    '/api/listClinics',
+    '/api/clinicDetail',
+    '/api/modes',
+    '/api/settings',
+    '/api/listCategories',
+    '/api/listMaster',
+    '/api/searchClinicsNear',
+    '/api/searchClinicsBySymptom',
+    '/api/thesaurus',
+    '/api/search',
+    '/api/clinicsOpenAt',
+})
+
+# 結果が現在時刻に依存するクエリはキャッシュしない（path → query を受けてキャッシュしてよいかを返す）
+CACHE_CONDITIONS = {
+    '/api/clinicsOpenAt': lambda query: bool(first_param(query, 'dow').strip() and first_param(query, 'time').strip()),
+}
+
+_data_version = 0
+_data_version_lock = threading.Lock()
+
+
+def bump_data_version():
+    global _data_version
+    with _data_version_lock:
+        _data_version += 1
+        return _data_version
+
+
+def current_data_version():
+    return _data_version
+
+
+# --- 圧縮（Accept-Encoding ネゴシエーション） ---
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml', 'image/svg+xml')
+SUPPORTED_CODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+CODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def choose_encoding(accept_encoding):
+    """Accept-Encoding から使う圧縮方式を選ぶ。q 値が同じならサーバー側の優先順（br → gzip）。"""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        if token:
+            weights[token] = weight
+    wildcard = weights.get('*', 0.0)
+    best = None
+    best_weight = 0.0
+    for coding in SUPPORTED_CODINGS:
+        weight = weights.get(coding, wildcard)
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compress(data, coding, level=None):
+    if coding == 'br':
+        return brotli.compress(data, quality=5 if level is None else level)
+    # mtime=0 で出力を決定的にする（ETag と比較しやすい）
+    return gzip.compress(data, compresslevel=6 if level is None else level, mtime=0)
+
+
+def is_compressible(content_type):
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def coded_etag(etag, coding):
+    """表現（圧縮方式）ごとに強い ETag を分ける。比較時は etag_matches で接尾辞を外す。"""
+    if not etag or not coding:
+        return etag
+    return etag[:-1] + '-' + coding + '"'
+
+
+class CachedResponse:
+    __slots__ = ('status', 'body', 'etag', 'version', 'last_modified', 'cache_control', 'variants')
+
+    def __init__(self, status, body, etag=None, version=None, last_modified=None, cache_control=None):
+        self.status = status
+        self.body = body
+        self.etag = etag
+        self.version = version
+        self.last_modified = last_modified
+        self.cache_control = cache_control
+        self.variants = None
+
+    def negotiate(self, accept_encoding):
+        """(coding, body) を返す。圧縮結果はエントリに保持し、キャッシュヒット時は再圧縮しない。"""
+        if len(self.body) < COMPRESS_MIN_SIZE:
+            return None, self.body
+        coding = choose_encoding(accept_encoding)
+        if coding is None:
+            return None, self.body
+        variants = self.variants or {}
+        body = variants.get(coding)
+        if body is None:
+            body = compress(self.body, coding)
+            # 読み手と競合しないよう辞書ごと差し替える
+            self.variants = dict(variants, **{coding: body})
+        return coding, body
+
+    def not_modified(self):
+        return CachedResponse(304, b'', self.etag, self.version, self.last_modified, self.cache_control)
+
+    def validator_headers(self, coding=None):
+        headers = []
+        if self.etag:
+            headers.append(('ETag', coded_etag(self.etag, coding)))
+        if self.last_modified is not None:
+            headers.append(('Last-Modified', formatdate(self.last_modified, usegmt=True)))
+        if self.cache_control:
+            headers.append(('Cache-Control', self.cache_control))
+        return headers
+
+    @property
+    def content_length(self):
+        return len(self.body)
+
+
+def make_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def validator_etag(*parts):
+    """更新時刻・リビジョンから本文を作らずに ETag を組み立てる。"""
+    digest = hashlib.blake2b(repr((BOOT_ID,) + parts).encode('utf-8'), digest_size=12).hexdigest()
+    return '"' + digest + '"'
+
+
+def etag_matches(etag, if_none_match):
+    if if_none_match.strip() == '*':
+        return True
+    # 弱い比較（W/ 接頭辞と圧縮方式の接尾辞は無視する）
+    for tag in if_none_match.split(','):
+        tag = tag.strip().removeprefix('W/')
+        for coding in CODING_SUFFIXES:
+            suffix = '-' + coding + '"'
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)] + '"'
+                break
+        if tag == etag:
+            return True
+    return False
+
+
+def is_not_modified(etag, last_modified, if_none_match=None, if_modified_since=None):
+    """If-None-Match を優先し、無い場合だけ If-Modified-Since を見る（RFC 9110 13.2.2）。"""
+    if if_none_match:
+        return bool(etag) and etag_matches(etag, if_none_match)
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return False
+        return int(last_modified) <= since
+    return False
+
+
+def normalize_query(query_string):
+    """クエリ文字列をキャッシュキー用に正規化する（パラメータ順や空値の違いを吸収）。"""
+    query = parse_qs(query_string)
+    return tuple(sorted((name, tuple(values)) for name, values in query.items()))
+
+
+class ResponseCache:
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+# 管理画面は毎回再検証させる（304 なら本文は送らない）
+API_CACHE_CONTROL = 'no-cache'
+
+
+def list_clinics_validators(query, query_key):
+    return validator_etag('clinics', clinics_revision, query_key), clinics_last_modified
+
+
+def clinic_detail_validators(query, query_key):
+    clinic = find_clinic(first_param(query, 'id').strip() or None, first_param(query, 'name').strip() or None)
+    if clinic is None:
+        return None
+    clinic_id = clinic.get('id')
+    updated_at = clinic.get('updated_at')
+    return validator_etag('clinic', clinic_id, updated_at, clinic_revisions.get(clinic_id, 0)), updated_at
+
+
+def list_master_validators(query, query_key):
+    master_type = first_param(query, 'type')
+    if store is None and master_type not in SAMPLE_MASTER_ITEMS:
+        master_type = 'test'  # api_list_master と同じフォールバック
+    revision, last_modified = master_revisions.get(master_type, (0, STARTED_AT))
+    return validator_etag('master', revision, query_key), last_modified
+
+
+# 本文を作る前に検証子を出せるルート。304 で済む場合はルート実行も JSON 化も省く
+ROUTE_VALIDATORS = {
+    '/api/listClinics': list_clinics_validators,
+    '/api/clinicDetail': clinic_detail_validators,
+    '/api/listMaster': list_master_validators,
+}
+
+
+def render_get(path, route, query_string, if_none_match=None, if_modified_since=None):
+    """GET ルートを実行して CachedResponse を返す。キャッシュ対象ルートはエンコード結果を再利用し、
+    If-None-Match / If-Modified-Since が一致すれば 304 を返す。"""
+    condition = CACHE_CONDITIONS.get(path)
+    if path not in CACHEABLE_ROUTES or (condition is not None and not condition(parse_qs(query_string))):
+        status, payload = route(parse_qs(query_string))
+        return CachedResponse(status, encode_json(payload))
+    conditional = if_none_match or if_modified_since
+    query_key = normalize_query(query_string)
+    validators = None
+    validator = ROUTE_VALIDATORS.get(path)
+    if validator is not None:
+        # 本文より先に検証子を取る。途中で更新されても「新しい本文に古い ETag」になるだけで、次回は必ず再取得される
+        validators = validator(parse_qs(query_string), query_key)
+        if validators and conditional and is_not_modified(*validators, if_none_match, if_modified_since):
+            metrics.count_cache('not_modified')
+            return CachedResponse(304, b'', validators[0], last_modified=validators[1],
+                                  cache_control=API_CACHE_CONTROL)
+    version = current_data_version()
+    key = (path, query_key)
+    entry = response_cache.get(key, version)
+    metrics.count_cache('miss' if entry is None else 'hit')
+    if entry is None:
+        status, payload = route(parse_qs(query_string))
+        body = encode_json(payload)
+        etag, last_modified = validators if validators else (make_etag(body), None)
+        entry = CachedResponse(status, body, etag, version, last_modified, API_CACHE_CONTROL)
+        response_cache.put(key, entry)
+    if conditional and entry.status == 200 and is_not_modified(entry.etag, entry.last_modified,
+                                                                 if_none_match, if_modified_since):
+        return entry.not_modified()
+    return entry
+
+
+# --- API ルート（NCDHandler と asyncio エンジンで共有） ---
+# 各 GET ルートは parse_qs 済みのクエリを受け取り (status, payload) を返す。
+
+LIST_CLINICS_MAX_LIMIT = 2000
+
+
+def encode_cursor(key):
+    negative_updated_at, clinic_id = key
+    raw = f"{-negative_updated_at}:{clinic_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """encode_cursor の逆。壊れたカーソルは ValueError。"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        updated_at, sep, clinic_id = raw.partition(':')
+        if not sep:
+            raise ValueError(cursor)
+        return -int(updated_at), clinic_id
+    except (binascii.Error, UnicodeDecodeError) as exc:
+        raise ValueError(cursor) from exc
+
+
+def api_list_clinics(query):
+    name = first_param(query, 'name').strip()
+    postal_code = first_param(query, 'postalCode').strip()
+    departments = [value for value in query.get('department', []) if value]
+    modes = [value for value in query.get('mode', []) if value]
+    limit_param = first_param(query, 'limit').strip()
+    cursor_param = first_param(query, 'cursor').strip()
+    fields = [field.strip() for field in first_param(query, 'fields').split(',') if field.strip()]
+    try:
+        limit = min(int(limit_param), LIST_CLINICS_MAX_LIMIT) if limit_param else None
+        if limit is not None and limit < 1:
+            raise ValueError(limit_param)
+    except ValueError:
+        return 400, {"ok": False, "error": "limit must be a positive integer"}
+    try:
+        after = decode_cursor(cursor_param) if cursor_param else None
+    except ValueError:
+        return 400, {"ok": False, "error": "invalid cursor"}
+
+    ids = None
+    if name or postal_code or departments or modes:
+        ids = clinic_index.lookup(name, postal_code, departments, modes)
+    # 次ページの有無を知るため 1 件多く取る
+    keys = clinic_index.page(after, limit + 1 if limit is not None else None, ids)
+    next_cursor = None
+    if limit is not None and len(keys) > limit:
+        keys = keys[:limit]
+        next_cursor = encode_cursor(keys[-1])
+    if fields:
+        clinics = []
+        for _, cid in keys:
+            clinic = SAMPLE_CLINICS.get(cid)
+            if clinic is not None:
+                clinics.append(clinic_projection(clinic, fields))
+    else:
+        # 要約はエンコード済みの断片をつなぐだけで、行ごとに dict を作らない
+        summaries = clinic_columns.summary
+        clinics = EncodedList([summary.to_json() for summary in map(summaries, (cid for _, cid in keys))
+                               if summary is not None])
+    payload = {"ok": True, "clinics": clinics}
+    if limit is not None or after is not None:
+        payload["nextCursor"] = next_cursor
+    return 200, payload
+
+
+NEAR_DEFAULT_RADIUS_M = 2000
+NEAR_MAX_RADIUS_M = 100000
+NEAR_DEFAULT_LIMIT = 20
+NEAR_MAX_LIMIT = 200
+
+
+def api_search_clinics_near(query):
+    try:
+        lat = float(first_param(query, 'lat'))
+        lng = float(first_param(query, 'lng'))
+    except ValueError:
+        return 400, {"ok": False, "error": "lat and lng are required"}
+    if not (math.isfinite(lat) and math.isfinite(lng) and -90 <= lat <= 90 and -180 <= lng <= 180):
+        return 400, {"ok": False, "error": "lat/lng out of range"}
+    try:
+        radius = float(first_param(query, 'radius') or NEAR_DEFAULT_RADIUS_M)
+        limit = int(first_param(query, 'limit') or NEAR_DEFAULT_LIMIT)
+        if not math.isfinite(radius) or radius <= 0 or limit < 1:
+            raise ValueError
+    except ValueError:
+        return 400, {"ok": False, "error": "radius and limit must be positive numbers"}
+    radius = min(radius, NEAR_MAX_RADIUS_M)
+    limit = min(limit, NEAR_MAX_LIMIT)
+    clinics = []
+    for distance, clinic_id in geo_index.near(lat, lng, radius, limit):
+        clinic = SAMPLE_CLINICS.get(clinic_id)
+        if clinic is None:
+            continue
+        summary = clinic_summary(clinic)
+        summary["latitude"], summary["longitude"] = geo_index.points.get(clinic_id, (None, None))
+        summary["distance"] = round(distance, 1)
+        clinics.append(summary)
+    return 200, {"ok": True, "radius": radius, "clinics": clinics}
+
+
+def parse_dow(value):
+    """0-6（0=月曜）/ '月' / '月曜' / '祝日' / 'holiday' を曜日番号（祝日は 7）にする。不正値は None。"""
+    value = str(value or '').strip()
+    if value.lower() == 'holiday':
+        return HOLIDAY
+    if value.isdigit():
+        number = int(value)
+        return number if 0 <= number <= HOLIDAY else None
+    for number, day in enumerate(SCHEDULE_DAYS):
+        if value and day.startswith(value):
+            return number
+    return None
+
+
+OPEN_AT_DEFAULT_LIMIT = 100
+
+
+def api_clinics_open_at(query):
+    """dow / time を省略すると現在の日本時間で判定する。holiday=1 で祝日の診療時間を使う。
+    listClinics と同じ並び順・カーソルで limit 件ずつ返す。"""
+    limit_param = first_param(query, 'limit').strip()
+    cursor_param = first_param(query, 'cursor').strip()
+    try:
+        limit = min(int(limit_param), LIST_CLINICS_MAX_LIMIT) if limit_param else OPEN_AT_DEFAULT_LIMIT
+        if limit < 1:
+            raise ValueError(limit_param)
+    except ValueError:
+        return 400, {"ok": False, "error": "limit must be a positive integer"}
+    try:
+        after = decode_cursor(cursor_param) if cursor_param else None
+    except ValueError:
+        return 400, {"ok": False, "error": "invalid cursor"}
+    now = datetime.now(JST)
+    dow_param = first_param(query, 'dow').strip()
+    time_param = first_param(query, 'time').strip()
+    day = parse_dow(dow_param) if dow_param else now.weekday()
+    minute = parse_hhmm(time_param) if time_param else now.hour * 60 + now.minute
+    if day is None or minute is None or minute >= 24 * 60:
+        return 400, {"ok": False, "error": "dow must be 0-6 (Mon-Sun), a weekday name or 祝日; time must be HH:MM"}
+    weekday = None
+    if first_param(query, 'holiday').strip().lower() in ('1', 'true', 'yes'):
+        if day != HOLIDAY:
+            weekday = day
+        day = HOLIDAY
+    open_clinics = schedule_index.open_at(day, minute, weekday)
+    order_keys = clinic_index.order_keys
+    keys = (order_keys.get(cid, (0, cid)) for cid in open_clinics)
+    if after is not None:
+        keys = (key for key in keys if key > after)
+    # 全件を並べ替えず、次ページの有無を知るための 1 件を足した分だけ取り出す
+    keys = heapq.nsmallest(limit + 1, keys)
+    next_cursor = None
+    if len(keys) > limit:
+        keys = keys[:limit]
+        next_cursor = encode_cursor(keys[-1])
+    clinics = []
+    for _, clinic_id in keys:
+        clinic = SAMPLE_CLINICS.get(clinic_id)
+        if clinic is None:
+            continue
+        summary = clinic_summary(clinic)
+        closes = open_clinics[clinic_id]
+        summary["openUntil"] = f"{closes // 60:02d}:{closes % 60:02d}"
+        clinics.append(summary)
+    return 200, {
+        "ok": True,
+        "dow": SCHEDULE_DAYS[day],
+        "time": f"{minute // 60:02d}:{minute % 60:02d}",
+        "clinics": clinics,
+        "nextCursor": next_cursor,
+    }
+
+
+thesaurus_lock = threading.Lock()
+
+
+def normalize_thesaurus_term(value):
+    return unicodedata.normalize('NFKC', str(value or '')).strip().lower()
+
+
+class AliasIndex:
+    """シソーラスの語・異表記とマスター名から、マスターの比較用キーを引く索引。
+
+    マスター側は種別ごとのリビジョン（master_revisions）が変わったときだけ作り直す。
+    """
+
+    def __init__(self):
+        self.thesaurus = {}
+        self.masters = {}
+        self.items = {}
+        self.master_state = None
+
+    def rebuild_thesaurus(self, entries):
+        aliases = {}
+        for normalized, entry in entries.items():
+            words = [entry.get('term'), normalized] + list(entry.get('variants') or [])
+            keys = {sanitize_key_segment(word) for word in words} - {''}
+            for key in keys:
+                aliases.setdefault(key, set()).update(keys)
+        self.thesaurus = aliases
+
+    def ensure_masters(self):
+        state = (store is not None, tuple(sorted(master_revisions.items())))
+        if state == self.master_state:
+            return
+        masters = {}
+        items = {}
+        if store is not None:
+            source = store.iter_master_items(None)
+        else:
+            source = (item for group in list(SAMPLE_MASTER_ITEMS.values()) for item in list(group))
+        for item in source:
+            if item.get('status') == 'archived':
+                continue
+            parsed = parse_master_key(item.get('_key'))
+            comparable = parsed[3] if parsed else comparable_master_key(
+                item.get('type'), item.get('category'), item.get('name'))
+            if not comparable:
+                continue
+            items[comparable] = item
+            names = [item.get('name'), item.get('patientLabel')] + list(item.get('synonyms') or [])
+            if parsed:
+                names.append(parsed[2])
+            for name in names:
+                key = sanitize_key_segment(name)
+                if key:
+                    masters.setdefault(key, set()).add(comparable)
+        self.masters, self.items, self.master_state = masters, items, state
+
+    def resolve(self, term):
+        """語（異表記を含む）に当たるマスターの比較用キーを返す。"""
+        self.ensure_masters()
+        key = sanitize_key_segment(term)
+        words = self.thesaurus.get(key, set()) | {key}
+        found = set()
+        for word in words:
+            found |= self.masters.get(word, set())
+            # 診療科はマスター項目ではなく施設の departments.master に名前で入っている
+            if department_key(word) in master_ref_index.postings:
+                found.add(department_key(word))
+        return found
+
+    def item(self, comparable):
+        self.ensure_masters()
+        return self.items.get(comparable)
+
+
+alias_index = AliasIndex()
+alias_index.rebuild_thesaurus(SAMPLE_THESAURUS)
+
+# マスターは件数が少なく更新も稀なので、AliasIndex と同じくリビジョンが変わったときにまとめて作り直す
+master_text_index = NgramIndex((
+    ('name', 3, lambda item: item.get('name')),
+    ('desc', 1, lambda item: item.get('desc')),
+), key=lambda item: item.get('_key') or f"master:{item.get('type')}:{item.get('category')}|{item.get('name')}")
+master_text_state = None
+master_text_lock = threading.Lock()
+
+
+def ensure_master_text_index():
+    global master_text_state
+    alias_index.ensure_masters()
+    with master_text_lock:
+        if master_text_state != alias_index.master_state:
+            master_text_index.rebuild(alias_index.items.values())
+            master_text_state = alias_index.master_state
+
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+
+def api_search(query):
+    """診療所（名称・最寄り駅・住所）とマスター（名称・説明）を n-gram 索引で検索する。"""
+    q = first_param(query, 'q').strip()
+    if not q:
+        return 400, {"ok": False, "error": "q is required"}
+    try:
+        limit = min(int(first_param(query, 'limit') or SEARCH_DEFAULT_LIMIT), SEARCH_MAX_LIMIT)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return 400, {"ok": False, "error": "limit must be a positive integer"}
+    clinics = []
+    for score, clinic_id, field in clinic_text_index.search(q, limit):
+        clinic = SAMPLE_CLINICS.get(clinic_id)
+        if clinic is None:
+            continue
+        summary = clinic_summary(clinic)
+        summary["matchedField"] = field
+        summary["score"] = round(score, 3)
+        clinics.append(summary)
+    ensure_master_text_index()
+    masters = []
+    for score, key, field in master_text_index.search(q, limit):
+        item = alias_index.item(parse_master_key(key)[3]) if parse_master_key(key) else None
+        if item is None:
+            continue
+        masters.append({
+            "_key": key,
+            "type": item.get('type'),
+            "category": item.get('category'),
+            "name": item.get('name'),
+            "desc": item.get('desc'),
+            "matchedField": field,
+            "score": round(score, 3),
+        })
+    return 200, {"ok": True, "q": q, "clinics": clinics, "masters": masters}
+
+
+def api_thesaurus(query):
+    """functions/index.js の GET /api/thesaurus と同じ絞り込み（normalized 完全一致、term 部分一致、context）。"""
+    normalized_param = first_param(query, 'normalized').strip()
+    term_param = first_param(query, 'term').strip()
+    context_param = first_param(query, 'context').strip()
+    with thesaurus_lock:
+        if normalized_param:
+            entry = SAMPLE_THESAURUS.get(normalize_thesaurus_term(normalized_param))
+            items = [entry] if entry else []
+        else:
+            items = list(SAMPLE_THESAURUS.values())
+    if term_param:
+        needle = normalize_thesaurus_term(term_param)
+        items = [
+            entry for entry in items
+            if needle in normalize_thesaurus_term(entry.get('term'))
+            or any(needle in normalize_thesaurus_term(variant) for variant in entry.get('variants') or ())
+        ]
+    if context_param:
+        items = [entry for entry in items if context_param in (entry.get('context') or ())]
+    return 200, {"ok": True, "items": items}
+
+
+def string_list(value):
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def api_save_thesaurus(raw_body):
+    try:
+        payload = json.loads(raw_body.decode('utf-8') or '{}')
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        payload = None
+    if not isinstance(payload, dict):
+        return 400, {"error": "Invalid JSON"}
+    term = str(payload.get('term') or '').strip()
+    normalized = normalize_thesaurus_term(payload.get('normalized') or term)
+    if not normalized:
+        return 400, {"error": "normalized または term が必要です"}
+    now = datetime.now(timezone.utc).isoformat()
+    with thesaurus_lock:
+        entry = dict(SAMPLE_THESAURUS.get(normalized) or {"normalized": normalized, "created_at": now})
+        entry['term'] = term or entry.get('term') or normalized
+        if 'variants' in payload:
+            entry['variants'] = string_list(payload['variants'])
+        if 'context' in payload:
+            entry['context'] = string_list(payload['context'])
+        for field in ('locale', 'notes', 'source'):
+            if field in payload:
+                entry[field] = str(payload[field] or '').strip() or None
+        entry['updated_at'] = now
+        SAMPLE_THESAURUS[normalized] = entry
+        alias_index.rebuild_thesaurus(SAMPLE_THESAURUS)
+    bump_data_version()
+    return 200, {"ok": True, "entry": entry}
+
+
+def master_ref_info(key):
+    parsed = parse_master_key(key)
+    if parsed is None:
+        return None
+    master_type, category, name, comparable = parsed
+    return {"key": key, "type": master_type, "category": category, "name": name, "comparable": comparable}
+
+
+def api_search_clinics_by_symptom(query):
+    """症状（または任意のマスターキー・語）から、それを参照する診療所を転置索引で引く。
+
+    Worker は症状名を Jaro-Winkler で曖昧照合するが、stand-in ではシソーラスの異表記と
+    マスター名・同義語の正規化一致で解決する。症状以外のマスターキーもそのまま受け付ける。
+    """
+    key_param = first_param(query, 'key').strip()
+    term_param = (first_param(query, 'symptom') or first_param(query, 'q')).strip()
+    include_services = first_param(query, 'includeServices') != 'false'
+    include_tests = first_param(query, 'includeTests') != 'false'
+    if not key_param and not term_param:
+        return 400, {"ok": False, "error": "symptom または key を指定してください"}
+
+    targets = set()
+    if key_param:
+        direct = key_param if key_param.startswith('master:') else f"master:symptom:{key_param}"
+        parsed = parse_master_key(direct)
+        if parsed:
+            targets.add(parsed[3])
+    if not targets and term_param:
+        targets = alias_index.resolve(term_param)
+    if not targets:
+        return 404, {"ok": False, "error": "該当する症状が見つかりません"}
+
+    symptom = None
+    wanted = {}  # 比較用キー → 参照情報
+    for comparable in sorted(targets):
+        item = alias_index.item(comparable) or {}
+        if comparable.startswith('symptom:'):
+            if symptom is None and item:
+                symptom = item
+            for raw in (item.get('defaultServices') or []) if include_services else []:
+                info = master_ref_info(raw)
+                if info and info['type'] == 'service':
+                    wanted.setdefault(info['comparable'], info)
+            for raw in (item.get('defaultTests') or []) if include_tests else []:
+                info = master_ref_info(raw)
+                if info and info['type'] == 'test':
+                    wanted.setdefault(info['comparable'], info)
+        elif comparable.startswith('department:'):
+            name = comparable.partition(':')[2]
+            wanted.setdefault(comparable, {"key": comparable, "type": "department", "name": name,
+                                           "comparable": comparable})
+        else:
+            info = master_ref_info(item.get('_key') or f"master:{comparable}")
+            if info:
+                wanted.setdefault(comparable, info)
+
+    matches = {}
+    for comparable, info in wanted.items():
+        for clinic_id, field in master_ref_index.clinics_for(comparable).items():
+            match = matches.setdefault(clinic_id, {"services": [], "tests": [], "others": []})
+            bucket = field if field in ('services', 'tests') else 'others'
+            match[bucket].append(info)
+
+    clinics = []
+    for clinic_id, match in matches.items():
+        clinic = SAMPLE_CLINICS.get(clinic_id)
+        if clinic is None:
+            continue
+        clinics.append({
+            "clinicId": clinic_id,
+            "clinicName": clinic.get('name') or '',
+            "address": clinic.get('address') or '',
+            "phone": clinic.get('phone') or clinic.get('phoneNumber'),
+            "url": (clinic.get('homepage') or {}).get('url') if isinstance(clinic.get('homepage'), dict)
+            else clinic.get('homepage') or clinic.get('website'),
+            "matchedServices": [public_ref(info) for info in match['services']],
+            "matchedTests": [public_ref(info) for info in match['tests']],
+            "matchedMasters": [public_ref(info) for info in match['others']],
+            "score": len(match['services']) * 2 + len(match['tests']) + len(match['others']),
+        })
+    clinics.sort(key=lambda entry: (-entry['score'], entry['clinicName']))
+
+    matched = set(wanted) & set(master_ref_index.postings)
+    payload = {
+        "ok": True,
+        "symptom": None,
+        "clinics": clinics,
+        "recommendedServices": [public_ref(info) for info in wanted.values() if info.get('type') == 'service'],
+        "recommendedTests": [public_ref(info) for info in wanted.values() if info.get('type') == 'test'],
+        "missingServices": [public_ref(info) for c, info in wanted.items()
+                            if info.get('type') == 'service' and c not in matched],
+        "missingTests": [public_ref(info) for c, info in wanted.items()
+                         if info.get('type') == 'test' and c not in matched],
+    }
+    if symptom is not None:
+        payload["symptom"] = {
+            "key": symptom.get('_key'),
+            "comparableKey": comparable_master_key('symptom', symptom.get('category'), symptom.get('name')),
+            "name": symptom.get('name') or '',
+            "patientLabel": symptom.get('patientLabel') or '',
+            "category": symptom.get('category') or '',
+            "severityTags": symptom.get('severityTags') or [],
+            "icd10": symptom.get('icd10') or [],
+            "synonyms": symptom.get('synonyms') or [],
+            "notes": symptom.get('notes'),
+        }
+    return 200, payload
+
+
+def public_ref(info):
+    return {"key": info.get('key'), "category": info.get('category'), "name": info.get('name')}
+
+
+def api_clinic_detail(query):
+    id_param = first_param(query, 'id').strip()
+    name_param = first_param(query, 'name').strip()
+    clinic = find_clinic(id_param or None, name_param or None)
+    if clinic:
+        return 200, {"ok": True, "clinic": clinic}
+    return 404, {"ok": False, "error": "clinic not found"}
+
+
+def api_modes(query):
+    return 200, {"ok": True, "modes": SAMPLE_MODES}
+
+
+def api_settings(query):
+    return 200, {
+        "model": "gpt-4o-mini",
+        "prompt": "医療説明用のサンプルを作ってください",
+        "prompt_exam": "",
+        "prompt_diagnosis": ""
+    }
+
+
+def api_list_categories(query):
+    type_param = first_param(query, 'type')
+    if store is not None:
+        categories = store.list_master_categories(type_param)
+    else:
+        categories = SAMPLE_CATEGORIES.get(type_param, DEFAULT_CATEGORIES)
+    return 200, {
+        "ok": True,
+        "categories": categories
+    }
+
+
+def api_list_master(query):
+    master_type = first_param(query, 'type')
+    if store is not None:
+        status = first_param(query, 'status').strip() or None
+        items = store.list_master_items(master_type, status)
+    else:
+        items = SAMPLE_MASTER_ITEMS.get(master_type, SAMPLE_MASTER_ITEMS['test'])
+    return 200, {"ok": True, "items": items}
+
+
+MASTER_UPDATE_FIELDS = ('status', 'sortGroup', 'sortOrder', 'desc', 'notes', 'referenceUrl')
+masters_lock = threading.Lock()
+# 種別ごとの (リビジョン, 最終更新時刻)。未更新の種別は (0, STARTED_AT)
+master_revisions = {}
+
+
+def update_master_item(master_type, category, name, changes):
+    """(type, category, name) の項目を部分更新する。見つからなければ False。"""
+    changes = {key: changes[key] for key in MASTER_UPDATE_FIELDS if key in changes}
+    if store is not None:
+        updated = store.update_master_item(master_type, category, name, changes) > 0
+    else:
+        updated = False
+        with masters_lock:
+            items = SAMPLE_MASTER_ITEMS.get(master_type, [])
+            for position, item in enumerate(items):
+                if item.get('name') == name and (category is None or item.get('category') == category):
+                    # 読み取り中のリストを壊さないよう項目ごと差し替える
+                    items[position] = dict(item, **changes)
+                    updated = True
+    if updated:
+        with masters_lock:
+            revision, _ = master_revisions.get(master_type, (0, STARTED_AT))
+            master_revisions[master_type] = (revision + 1, int(time.time()))
+        bump_data_version()
+    return updated
+
+
+def api_update_master_item(raw_body):
+    try:
+        payload = json.loads(raw_body.decode('utf-8') or '{}')
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        payload = None
+    if not isinstance(payload, dict):
+        return 400, {"ok": False, "error": "invalid json"}
+    master_type = str(payload.get('type') or '').strip()
+    name = str(payload.get('name') or '').strip()
+    if not master_type or not name:
+        return 400, {"ok": False, "error": "type and name are required"}
+    category = payload.get('category')
+    category = str(category).strip() if category is not None else None
+    if not update_master_item(master_type, category, name, payload):
+        return 404, {"ok": False, "error": "master item not found"}
+    return 200, {"ok": True}
+
+
+def api_todo_list(query):
+    with todos_lock:
+        todos = current_todos
+    return 200, {
+        "ok": True,
+        "updatedAt": int(time.time()),
+        "todos": todos,
+    }
+
+
+def api_todo_save(raw_body):
+    try:
+        payload = json.loads(raw_body.decode('utf-8') or '{}')
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        payload = {}
+    todos = payload.get('todos')
+    global current_todos
+    with todos_lock:
+        if isinstance(todos, list):
+            current_todos = todos
+            bump_data_version()
+        saved = current_todos
+    return 200, {
+        "ok": True,
+        "updatedAt": int(time.time()),
+        "todos": saved,
+    }
+
+
+# updateClinic で受け付ける値の形。ここに無い項目はそのまま保存する
+CLINIC_SCALAR_FIELDS = (
+    'name', 'shortName', 'kanaName', 'address', 'postalCode', 'phone', 'fax', 'prefecture', 'prefectureCode',
+    'city', 'cityCode', 'externalId', 'mhlwFacilityId', 'facilityType', 'source', 'latitude', 'longitude',
+    'created_at', 'updated_at', 'schema_version',
+)
+CLINIC_OBJECT_FIELDS = ('access', 'location', 'homepage', 'schedule')
+CLINIC_SELECTION_FIELDS = ('modes', 'vaccinations', 'checkups')
+CLINIC_COLLECTION_FIELDS = ('services', 'tests')
+# services/tests の各要素のうち、ストアの列（local_store.collection_rows）に入る項目
+CLINIC_COLLECTION_KEYS = ('id', 'masterId', 'name', 'category', 'source', 'notes')
+
+
+def is_scalar(value):
+    return value is None or isinstance(value, (str, int, float))
+
+
+def is_string_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def clinic_changes_error(changes):
+    """updateClinic の本文の形を確かめ、不正ならエラーメッセージを返す。"""
+    for field in CLINIC_SCALAR_FIELDS:
+        if not is_scalar(changes.get(field)):
+            return f"{field} must be a string or number"
+    for field in CLINIC_OBJECT_FIELDS:
+        if field in changes and not isinstance(changes[field], (dict, type(None))):
+            return f"{field} must be an object"
+    departments = changes.get('departments')
+    if departments is not None:
+        if not isinstance(departments, dict):
+            return "departments must be an object"
+        for key in ('master', 'others'):
+            if departments.get(key) is not None and not is_string_list(departments[key]):
+                return f"departments.{key} must be a list of strings"
+    for field in CLINIC_SELECTION_FIELDS:
+        value = changes.get(field)
+        if value is None:
+            continue
+        if not isinstance(value, dict):
+            return f"{field} must be an object"
+        if value.get('selected') is not None and not is_string_list(value['selected']):
+            return f"{field}.selected must be a list of strings"
+    stations = (changes.get('access') or {}).get('nearestStation')
+    if not (is_scalar(stations) or is_string_list(stations)):
+        return "access.nearestStation must be a string or a list of strings"
+    for key in ('lat', 'lng'):
+        if not is_scalar((changes.get('location') or {}).get(key)):
+            return f"location.{key} must be a number"
+    for field in CLINIC_COLLECTION_FIELDS:
+        entries = changes.get(field)
+        if entries is None:
+            continue
+        if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+            return f"{field} must be a list of objects"
+        for entry in entries:
+            for key in CLINIC_COLLECTION_KEYS:
+                if not is_scalar(entry.get(key)):
+                    return f"{field}[].{key} must be a string or number"
+    return None
+
+
+def api_update_clinic(raw_body):
+    try:
+        payload = json.loads(raw_body.decode('utf-8') or '{}')
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        payload = None
+    if not isinstance(payload, dict):
+        return 400, {"ok": False, "error": "invalid json"}
+    clinic_id = str(payload.get('id') or '').strip()
+    if not clinic_id:
+        return 400, {"ok": False, "error": "id is required"}
+    error = clinic_changes_error(payload)
+    if error:
+        return 400, {"ok": False, "error": error}
+    try:
+        clinic = update_clinic(clinic_id, payload)
+    except ValueError as exc:
+        return 400, {"ok": False, "error": str(exc)}
+    if clinic is None:
+        return 404, {"ok": False, "error": "clinic not found"}
+    return 200, {"ok": True, "clinic": clinic}
+
+
+# --- エクスポート（ストリーミング） ---
+# 各ルートは (status, content_type, chunks) を返す。chunks は bytes のイテレータで、
+# 1 行ずつ組み立てて EXPORT_CHUNK_SIZE ごとに送るのでデータ量によらずメモリは一定。
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_CONTENT_TYPES = {
+    'json': 'application/json; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+# functions/index.js の CLINIC_EXPORT / MASTER_EXPORT と同じ列
+CLINIC_CSV_COLUMNS = (
+    ("id", ("id",)),
+    ("name", ("name",)),
+    ("address", ("address",)),
+    ("doctors.fulltime", ("doctors", "fulltime")),
+    ("doctors.parttime", ("doctors", "parttime")),
+    ("doctors.qualifications", ("doctors", "qualifications")),
+    ("schema_version", ("schema_version",)),
+    ("created_at", ("created_at",)),
+    ("updated_at", ("updated_at",)),
+)
+MASTER_CSV_COLUMNS = (("分類", ("category",)), ("名称", ("name",)), ("説明", ("desc",)))
+
+
+def rechunk(pieces, size=EXPORT_CHUNK_SIZE):
+    """細かい bytes をまとめて size 前後のチャンクにする。"""
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield b''.join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def csv_value(record, path):
+    value = record
+    for key in path:
+        value = value.get(key) if isinstance(value, dict) else None
+    return '' if value is None else str(value)
+
+
+def stream_records(records, export_format, columns, total=None):
+    """records を JSON / NDJSON / CSV の断片として 1 件ずつ返す。"""
+    if export_format == 'csv':
+        yield (','.join(name for name, _ in columns) + '\n').encode('utf-8')
+        for record in records:
+            line = ','.join('"' + csv_value(record, path).replace('"', '""') + '"' for _, path in columns)
+            yield (line + '\n').encode('utf-8')
+    elif export_format == 'ndjson':
+        for record in records:
+            yield encode_json(record) + b'\n'
+    else:
+        head = {"ok": True} if total is None else {"ok": True, "total": total}
+        yield encode_json(head)[:-1] + b', "items": ['
+        separator = b''
+        for record in records:
+            yield separator + encode_json(record)
+            separator = b', '
+        yield b']}'
+
+
+def export_error(status, message):
+    return status, EXPORT_CONTENT_TYPES['json'], iter([encode_json({"ok": False, "error": message})])
+
+
+def export_format_param(query):
+    export_format = first_param(query, 'format', 'json').strip().lower() or 'json'
+    return export_format if export_format in EXPORT_CONTENT_TYPES else None
+
+
+def api_export_clinics(query):
+    export_format = export_format_param(query)
+    if export_format is None:
+        return export_error(400, "format must be json, ndjson or csv")
+    try:
+        offset = int(first_param(query, 'offset', '0') or 0)
+        limit = int(first_param(query, 'limit')) if first_param(query, 'limit') else None
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError
+    except ValueError:
+        return export_error(400, "offset and limit must be non-negative integers")
+    summary = first_param(query, 'detail').strip().lower() == 'summary'
+
+    def records():
+        # ストアがあれば SQLite から直接、無ければメモリ上のスナップショットから 1 件ずつ取り出す
+        if store is not None:
+            source = store.iter_clinics()
+        else:
+            source = iter(list(SAMPLE_CLINICS.values()))
+        source = itertools.islice(source, offset, None if limit is None else offset + limit)
+        return (clinic_summary(clinic) for clinic in source) if summary else source
+
+    total = store.count("facilities") if store is not None else len(SAMPLE_CLINICS)
+    chunks = rechunk(stream_records(records(), export_format, CLINIC_CSV_COLUMNS, total))
+    return 200, EXPORT_CONTENT_TYPES[export_format], chunks
+
+
+def api_export_master(query):
+    export_format = export_format_param(query)
+    if export_format is None:
+        return export_error(400, "format must be json, ndjson or csv")
+    master_type = first_param(query, 'type').strip() or None
+    status = first_param(query, 'status').strip() or None
+    if store is not None:
+        items = store.iter_master_items(master_type, status)
+    else:
+        types = [master_type] if master_type else list(SAMPLE_MASTER_ITEMS)
+        items = (item for name in types for item in list(SAMPLE_MASTER_ITEMS.get(name, ()))
+                 if status is None or item.get('status') == status)
+    chunks = rechunk(stream_records(items, export_format, MASTER_CSV_COLUMNS))
+    return 200, EXPORT_CONTENT_TYPES[export_format], chunks
+
+
+def api_metrics(query):
+    return 200, METRICS_CONTENT_TYPE, iter([metrics.render().encode('utf-8')])
+
+
+def api_profile(query):
+    """?route= で指定したルートの集計を format=text|pstats|collapsed で返す。route 省略時は一覧。"""
+    if profiler is None:
+        return export_error(404, "profiling is disabled; start with --profile-sample or --profile-token")
+    route = first_param(query, 'route').strip()
+    if not route:
+        body = {"ok": True, "sampleEvery": profiler.sample_every, "header": PROFILE_HEADER,
+                "routes": profiler.summary()}
+        return 200, EXPORT_CONTENT_TYPES['json'], iter([encode_json(body)])
+    stats = profiler.merged(route)
+    if stats is None:
+        return export_error(404, f"no profile for route: {route}")
+    profile_format = first_param(query, 'format', 'text').strip().lower()
+    if profile_format == 'pstats':
+        # pstats.Stats(path) / snakeviz でそのまま読める形式（Stats.dump_stats と同じ）
+        return 200, 'application/octet-stream', iter([marshal.dumps(stats.stats)])
+    if profile_format == 'collapsed':
+        return 200, 'text/plain; charset=utf-8', iter([collapsed_stacks(stats).encode('utf-8')])
+    if profile_format != 'text':
+        return export_error(400, "format must be text, pstats or collapsed")
+    stats.stream = io.StringIO()
+    stats.sort_stats('cumulative').print_stats(PROFILE_TEXT_LIMIT)
+    return 200, 'text/plain; charset=utf-8', iter([stats.stream.getvalue().encode('utf-8')])
+
+
+STREAM_ROUTES = {
+    '/api/exportClinics': api_export_clinics,
+    '/api/exportMaster': api_export_master,
+    '/api/_metrics': api_metrics,
+    '/api/_profile': api_profile,
+}
+
+
+GET_ROUTES = {
+    '/api/listClinics': api_list_clinics,
+    '/api/clinicDetail': api_clinic_detail,
+    '/api/searchClinicsNear': api_search_clinics_near,
+    '/api/clinicsOpenAt': api_clinics_open_at,
+    '/api/searchClinicsBySymptom': api_search_clinics_by_symptom,
+    '/api/thesaurus': api_thesaurus,
+    '/api/search': api_search,
+    '/api/modes': api_modes,
+    '/api/settings': api_settings,
+    '/api/listCategories': api_list_categories,
+    '/api/listMaster': api_list_master,
+    '/api/todo/list': api_todo_list,
+}
+
+POST_ROUTES = {
+    '/api/todo/save': api_todo_save,
+    '/api/updateClinic': api_update_clinic,
+    '/api/updateMasterItem': api_update_master_item,
+    '/api/thesaurus': api_save_thesaurus,
+}
+
+
+def dispatch_stream(path, query, profile_header=None):
+    """STREAM_ROUTES のルートを呼ぶ。--profile-token 指定時の /api/_profile は同じトークンのヘッダーを要求する。"""
+    if path == '/api/_profile' and profiler is not None and profiler.token and not profiler.token_matches(profile_header):
+        return export_error(403, f"{PROFILE_HEADER} header with the profile token is required")
+    return STREAM_ROUTES[path](parse_qs(query))
+
+
+def dispatch_post(path, raw_body):
+    route = POST_ROUTES.get(path)
+    if route is None:
+        return 200, {"ok": True}
+    return route(raw_body)
+
+
+def metrics_route(method, path):
+    """メトリクスのラベル。API ルートはパスそのまま、それ以外は static / other にまとめる（ラベルの種類を増やさない）。"""
+    if path in GET_ROUTES or path in POST_ROUTES or path in STREAM_ROUTES:
+        return path
+    return 'static' if method in ('GET', 'HEAD') else 'other'
+
+
+# --- 静的ファイル（web/） ---
+
+STATIC_PRELOAD_MAX = 1 << 20  # これ以下のファイルはメモリに保持し、超えるものは sendfile で送る
+
+
+def resolve_static(directory, path):
+    """URL パスを directory 配下の実ファイルに解決する（ディレクトリは index.html）。外に出るパスは None。"""
+    path = unquote(path)
+    relative = posixpath.normpath(path).lstrip('/')
+    full = os.path.abspath(os.path.join(directory, relative))
+    if full != directory and not full.startswith(directory + os.sep):
+        return None
+    if os.path.isdir(full):
+        for index in ('index.html', 'index.htm'):
+            candidate = os.path.join(full, index)
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+    return full if os.path.isfile(full) else None
+
+
+def parse_range(value, size):
+    """単一の bytes 範囲を (start, end) で返す。無視すべき指定は None、満たせない範囲は False。"""
+    unit, _, spec = value.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None  # 複数範囲は扱わず全体を返す
+    start, sep, end = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if not start:
+            suffix = int(end)
+            if suffix <= 0:
+                return False
+            return max(0, size - suffix), size - 1
+        first = int(start)
+        last = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if first >= size or last < first:
+        return False
+    return first, min(last, size - 1)
+
+
+class StaticAsset:
+    __slots__ = ('path', 'content_type', 'size', 'mtime', 'mtime_ns', 'etag', 'data', 'variants')
+
+    def __init__(self, path, content_type, stat, data, variants):
+        self.path = path
+        self.content_type = content_type
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.mtime_ns = stat.st_mtime_ns
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        self.data = data
+        self.variants = variants
+
+    def matches(self, stat):
+        return stat.st_mtime_ns == self.mtime_ns and stat.st_size == self.size
+
+
+class StaticFileCache:
+    """web/ 配下のファイルを起動時に読み込み、圧縮済みの表現と一緒に保持する。
+
+    取得のたびに stat で mtime・サイズを確かめ、変わっていれば読み直す。
+    STATIC_PRELOAD_MAX を超えるファイルは本文を持たず、送信時に sendfile する。
+    デプロイ時に作った ``.gz`` / ``.br`` の隣接ファイルがあれば圧縮結果としてそちらを優先する。
+    """
+
+    def __init__(self, preload_max=STATIC_PRELOAD_MAX, precompress=True):
+        self.preload_max = preload_max
+        self.precompress = precompress
+        self.entries = {}
+
+    def build(self, directory):
+        preloaded = compressed = 0
+        for root, _, files in os.walk(directory):
+            for name in files:
+                full = os.path.abspath(os.path.join(root, name))
+                asset = self.load(full, os.stat(full))
+                preloaded += len(asset.data or b'')
+                compressed += sum(len(body) for body in asset.variants.values())
+        return len(self.entries), preloaded, compressed
+
+    def load(self, full, stat):
+        content_type = mimetypes.guess_type(full)[0] or 'application/octet-stream'
+        data = None
+        if stat.st_size <= self.preload_max:
+            with open(full, 'rb') as f:
+                data = f.read()
+        variants = {}
+        if (self.precompress and data is not None and is_compressible(content_type)
+                and len(data) >= COMPRESS_MIN_SIZE):
+            for coding in SUPPORTED_CODINGS:
+                sibling = full + CODING_SUFFIXES[coding]
+                if os.path.isfile(sibling):
+                    with open(sibling, 'rb') as f:
+                        body = f.read()
+                else:
+                    body = compress(data, coding, level=11 if coding == 'br' else 9)
+                if len(body) < len(data):
+                    variants[coding] = body
+        asset = StaticAsset(full, content_type, stat, data, variants)
+        self.entries[full] = asset
+        return asset
+
+    def get(self, full):
+        try:
+            stat = os.stat(full)
+        except OSError:
+            self.entries.pop(full, None)
+            return None
+        asset = self.entries.get(full)
+        if asset is None or not asset.matches(stat):
+            asset = self.load(full, stat)
+        return asset
+
+
+def static_response_parts(asset, accept_encoding=None, range_header=None, if_range=None,
+                          if_none_match=None, if_modified_since=None):
+    """静的ファイルの応答を (status, headers, body, span) で返す。
+
+    body が None のときは span=(offset, count) の範囲をファイルから直接送る。
+    """
+    validators = [('ETag', asset.etag), ('Last-Modified', formatdate(asset.mtime, usegmt=True))]
+    if is_not_modified(asset.etag, asset.mtime, if_none_match, if_modified_since):
+        return 304, validators, b'', None
+    headers = [('Content-Type', asset.content_type), ('Accept-Ranges', 'bytes')] + validators
+    if asset.variants:
+        headers.append(('Vary', 'Accept-Encoding'))
+    if range_header and (not if_range or if_range in (asset.etag, validators[1][1])):
+        byte_range = parse_range(range_header, asset.size)
+        if byte_range is False:
+            headers = [('Content-Range', f'bytes */{asset.size}'), ('Content-Length', '0')]
+            return 416, headers, b'', None
+        if byte_range is not None:
+            start, end = byte_range
+            count = end - start + 1
+            headers.append(('Content-Range', f'bytes {start}-{end}/{asset.size}'))
+            headers.append(('Content-Length', str(count)))
+            if asset.data is not None:
+                return 206, headers, memoryview(asset.data)[start:end + 1], None
+            return 206, headers, None, (start, count)
+    coding = choose_encoding(accept_encoding) if asset.variants else None
+    if coding in asset.variants:
+        body = asset.variants[coding]
+        headers[2] = ('ETag', coded_etag(asset.etag, coding))
+        headers.append(('Content-Encoding', coding))
+        headers.append(('Content-Length', str(len(body))))
+        return 200, headers, body, None
+    headers.append(('Content-Length', str(asset.size)))
+    if asset.data is not None:
+        return 200, headers, asset.data, None
+    return 200, headers, None, (0, asset.size)
+
+
+static_files = StaticFileCache()
+
+# POST 本文の上限（両エンジン共通）。超えた本文は読まずに 413 を返して接続を閉じる
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+
+class NCDHandler(http.server.SimpleHTTPRequestHandler):
+    """HTTP/1.1 keep-alive で API と web/ を配信する。
+
+    すべての応答に Content-Length か chunked を付け、接続を使い回せるようにする。
+    wfile はバッファ付きにしてヘッダーと小さい本文を 1 回の送信にまとめ、TCP_NODELAY で Nagle の遅延も避ける。
+    timeout 秒リクエストが来なければ切断し、max_requests 件処理した接続は Connection: close で閉じる（0 は無制限）。
+    処理枠（server.request_slots）はリクエストを読み終えてから応答を送り終えるまでだけ占有し、待機中の接続は枠を使わない。
+    枠が埋まっているときの応答は Connection: close にして、接続を溜め込まないようにする。
+    """
+
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    timeout = 2.0
+    max_requests = 100
+    quiet = False
+
+    def setup(self):
+        super().setup()
+        self.requests_handled = 0
+
+    def handle_one_request(self):
+        self.request_started = None
+        self.response_status = None
+        self.response_bytes = 0
+        self.request_slot = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self.request_slot is not None:
+                self.request_slot.release()
+        if self.request_started is not None and self.response_status is not None:
+            method = self.command or '-'
+            metrics.observe_request(metrics_route(method, urlparse(self.path).path), method, self.response_status,
+                                    time.perf_counter() - self.request_started,
+                                    0 if method == 'HEAD' else self.response_bytes)
+
+    def parse_request(self):
+        self.request_started = time.perf_counter()
+        ok = super().parse_request()
+        slots = getattr(self.server, 'request_slots', None)
+        if slots is None:
+            # 1 スレッドで順に処理するサーバーでは、待機中の接続がほかのクライアントを塞ぐので毎回閉じる
+            self.close_connection = True
+        else:
+            if not slots.acquire(blocking=False):
+                self.close_connection = True
+                slots.acquire()
+            self.request_slot = slots
+        return ok
+
+    def send_response(self, code, message=None):
+        self.connection_header_sent = False
+        self.response_status = code
+        super().send_response(code, message)
+        self.requests_handled += 1
+        if self.max_requests and self.requests_handled >= self.max_requests:
+            self.send_header('Connection', 'close')
+        elif self.close_connection and self.request_version == 'HTTP/1.1':
+            # 本文を読み切れなかった・クライアントが close を求めた場合も明示する
+            self.send_header('Connection', 'close')
+        elif not self.close_connection and self.request_version == 'HTTP/1.0':
+            self.send_header('Connection', 'keep-alive')
+
+    def send_header(self, keyword, value):
+        # send_error も Connection: close を付けるので、1 応答に 1 つだけにする
+        if keyword.lower() == 'connection':
+            if self.connection_header_sent:
+                return
+            self.connection_header_sent = True
+        elif keyword.lower() == 'content-length':
+            self.response_bytes = int(value)
+        super().send_header(keyword, value)
+
+    def end_headers(self):
+        for name, value in CORS_HEADERS:
+            self.send_header(name, value)
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+    def send_json(self, data, status=200):
+        self.send_cached(CachedResponse(status, encode_json(data)))
+
+    def send_cached(self, response, include_body=True):
+        coding, body = response.negotiate(self.headers.get('Accept-Encoding'))
+        self.send_response(response.status)
+        if response.status != 304:
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            if coding:
+                self.send_header('Content-Encoding', coding)
+        self.send_header('Vary', 'Accept-Encoding')
+        for name, value in response.validator_headers(coding):
+            self.send_header(name, value)
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+
+    def send_static(self, path, include_body=True):
+        """static_files から配信する。解決できないパス（ディレクトリ一覧・リダイレクト等）は親クラスに任せる。"""
+        full = None
+        # 末尾スラッシュの無いディレクトリは親クラスのリダイレクトに任せる（相対リンクを保つため）
+        if path.endswith('/') or not os.path.isdir(self.translate_path(path)):
+            full = resolve_static(os.path.abspath(self.directory), path)
+        asset = static_files.get(full) if full else None
+        if asset is None:
+            super().do_GET() if include_body else super().do_HEAD()
+            return
+        status, headers, body, span = static_response_parts(
+            asset,
+            self.headers.get('Accept-Encoding'),
+            self.headers.get('Range'),
+            self.headers.get('If-Range'),
+            self.headers.get('If-None-Match'),
+            self.headers.get('If-Modified-Since'),
+        )
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        if not include_body:
+            return
+        if body is not None:
+            self.wfile.write(body)
+            return
+        # 大きいファイルはユーザー空間にコピーせずカーネルから直接送る（先にバッファ済みのヘッダーを出す）
+        offset, count = span
+        self.wfile.flush()
+        with open(asset.path, 'rb') as f:
+            self.connection.sendfile(f, offset, count)
+
+    def send_stream(self, status, content_type, chunks):
+        """長さの分からない本文を送る。HTTP/1.1 では chunked、HTTP/1.0 では接続を閉じて終端を示す。"""
+        chunked = self.request_version == 'HTTP/1.1' and self.protocol_version == 'HTTP/1.1'
+        if not chunked:
+            self.close_connection = True
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in chunks:
+            self.response_bytes += len(chunk)
+            if chunked:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            else:
+                self.wfile.write(chunk)
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path in STREAM_ROUTES:
+            self.send_stream(*dispatch_stream(parsed.path, parsed.query, self.headers.get(PROFILE_HEADER)))
+            return
+        route = GET_ROUTES.get(parsed.path)
+        if route is None:
+            # 静的ファイル配信
+            self.send_static(parsed.path)
+            return
+        self.send_cached(render_get(parsed.path, route, parsed.query,
+                                    self.headers.get('If-None-Match'), self.headers.get('If-Modified-Since')))
+
+    def do_HEAD(self):
+        parsed = urlparse(self.path)
+        route = GET_ROUTES.get(parsed.path)
+        if route is not None:
+            self.send_cached(render_get(parsed.path, route, parsed.query,
+                                        self.headers.get('If-None-Match'), self.headers.get('If-Modified-Since')),
+                             include_body=False)
+            return
+        self.send_static(parsed.path, include_body=False)
+
+    def read_body(self):
+        """リクエスト本文を読み切る（chunked 対応）。
+
+        長さが読めなければ 400、MAX_BODY_BYTES を超えれば 413 をここで返して接続を閉じ、None を返す。
+        """
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            chunks = []
+            total = 0
+            while True:
+                try:
+                    size = int(self.rfile.readline(ASYNC_MAX_LINE).split(b';', 1)[0].strip(), 16)
+                    if size < 0:
+                        raise ValueError(size)
+                except ValueError:
+                    return self.reject_body(400)
+                total += size
+                if total > MAX_BODY_BYTES:
+                    return self.reject_body(413)
+                if size == 0:
+                    while self.rfile.readline(ASYNC_MAX_LINE) not in (b'\r\n', b'\n', b''):
+                        pass
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline(ASYNC_MAX_LINE)
+        content_length = self.headers.get('Content-Length')
+        try:
+            length = int(content_length) if content_length else 0
+            if length < 0:
+                raise ValueError(content_length)
+        except ValueError:
+            return self.reject_body(400)
+        if length > MAX_BODY_BYTES:
+            return self.reject_body(413)
+        return self.rfile.read(length) if length > 0 else b''
+
+    def reject_body(self, status):
+        # 本文の終わりが分からない（または読まない）ので、次のリクエストとして読まないよう接続を閉じる
+        self.close_connection = True
+        error = "request body too large" if status == 413 else "invalid request body length"
+        self.send_json({"ok": False, "error": error}, status=status)
+        return None
+
+    def do_POST(self):
+        raw_body = self.read_body()
+        if raw_body is None:
+            return
+        status, payload = dispatch_post(urlparse(self.path).path, raw_body)
+        self.send_json(payload, status=status)
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class ProfilingNCDHandler(NCDHandler):
+    """--profile-* 指定時だけ使う NCDHandler。ヘッダー解析後から応答送信までを cProfile で計測する。"""
+
+    def handle_one_request(self):
+        self.profile = None
+        try:
+            super().handle_one_request()
+        finally:
+            if self.profile is not None:
+                self.profile.disable()
+                profiler.record(metrics_route(self.command or '-', urlparse(self.path).path), self.profile)
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        self.profile = profiler.start(self.headers.get(PROFILE_HEADER))
+        return True
+
+
+# --- asyncio エンジン ---
+# http.server を使わずにイベントループ上で同じルートを処理する。
+# HTTP/1.1 keep-alive とパイプライン（同一接続上の連続リクエスト）に対応。
+
+ASYNC_MAX_HEADERS = 100
+ASYNC_MAX_LINE = 8192
+
+
+class AsyncHTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+def build_response(status, headers, body=b'', version='HTTP/1.1', include_body=True):
+    reason = http.server.BaseHTTPRequestHandler.responses.get(status, ('',))[0]
+    lines = [f"{version} {status} {reason}"]
+    lines.extend(f"{name}: {value}" for name, value in headers)
+    lines.extend(f"{name}: {value}" for name, value in CORS_HEADERS)
+    head = ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+    return head + body if include_body else head
+
+
+class StreamingResponse:
+    """asyncio エンジン用のストリーミング本文。
+
+    チャンクの生成（SQLite の読み出しを含む）は専用スレッド 1 本で進める。
+    LocalStore の接続はスレッドごとなので、同じスレッドで最後まで回す必要がある。
+    """
+
+    def __init__(self, status, content_type, chunks, version, keep_alive, include_body=True):
+        self.chunked = version == 'HTTP/1.1'
+        self.chunks = chunks
+        self.include_body = include_body
+        self.sent = 0
+        headers = [('Content-Type', content_type)]
+        if self.chunked:
+            headers.append(('Transfer-Encoding', 'chunked'))
+            headers.append(('Connection', 'keep-alive' if keep_alive else 'close'))
+        else:
+            headers.append(('Connection', 'close'))
+        self.head = build_response(status, headers, version=version, include_body=False)
+
+    async def write_to(self, writer):
+        writer.write(self.head)
+        if not self.include_body:
+            return
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='export') as producer:
+            while True:
+                chunk = await loop.run_in_executor(producer, next, self.chunks, None)
+                if chunk is None:
+                    break
+                self.sent += len(chunk)
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk) if self.chunked else chunk)
+                # 送信が追いつくまで次のチャンクを作らない（メモリを一定に保つ）
+                await writer.drain()
+        if self.chunked:
+            writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+
+class AsyncNCDServer:
+    """asyncio.start_server 上で NCDHandler と同じ API・静的ファイルを配信する。"""
+
+    def __init__(self, directory, idle_timeout=2.0, quiet=False, max_requests=100):
+        self.directory = os.path.abspath(directory)
+        self.idle_timeout = idle_timeout
+        self.quiet = quiet
+        self.max_requests = max_requests
+
+    def log(self, peer, request_line, status):
+        if self.quiet:
+            return
+        host = peer[0] if peer else '-'
+        timestamp = time.strftime('%d/%b/%Y %H:%M:%S')
+        sys.stderr.write(f'{host} - - [{timestamp}] "{request_line}" {status} -\n')
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        handled = 0
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader), self.idle_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except AsyncHTTPError as exc:
+                    writer.write(build_response(exc.status, [('Content-Length', '0'), ('Connection', 'close')]))
+                    break
+                if request is None:
+                    break
+                method, target, version, headers, body = request
+                started = time.perf_counter()
+                handled += 1
+                keep_alive = self.wants_keep_alive(version, headers) and \
+                    not (self.max_requests and handled >= self.max_requests)
+                status, response = await self.respond(method, target, version, headers, body, keep_alive)
+                if isinstance(response, StreamingResponse):
+                    await response.write_to(writer)
+                    # HTTP/1.0 では本文の終わりを接続の切断で示す
+                    keep_alive = keep_alive and response.chunked
+                    size = response.sent
+                elif isinstance(response, tuple):
+                    # (ヘッダー, パス, (offset, count)): 本文はファイルから sendfile で送る
+                    head, path, (offset, count) = response
+                    writer.write(head)
+                    await writer.drain()
+                    with open(path, 'rb') as f:
+                        await asyncio.get_running_loop().sendfile(writer.transport, f, offset, count)
+                    size = count
+                else:
+                    writer.write(response)
+                    size = len(response) - response.find(b'\r\n\r\n') - 4
+                self.log(peer, f"{method} {target} {version}", status)
+                # 送信バッファが閾値を超えたときだけ待つので、パイプライン時は連続処理される
+                await writer.drain()
+                metrics.observe_request(metrics_route(method, urlparse(target).path), method, status,
+                                        time.perf_counter() - started, size)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    async def read_line(reader, status):
+        """1 行読む。StreamReader の上限（64KiB）を超える行は status の AsyncHTTPError にする。"""
+        try:
+            line = await reader.readline()
+        except (ValueError, asyncio.LimitOverrunError):
+            raise AsyncHTTPError(status)
+        if len(line) > ASYNC_MAX_LINE:
+            raise AsyncHTTPError(status)
+        return line
+
+    async def read_request(self, reader):
+        line = await self.read_line(reader, 414)
+        if not line:
+            return None
+        parts = line.decode('latin-1').rstrip('\r\n').split()
+        if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+            raise AsyncHTTPError(400)
+        method, target, version = parts
+        headers = {}
+        for _ in range(ASYNC_MAX_HEADERS + 1):
+            raw = await self.read_line(reader, 431)
+            if raw in (b'\r\n', b'\n', b''):
+                break
+            name, sep, value = raw.decode('latin-1').partition(':')
+            if not sep:
+                raise AsyncHTTPError(400)
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise AsyncHTTPError(431)
+        body = b''
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            body = await self.read_chunked(reader)
+        elif headers.get('content-length'):
+            try:
+                length = int(headers['content-length'])
+            except ValueError:
+                raise AsyncHTTPError(400)
+            if length < 0:
+                raise AsyncHTTPError(400)
+            if length > MAX_BODY_BYTES:
+                raise AsyncHTTPError(413)
+            if length > 0:
+                body = await reader.readexactly(length)
+        return method.upper(), target, version, headers, body
+
+    async def read_chunked(self, reader):
+        chunks = []
+        total = 0
+        while True:
+            size_line = await self.read_line(reader, 400)
+            try:
+                size = int(size_line.split(b';', 1)[0].strip(), 16)
+            except ValueError:
+                raise AsyncHTTPError(400)
+            if size < 0:
+                raise AsyncHTTPError(400)
+            total += size
+            if total > MAX_BODY_BYTES:
+                raise AsyncHTTPError(413)
+            if size == 0:
+                # トレーラーを読み捨てる
+                while (await self.read_line(reader, 431)) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await self.read_line(reader, 400)
+
+    @staticmethod
+    def wants_keep_alive(version, headers):
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.1':
+            return connection != 'close'
+        return connection == 'keep-alive'
+
+    async def respond(self, method, target, version, headers, body, keep_alive):
+        parsed = urlparse(target)
+        connection = [('Connection', 'keep-alive' if keep_alive else 'close')]
+        if method == 'OPTIONS':
+            return 200, build_response(200, [('Content-Length', '0')] + connection, version=version)
+        if method == 'POST':
+            status, payload = dispatch_post(parsed.path, body)
+            return status, self.json_response(status, payload, connection, version)
+        if method not in ('GET', 'HEAD'):
+            return 501, build_response(501, [('Content-Length', '0')] + connection, version=version)
+        if parsed.path in STREAM_ROUTES:
+            status, content_type, chunks = dispatch_stream(parsed.path, parsed.query,
+                                                           headers.get(PROFILE_HEADER.lower()))
+            return status, StreamingResponse(status, content_type, chunks, version, keep_alive, method == 'GET')
+        route = GET_ROUTES.get(parsed.path)
+        if route is not None:
+            response = render_get(parsed.path, route, parsed.query,
+                                  headers.get('if-none-match'), headers.get('if-modified-since'))
+            return response.status, self.cached_response(response, connection, version, method == 'GET',
+                                                         headers.get('accept-encoding'))
+        return await self.static_response(headers, parsed.path, connection, version, method == 'GET')
+
+    @staticmethod
+    def cached_response(response, connection, version, include_body=True, accept_encoding=None):
+        coding, body = response.negotiate(accept_encoding)
+        headers = []
+        if response.status != 304:
+            headers.append(('Content-Type', 'application/json; charset=utf-8'))
+            headers.append(('Content-Length', str(len(body))))
+            if coding:
+                headers.append(('Content-Encoding', coding))
+        headers.append(('Vary', 'Accept-Encoding'))
+        headers.extend(response.validator_headers(coding))
+        return build_response(response.status, headers + connection, body, version, include_body)
+
+    @classmethod
+    def json_response(cls, status, payload, connection, version, include_body=True):
+        return cls.cached_response(CachedResponse(status, encode_json(payload)), connection, version, include_body)
+
+    async def static_response(self, headers, path, connection, version, include_body):
+        full = resolve_static(self.directory, path)
+        asset = static_files.get(full) if full else None
+        if asset is None:
+            return 404, self.json_response(404, {"ok": False, "error": "not found"}, connection, version, include_body)
+        status, response_headers, body, span = static_response_parts(
+            asset,
+            headers.get('accept-encoding'),
+            headers.get('range'),
+            headers.get('if-range'),
+            headers.get('if-none-match'),
+            headers.get('if-modified-since'),
+        )
+        if body is not None or not include_body:
+            return status, build_response(status, response_headers + connection, body or b'', version, include_body)
+        head = build_response(status, response_headers + connection, version=version, include_body=False)
+        return status, (head, asset.path, span)
+
+    async def serve(self, host=None, port=None, sock=None):
+        if sock is not None:
+            server = await asyncio.start_server(self.handle_connection, sock=sock, backlog=1024)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port,
+                                                reuse_address=True, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+
+class ProfilingAsyncNCDServer(AsyncNCDServer):
+    """--profile-* 指定時だけ使う AsyncNCDServer。応答の組み立て（respond）を cProfile で計測する。
+
+    ストリーミング応答の本文生成は別スレッドで進むので、計測に含まれない。
+    """
+
+    async def respond(self, method, target, version, headers, body, keep_alive):
+        profile = profiler.start(headers.get(PROFILE_HEADER.lower()))
+        if profile is None:
+            return await super().respond(method, target, version, headers, body, keep_alive)
+        try:
+            # respond は途中で他のコルーチンに切り替わらないので、計測にほかの接続の処理は混ざらない
+            return await super().respond(method, target, version, headers, body, keep_alive)
+        finally:
+            profile.disable()
+            profiler.record(metrics_route(method, urlparse(target).path), profile)
+
+
+class SlottedThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """接続ごとにデーモンスレッドを割り当て、同時に処理するリクエスト数だけを request_slots で max_requests 件に抑える。
+
+    受け付ける接続数・スレッド数そのものには上限がない。keep-alive で待機しているだけの接続は
+    枠を消費しないので、アイドル接続が新しいリクエストを待たせない。
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+    # 既定の 5 では、枠が埋まって閉じた接続の再接続が溢れて SYN の再送（約 1 秒）待ちになる
+    request_queue_size = 1024
+
+    def __init__(self, server_address, handler_class, max_requests=32):
+        super().__init__(server_address, handler_class)
+        self.max_requests = max_requests
+        self.request_slots = threading.BoundedSemaphore(max_requests)
+
+
+class SingleThreadTCPServer(socketserver.TCPServer):
+    allow_reuse_address = True
+    request_slots = None
+
+
+def make_server(host, port, threads, handler_class=NCDHandler):
+    if threads > 1:
+        return SlottedThreadingTCPServer((host, port), handler_class, max_requests=threads)
+    return SingleThreadTCPServer((host, port), handler_class)
+
+
+def serve_preforked(serve, workers):
+    """listen 済みソケットを共有する子プロセスを workers 個 fork し、各子で serve() を実行する。
+
+    ToDo などのインメモリ状態はプロセスごとに独立する点に注意。
+    """
+    if not hasattr(os, "fork"):
+        raise SystemExit("--workers requires os.fork (not available on this platform)")
+    sys.stdout.flush()
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            try:
+                serve()
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def shutdown_children(*_):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, lambda *_: (shutdown_children(), sys.exit(0)))
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        shutdown_children()
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+
+
+def run_threading(args):
+    handler_class = NCDHandler if profiler is None else ProfilingNCDHandler
+    with make_server(args.host, args.port, args.threads, handler_class) as httpd:
+        print(f"Server running at http://{args.host}:{args.port} "
+              f"(engine=threading, workers={args.workers}, threads={args.threads})")
+        if args.workers > 1:
+            serve_preforked(httpd.serve_forever, args.workers)
+        else:
+            try:
+                httpd.serve_forever()
+            except KeyboardInterrupt:
+                pass
+
+
+def run_asyncio(args):
+    engine_class = AsyncNCDServer if profiler is None else ProfilingAsyncNCDServer
+    engine = engine_class(os.getcwd(), idle_timeout=args.idle_timeout, quiet=args.quiet,
+                          max_requests=args.max_requests)
+    sock = socket.create_server((args.host, args.port), backlog=1024)
+    sock.setblocking(False)
+    print(f"Server running at http://{args.host}:{args.port} "
+          f"(engine=asyncio, workers={args.workers})")
+
+    def serve():
+        try:
+            asyncio.run(engine.serve(sock=sock))
+        except KeyboardInterrupt:
+            pass
+
+    with sock:
+        if args.workers > 1:
+            serve_preforked(serve, args.workers)
+        else:
+            serve()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="NCD-App local API stand-in server")
+    parser.add_argument("port", nargs="?", type=int, default=7000, help="Listen port (default: 7000)")
+    parser.add_argument("--host", default="0.0.0.0", help="Bind address (default: 0.0.0.0)")
+    parser.add_argument("--engine", choices=("threading", "asyncio"), default="threading",
+                        help="Request engine: http.server threads or asyncio event loop (default: threading)")
+    parser.add_argument("--threads", type=int, default=16,
+                        help="Requests handled concurrently per process by the threading engine. Each connection "
+                             "still gets its own thread and the number of connections is not capped; idle "
+                             "keep-alive connections do not count against this limit. 1 serves one connection "
+                             "at a time without keep-alive (default: 16)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Pre-forked worker processes sharing the listen socket (default: 1)")
+    parser.add_argument("--idle-timeout", type=float, default=2.0,
+                        help="Seconds an idle keep-alive connection is held open (default: 2)")
+    parser.add_argument("--max-requests", type=int, default=100,
+                        help="Requests served on one keep-alive connection before it is closed; 0 for no limit "
+                             "(default: 100)")
+    parser.add_argument("--quiet", action="store_true", help="Suppress per-request access logs")
+    parser.add_argument("--profile-sample", type=int, default=0, metavar="N",
+                        help="Profile 1 in N requests with cProfile; results at /api/_profile (default: 0, off)")
+    parser.add_argument("--profile-token",
+                        help=f"Also profile requests whose {PROFILE_HEADER} header equals this token; "
+                             "/api/_profile then requires the same header")
+    parser.add_argument("--db", help="SQLite file created from schema/d1 (see local_store.py); "
+                                     "seeded with the sample data when empty")
+    parser.add_argument("--no-precompress", action="store_true",
+                        help="Skip building gzip/brotli copies of web/ assets at startup")
+    args = parser.parse_args(argv)
+    if args.threads < 1 or args.workers < 1:
+        parser.error("--threads and --workers must be >= 1")
+    if args.max_requests < 0:
+        parser.error("--max-requests must be >= 0")
+    if args.profile_sample < 0:
+        parser.error("--profile-sample must be >= 0")
+    return args
 
 
 if __name__ == "__main__":
+    args = parse_args()
+    if args.db:
+        loaded = open_store(os.path.abspath(args.db))
+        print(f"Loaded {loaded} clinics from {args.db}")
+        # fork 前に接続を閉じ、各プロセス・スレッドで開き直させる
+        store.close()
     os.chdir("web")
-    port = int(sys.argv[1]) if len(sys.argv) > 1 else 7000
-    with socketserver.TCPServer(("0.0.0.0", port), NCDHandler) as httpd:
-        print(f"Server running at http://0.0.0.0:{port}")
-        httpd.serve_forever()
+    static_files.precompress = not args.no_precompress
+    assets, preloaded, compressed = static_files.build(os.getcwd())
+    print(f"Cached {assets} static files ({preloaded} bytes preloaded, "
+          f"{compressed} bytes {'/'.join(SUPPORTED_CODINGS)} precompressed)")
+    NCDHandler.quiet = args.quiet
+    NCDHandler.timeout = args.idle_timeout
+    NCDHandler.max_requests = args.max_requests
+    if args.profile_sample or args.profile_token:
+        profiler = RequestProfiler(args.profile_sample, args.profile_token)
+    if args.engine == "asyncio":
+        run_asyncio(args)
+    else:
+        run_threading(args)
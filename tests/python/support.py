@@ -0,0 +1,171 @@
+"""simple_server をテストプロセス内で起動する補助。
+
+実行方法（リポジトリのルートで）:
+  python3 -m unittest discover -s tests/python -t tests/python
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import http.client
+import json
+import socket
+import sys
+import threading
+import types
+import unittest
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+for path in (ROOT, ROOT / "scripts"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+import simple_server  # noqa: E402
+from generate_clinics import generate_clinics  # noqa: E402
+
+WEB_DIR = ROOT / "web"
+simple_server.NCDHandler.quiet = True
+SAMPLE_CLINICS = [simple_server.thaw(clinic) for clinic in simple_server.SAMPLE_CLINICS.values()]
+
+_static_lock = threading.Lock()
+_static_built = False
+
+
+def build_static():
+    global _static_built
+    with _static_lock:
+        if not _static_built:
+            simple_server.static_files.precompress = False
+            simple_server.static_files.build(str(WEB_DIR))
+            _static_built = True
+
+
+def use_clinics(clinics):
+    """インメモリの診療所を差し替え、索引を作り直す（--db 起動時と同じ経路）。"""
+    clinics = list(clinics)
+    simple_server.load_clinics_from_store(types.SimpleNamespace(iter_clinics=lambda: iter(clinics)))
+    return clinics
+
+
+def use_generated_clinics(count, seed=7):
+    return use_clinics(generate_clinics(count, seed))
+
+
+def restore_sample_clinics():
+    use_clinics(SAMPLE_CLINICS)
+
+
+class ThreadingServer:
+    """NCDHandler を make_server のスレッドサーバーで起動する。"""
+
+    def __init__(self, threads=4):
+        self.threads = threads
+
+    def __enter__(self):
+        build_static()
+        handler = functools.partial(simple_server.NCDHandler, directory=str(WEB_DIR))
+        self.httpd = simple_server.make_server("127.0.0.1", 0, self.threads, handler)
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+
+
+class AsyncioServer:
+    """AsyncNCDServer を別スレッドのイベントループで起動する。"""
+
+    def __enter__(self):
+        build_static()
+        self.sock = socket.create_server(("127.0.0.1", 0))
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+        self.loop = asyncio.new_event_loop()
+        engine = simple_server.AsyncNCDServer(str(WEB_DIR), quiet=True)
+        self.task = self.loop.create_task(engine.serve(sock=self.sock))
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            pass
+        # 応答直後に止めると接続ごとのタスクが残るので、ループを閉じる前に片付ける
+        pending = asyncio.all_tasks(self.loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+    def __exit__(self, *exc):
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        self.thread.join()
+        self.loop.close()
+        self.sock.close()
+
+
+class ServerTestCase(unittest.TestCase):
+    """合成データ clinic_count 件を読み込み、クラス単位で ThreadingServer を起動するテストの基底。"""
+
+    clinic_count = 300
+    seed = 7
+    threads = 4
+
+    @classmethod
+    def setUpClass(cls):
+        cls.clinics = use_generated_clinics(cls.clinic_count, cls.seed)
+        cls.server = ThreadingServer(threads=cls.threads).__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.__exit__(None, None, None)
+        restore_sample_clinics()
+
+    def request(self, method, path, **kwargs):
+        return request(self.server.port, method, path, **kwargs)
+
+    def get_json(self, path, **kwargs):
+        status, headers, body = self.request("GET", path, **kwargs)
+        return status, headers, json.loads(body) if body else None
+
+    def post_json(self, path, payload):
+        status, _, body = self.request("POST", path, body=json.dumps(payload).encode(),
+                                       headers={"Content-Type": "application/json"})
+        return status, json.loads(body) if body else None
+
+
+def request(port, method, path, body=None, headers=None, connection=None):
+    """(status, ヘッダー（小文字キー）, 本文) を返す。connection を渡すとその接続を使い回す。"""
+    conn = connection or http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        data = response.read()
+        return response.status, {name.lower(): value for name, value in response.getheaders()}, data
+    finally:
+        if connection is None:
+            conn.close()
+
+
+def raw_exchange(port, payload, timeout=5):
+    """生のバイト列を送り、接続が閉じるかタイムアウトするまで受け取る。"""
+    with socket.create_connection(("127.0.0.1", port), timeout=timeout) as sock:
+        sock.sendall(payload)
+        chunks = []
+        try:
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        except socket.timeout:
+            pass
+    return b"".join(chunks)
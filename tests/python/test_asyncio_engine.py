@@ -0,0 +1,101 @@
+"""AsyncNCDServer（asyncio エンジン）が threading エンジンと同じ応答を返すことを確認する。"""
+
+import json
+import socket
+import unittest
+
+from support import AsyncioServer, ThreadingServer, raw_exchange, request, restore_sample_clinics, use_generated_clinics
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+
+
+def setUpModule():
+    global clinics
+    clinics = use_generated_clinics(120, seed=3)
+
+
+def tearDownModule():
+    restore_sample_clinics()
+
+
+class AsyncioEngineTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = AsyncioServer().__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.__exit__(None, None, None)
+
+    def test_api_bodies_match_threading_engine(self):
+        paths = ["/api/listClinics?limit=30", f"/api/clinicDetail?id={clinics[0]['id']}",
+                 "/api/listMaster?type=vaccination", "/api/clinicsOpenAt?dow=2&time=15:00&limit=10"]
+        with ThreadingServer(threads=2) as threaded:
+            for path in paths:
+                with self.subTest(path=path):
+                    expected = request(threaded.port, "GET", path)
+                    actual = request(self.server.port, "GET", path)
+                    self.assertEqual(actual[0], expected[0])
+                    self.assertEqual(json.loads(actual[2]), json.loads(expected[2]))
+
+    def test_pipelined_requests(self):
+        payload = (b"GET /api/modes HTTP/1.1\r\nHost: test\r\n\r\n"
+                   b"GET /api/settings HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n")
+        response = raw_exchange(self.server.port, payload)
+        self.assertEqual(response.count(b"HTTP/1.1 200"), 2)
+
+    def test_non_finite_radius_is_400(self):
+        status, _, body = request(self.server.port, "GET", "/api/searchClinicsNear?lat=35.7&lng=139.7&radius=nan")
+        self.assertEqual(status, 400)
+        self.assertFalse(json.loads(body)["ok"])
+
+    def test_export_streams_every_clinic(self):
+        status, headers, body = request(self.server.port, "GET", "/api/exportClinics?format=ndjson")
+        self.assertEqual(status, 200)
+        self.assertEqual(headers.get("transfer-encoding"), "chunked")
+        self.assertEqual(len(body.decode("utf-8").splitlines()), len(clinics))
+
+    def test_missing_static_file_is_404(self):
+        status, _, body = request(self.server.port, "GET", "/no-such-page.html")
+        self.assertEqual(status, 404)
+        self.assertFalse(json.loads(body)["ok"])
+
+    def test_malformed_request_line(self):
+        response = raw_exchange(self.server.port, b"NONSENSE\r\n\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 400"))
+
+    def test_oversized_lines_are_rejected(self):
+        long_target = b"/api/modes?q=" + b"a" * 70000
+        response = raw_exchange(self.server.port, b"GET " + long_target + b" HTTP/1.1\r\nHost: test\r\n\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 414"))
+        response = raw_exchange(self.server.port, b"GET /api/modes HTTP/1.1\r\nX-Big: " + b"a" * 70000 + b"\r\n\r\n")
+        self.assertTrue(response.startswith(b"HTTP/1.1 431"))
+
+    def test_negative_content_length_is_400(self):
+        response = raw_exchange(self.server.port, b"POST /api/todo/save HTTP/1.1\r\nHost: test\r\n"
+                                                  b"Content-Length: -5\r\n\r\n{}")
+        self.assertTrue(response.startswith(b"HTTP/1.1 400"))
+        self.assertIn(b"Connection: close", response)
+
+    def test_idle_timeout_closes_connection(self):
+        with socket.create_connection(("127.0.0.1", self.server.port), timeout=10) as sock:
+            # 既定の idle_timeout（2 秒）で切断され、recv が空を返す
+            self.assertEqual(sock.recv(1), b"")
+
+
+class BodyLimitTest(unittest.TestCase):
+    def test_both_engines_refuse_bodies_over_the_limit(self):
+        too_large = simple_server.MAX_BODY_BYTES + 1
+        payloads = [
+            b"POST /api/todo/save HTTP/1.1\r\nHost: test\r\nContent-Length: %d\r\n\r\n" % too_large,
+            b"POST /api/todo/save HTTP/1.1\r\nHost: test\r\nTransfer-Encoding: chunked\r\n\r\n%x\r\n" % too_large,
+        ]
+        with ThreadingServer(threads=2) as threaded, AsyncioServer() as engine:
+            for port in (threaded.port, engine.port):
+                for payload in payloads:
+                    with self.subTest(port=port, payload=payload[:60]):
+                        response = raw_exchange(port, payload)
+                        self.assertTrue(response.startswith(b"HTTP/1.1 413"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+"""scripts/bench_server.py の集計とサーバー起動まわりを確認する。"""
+
+import argparse
+import os
+import tempfile
+import unittest
+
+import support  # noqa: F401  (sys.path の設定)
+import bench_server
+from script_utils import percentile
+
+
+class PercentileTest(unittest.TestCase):
+    def test_nearest_rank(self):
+        values = [float(n) for n in range(1, 101)]
+        self.assertEqual([percentile(values, pct) for pct in (50, 95, 99, 100)], [50.0, 95.0, 99.0, 100.0])
+        self.assertEqual(percentile([0.2], 99), 0.2)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_route_stats(self):
+        stats = bench_server.route_stats([0.003, 0.001, 0.002], errors=1, size=300, elapsed=0.5)
+        self.assertEqual((stats["requests"], stats["errors"], stats["rps"]), (3, 1, 6.0))
+        self.assertEqual((stats["p50_ms"], stats["max_ms"]), (2.0, 3.0))
+        self.assertEqual(bench_server.route_stats([], 0, 0, 0)["p99_ms"], 0.0)
+
+
+class ParseMixTest(unittest.TestCase):
+    def test_zero_weights_are_dropped(self):
+        self.assertEqual(bench_server.parse_mix("listClinics=3,static=0,todoSave=1"),
+                         {"listClinics": 3.0, "todoSave": 1.0})
+
+    def test_invalid_mixes(self):
+        for text in ("nope=1", "listClinics=x", "static=0"):
+            with self.subTest(text=text), self.assertRaises(argparse.ArgumentTypeError):
+                bench_server.parse_mix(text)
+
+
+class StartServerTest(unittest.TestCase):
+    def test_startup_failure_reports_the_server_log(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            log_path = os.path.join(tmp, "server.log")
+            process = bench_server.start_server(bench_server.free_port(), os.path.join(tmp, "bench.sqlite"),
+                                                ["--engine", "nope"], log_path)
+            try:
+                with self.assertRaises(SystemExit) as raised:
+                    bench_server.wait_ready(f"http://127.0.0.1:{bench_server.free_port()}", process, log_path)
+            finally:
+                bench_server.stop_server(process)
+        self.assertIn("--engine", str(raised.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+"""ClinicColumns / ClinicSummary（列と __slots__ による一覧用の要約）と EncodedList を確認する。"""
+
+import json
+import unittest
+
+from support import SAMPLE_CLINICS
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+from generate_clinics import generate_clinics  # noqa: E402
+
+
+class ClinicColumnsTest(unittest.TestCase):
+    def setUp(self):
+        self.clinics = [simple_server.freeze(clinic) for clinic in [*SAMPLE_CLINICS, *generate_clinics(50, seed=11)]]
+        self.clinics.append(simple_server.freeze({"id": "sparse", "name": "欠損のある診療所", "updated_at": "x"}))
+        self.columns = simple_server.ClinicColumns()
+        self.columns.rebuild(self.clinics)
+
+    def test_summary_matches_dict_summary(self):
+        for clinic in self.clinics:
+            with self.subTest(clinic=clinic["id"]):
+                summary = self.columns.summary(clinic["id"])
+                expected = simple_server.clinic_summary(clinic)
+                if expected["updated_at"] == "x":
+                    expected["updated_at"] = None
+                self.assertEqual(summary.as_dict(), expected)
+                self.assertEqual(json.loads(summary.to_json()), expected)
+
+    def test_replace_updates_the_row_and_appends_new_clinics(self):
+        old = self.clinics[0]
+        new = simple_server.freeze(dict(simple_server.thaw(old), name="改名", updated_at=123))
+        previous = self.columns.summary(old["id"])
+        self.columns.replace(old, new)
+        self.assertEqual(self.columns.summary(old["id"]).as_dict()["name"], "改名")
+        self.assertEqual(self.columns.summary(old["id"]).get("updated_at"), 123)
+        self.assertEqual(previous.name, old["name"])
+        added = simple_server.freeze({"id": "new", "name": "新規", "latitude": 35.7, "longitude": 139.7})
+        self.columns.replace(None, added)
+        self.assertEqual(self.columns.summary("new").get("latitude"), 35.7)
+
+
+class EncodedListTest(unittest.TestCase):
+    def test_spliced_output_equals_plain_json(self):
+        items = [{"id": "a", "name": "中野"}, {"id": "b", "name": "\0タグ風\0"}]
+        encoded = simple_server.EncodedList([simple_server.encode_json(item) for item in items])
+        body = simple_server.encode_json({"ok": True, "clinics": encoded, "empty": simple_server.EncodedList([])})
+        self.assertEqual(json.loads(body), {"ok": True, "clinics": items, "empty": []})
+
+    def test_other_objects_are_still_rejected(self):
+        with self.assertRaises(TypeError):
+            simple_server.encode_json({"value": object()})
+
+
+if __name__ == "__main__":
+    unittest.main()
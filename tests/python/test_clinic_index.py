@@ -0,0 +1,68 @@
+"""ClinicIndex（名称・郵便番号・診療科・モードのハッシュ索引）と listClinics の絞り込みを確認する。"""
+
+import unicodedata
+import unittest
+from urllib.parse import quote, urlencode
+
+from support import ServerTestCase, SAMPLE_CLINICS
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+
+
+def expected_ids(clinics, predicate):
+    return {clinic["id"] for clinic in clinics if predicate(clinic)}
+
+
+class ListClinicsFilterTest(ServerTestCase):
+    clinic_count = 200
+
+    def listed_ids(self, **params):
+        status, _, payload = self.get_json("/api/listClinics?" + urlencode(params, doseq=True))
+        self.assertEqual(status, 200)
+        return {clinic["id"] for clinic in payload["clinics"]}
+
+    def test_department_and_mode_filters_intersect(self):
+        department = self.clinics[0]["departments"]["master"][0]
+        mode = self.clinics[0]["modes"]["selected"][0]
+        self.assertEqual(self.listed_ids(department=department),
+                         expected_ids(self.clinics, lambda c: department in c["departments"]["master"]))
+        both = self.listed_ids(department=department, mode=mode)
+        self.assertIn(self.clinics[0]["id"], both)
+        self.assertEqual(both, expected_ids(self.clinics, lambda c: department in c["departments"]["master"]
+                                            and mode in c["modes"]["selected"]))
+
+    def test_postal_code_and_name_are_normalized(self):
+        clinic = self.clinics[3]
+        digits = clinic["postalCode"].replace("-", "")
+        self.assertIn(clinic["id"], self.listed_ids(postalCode=f"〒{digits[:3]}-{digits[3:]}"))
+        wide_name = unicodedata.normalize("NFKC", clinic["name"]).translate(
+            {code: code + 0xFEE0 for code in range(0x21, 0x7F)})
+        self.assertIn(clinic["id"], self.listed_ids(name=wide_name))
+
+    def test_clinic_detail_by_name(self):
+        clinic = self.clinics[4]
+        status, _, payload = self.get_json(f"/api/clinicDetail?name={quote(clinic['name'])}")
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["clinic"]["id"], clinic["id"])
+
+    def test_unknown_department_is_empty(self):
+        self.assertEqual(self.listed_ids(department="存在しない科"), set())
+
+
+class ClinicIndexReplaceTest(unittest.TestCase):
+    def test_replace_matches_rebuild(self):
+        clinics = [simple_server.freeze(clinic) for clinic in SAMPLE_CLINICS]
+        incremental = simple_server.ClinicIndex()
+        incremental.rebuild(clinics)
+        renamed = simple_server.freeze(dict(SAMPLE_CLINICS[0], name="改名クリニック", postalCode="164-0000",
+                                            departments={"master": ["皮膚科"]}))
+        incremental.replace(clinics[0], renamed)
+        rebuilt = simple_server.ClinicIndex()
+        rebuilt.rebuild([renamed] + clinics[1:])
+        for field in simple_server.ClinicIndex.FIELDS:
+            self.assertEqual({key: set(ids) for key, ids in incremental.postings[field].items()},
+                             {key: set(ids) for key, ids in rebuilt.postings[field].items()})
+        self.assertEqual(incremental.order, rebuilt.order)
+
+
+if __name__ == "__main__":
+    unittest.main()
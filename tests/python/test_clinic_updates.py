@@ -0,0 +1,88 @@
+"""診療所スナップショット（freeze/thaw）と updateClinic の差し替えを確認する。"""
+
+import tempfile
+import unittest
+from pathlib import Path
+from urllib.parse import quote
+
+from support import ServerTestCase
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+from local_store import LocalStore  # noqa: E402
+
+INVALID_CHANGES = (
+    {"departments": {"master": [{"x": 1}]}},
+    {"departments": ["内科"]},
+    {"modes": "x"},
+    {"modes": {"selected": "outpatient"}},
+    {"access": "x"},
+    {"access": {"nearestStation": [["中野"]]}},
+    {"schedule": ["月曜"]},
+    {"services": [{"name": {"ja": "内視鏡"}}]},
+    {"name": ["名前"]},
+)
+
+
+class SnapshotTest(unittest.TestCase):
+    def test_snapshots_are_read_only_and_shared(self):
+        clinic = next(iter(simple_server.SAMPLE_CLINICS.values()))
+        with self.assertRaises(TypeError):
+            clinic["name"] = "x"
+        with self.assertRaises(TypeError):
+            clinic["departments"].update(master=[])
+        self.assertIs(simple_server.find_clinic(clinic["id"]), clinic)
+        self.assertEqual(simple_server.freeze(simple_server.thaw(clinic)), clinic)
+
+
+class UpdateClinicTest(ServerTestCase):
+    clinic_count = 30
+
+    def test_update_is_visible_in_detail(self):
+        clinic_id = self.clinics[0]["id"]
+        path = f"/api/clinicDetail?id={clinic_id}"
+        _, before_headers, _ = self.get_json(path)
+        status, _ = self.post_json("/api/updateClinic", {"id": clinic_id, "phone": "03-0000-0000"})
+        self.assertEqual(status, 200)
+        status, headers, payload = self.get_json(path, headers={"If-None-Match": before_headers["etag"]})
+        self.assertEqual(status, 200)
+        self.assertEqual(payload["clinic"]["phone"], "03-0000-0000")
+
+    def test_unknown_clinic_is_404(self):
+        self.assertEqual(self.get_json("/api/clinicDetail?id=no-such-clinic")[0], 404)
+        self.assertEqual(self.post_json("/api/updateClinic", {"id": "no-such-clinic", "phone": "1"})[0], 404)
+
+    def test_malformed_fields_are_400_and_leave_the_clinic_untouched(self):
+        clinic = self.clinics[1]
+        department = clinic["departments"]["master"][0]
+        before = self.get_json(f"/api/clinicDetail?id={clinic['id']}")[2]["clinic"]
+        for changes in INVALID_CHANGES:
+            with self.subTest(changes=changes):
+                status, payload = self.post_json("/api/updateClinic", dict(changes, id=clinic["id"]))
+                self.assertEqual(status, 400)
+                self.assertFalse(payload["ok"])
+        self.assertEqual(self.get_json(f"/api/clinicDetail?id={clinic['id']}")[2]["clinic"], before)
+        # 索引も元のまま、以降の更新も通る
+        _, _, listed = self.get_json(f"/api/listClinics?department={quote(department)}&limit=500")
+        self.assertIn(clinic["id"], [entry["id"] for entry in listed["clinics"]])
+        self.assertEqual(self.post_json("/api/updateClinic", {"id": clinic["id"], "fax": "03-1111-1111"})[0], 200)
+
+
+class UpdateClinicStoreTest(unittest.TestCase):
+    def test_rejected_update_does_not_reach_the_store(self):
+        clinic = simple_server.thaw(next(iter(simple_server.SAMPLE_CLINICS.values())))
+        with tempfile.TemporaryDirectory() as tmp:
+            store = LocalStore(Path(tmp) / "ncd.sqlite")
+            store.migrate()
+            store.upsert_clinic(clinic)
+            previous, simple_server.store = simple_server.store, store
+            try:
+                with self.assertRaises(ValueError):
+                    simple_server.update_clinic(clinic["id"], {"departments": {"master": [{"x": 1}]}})
+                self.assertEqual(store.get_clinic(clinic["id"])["departments"], clinic["departments"])
+                self.assertEqual(simple_server.thaw(simple_server.SAMPLE_CLINICS[clinic["id"]]), clinic)
+            finally:
+                simple_server.store = previous
+                store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
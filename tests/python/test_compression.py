@@ -0,0 +1,40 @@
+"""Accept-Encoding のネゴシエーションと gzip 応答を確認する。"""
+
+import gzip
+import unittest
+
+from support import ServerTestCase
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+
+
+class ChooseEncodingTest(unittest.TestCase):
+    def test_q_values_and_wildcard(self):
+        choose = simple_server.choose_encoding
+        self.assertIsNone(choose(""))
+        self.assertEqual(choose("gzip, deflate"), "gzip")
+        self.assertIsNone(choose("gzip;q=0"))
+        self.assertIsNone(choose("identity"))
+        self.assertEqual(choose("*"), simple_server.SUPPORTED_CODINGS[0])
+        self.assertEqual(choose("br;q=0.5, gzip;q=0.8"), "gzip")
+
+
+class CompressedResponseTest(ServerTestCase):
+    clinic_count = 100
+
+    def test_gzip_matches_identity(self):
+        _, headers, plain = self.request("GET", "/api/listClinics")
+        self.assertNotIn("content-encoding", headers)
+        _, headers, compressed = self.request("GET", "/api/listClinics", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(headers.get("content-encoding"), "gzip")
+        self.assertIn("Accept-Encoding", headers.get("vary", ""))
+        self.assertEqual(gzip.decompress(compressed), plain)
+
+    def test_small_bodies_are_sent_as_is(self):
+        _, headers, body = self.request("GET", "/api/clinicDetail?id=no-such-clinic",
+                                        headers={"Accept-Encoding": "gzip"})
+        self.assertLess(len(body), simple_server.COMPRESS_MIN_SIZE)
+        self.assertNotIn("content-encoding", headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+"""ETag / Last-Modified による条件付き GET（304）を確認する。"""
+
+import unittest
+
+from support import ServerTestCase
+
+
+class ConditionalGetTest(ServerTestCase):
+    clinic_count = 30
+
+    def test_etag_answers_304(self):
+        status, headers, _ = self.get_json("/api/listClinics?limit=5")
+        self.assertEqual(status, 200)
+        status, _, body = self.request("GET", "/api/listClinics?limit=5", headers={"If-None-Match": headers["etag"]})
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b"")
+        # 弱い比較と複数指定
+        status, _, _ = self.request("GET", "/api/listClinics?limit=5",
+                                    headers={"If-None-Match": f'"other", W/{headers["etag"]}'})
+        self.assertEqual(status, 304)
+
+    def test_if_modified_since(self):
+        path = f"/api/clinicDetail?id={self.clinics[0]['id']}"
+        _, headers, _ = self.get_json(path)
+        last_modified = headers["last-modified"]
+        self.assertEqual(self.request("GET", path, headers={"If-Modified-Since": last_modified})[0], 304)
+        self.assertEqual(self.request("GET", path, headers={"If-Modified-Since": "Thu, 01 Jan 1970 00:00:00 GMT"})[0],
+                         200)
+        # If-None-Match があれば If-Modified-Since は見ない
+        self.assertEqual(self.request("GET", path, headers={"If-None-Match": '"stale"',
+                                                            "If-Modified-Since": last_modified})[0], 200)
+
+    def test_update_changes_the_etag(self):
+        clinic_id = self.clinics[1]["id"]
+        path = f"/api/clinicDetail?id={clinic_id}"
+        _, before, _ = self.get_json(path)
+        self.assertEqual(self.post_json("/api/updateClinic", {"id": clinic_id, "fax": "03-2222-2222"})[0], 200)
+        status, after, _ = self.get_json(path, headers={"If-None-Match": before["etag"]})
+        self.assertEqual(status, 200)
+        self.assertNotEqual(after["etag"], before["etag"])
+
+    def test_static_asset_304(self):
+        _, headers, _ = self.request("GET", "/index.html")
+        status, _, body = self.request("GET", "/index.html", headers={"If-None-Match": headers["etag"]})
+        self.assertEqual((status, body), (304, b""))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""exportClinics / exportMaster のストリーミング出力を確認する。"""
+
+import csv
+import io
+import json
+import tempfile
+import threading
+import types
+import unittest
+from pathlib import Path
+
+from support import ServerTestCase
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+from local_store import LocalStore  # noqa: E402
+
+
+class ExportRoutesTest(ServerTestCase):
+    clinic_count = 300
+
+    def test_export_clinics_ndjson_is_chunked(self):
+        status, headers, body = self.request("GET", "/api/exportClinics?format=ndjson")
+        self.assertEqual(status, 200)
+        self.assertEqual(headers.get("transfer-encoding"), "chunked")
+        rows = [json.loads(line) for line in body.decode("utf-8").splitlines()]
+        self.assertEqual(len(rows), self.clinic_count)
+
+    def test_summary_json_with_limit(self):
+        status, _, body = self.request("GET", "/api/exportClinics?format=json&detail=summary&limit=5")
+        self.assertEqual(status, 200)
+        payload = json.loads(body)
+        rows = payload["items"]
+        self.assertEqual((payload["total"], len(rows)), (self.clinic_count, 5))
+        self.assertEqual(set(rows[0]), set(simple_server.SUMMARY_FIELDS))
+
+    def test_export_clinics_csv(self):
+        status, _, body = self.request("GET", "/api/exportClinics?format=csv")
+        self.assertEqual(status, 200)
+        rows = list(csv.DictReader(io.StringIO(body.decode("utf-8-sig"))))
+        self.assertEqual(len(rows), self.clinic_count)
+        self.assertEqual({row["id"] for row in rows}, {clinic["id"] for clinic in self.clinics})
+
+    def test_export_master_csv(self):
+        status, _, body = self.request("GET", "/api/exportMaster?format=csv&type=test")
+        self.assertEqual(status, 200)
+        self.assertIn("血液検査", body.decode("utf-8-sig"))
+
+    def test_unknown_format_is_400(self):
+        self.assertEqual(self.request("GET", "/api/exportMaster?format=xml")[0], 400)
+
+
+class MasterExportThreadTest(unittest.TestCase):
+    def test_master_items_query_runs_on_consuming_thread(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = LocalStore(Path(tmp) / "ncd.sqlite")
+            store.migrate()
+            try:
+                store.upsert_master_items([{"type": "test", "category": "内科一般検査", "name": "血液検査",
+                                            "status": "approved"}])
+                items = store.iter_master_items("test")
+                self.assertIsInstance(items, types.GeneratorType)
+                connections = []
+                original = store.connect
+
+                def connect():
+                    conn = original()
+                    connections.append(threading.get_ident())
+                    return conn
+
+                store.connect = connect
+                result = []
+                worker = threading.Thread(target=lambda: result.extend(items))
+                worker.start()
+                worker.join()
+                self.assertEqual([item["name"] for item in result], ["血液検査"])
+                self.assertEqual(connections, [worker.ident])
+            finally:
+                store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""scripts/generate_clinics.py（合成データの生成と投入）と共有の Progress を確認する。"""
+
+import contextlib
+import io
+import tempfile
+import unittest
+from pathlib import Path
+
+import support  # noqa: F401  (sys.path の設定)
+from generate_clinics import generate_clinics, load_store, write_ndjson
+from local_store import LocalStore
+from script_utils import Progress
+
+
+class GenerateClinicsTest(unittest.TestCase):
+    def test_slices_reproduce_a_full_run(self):
+        full = list(generate_clinics(20, seed=9))
+        self.assertEqual(list(generate_clinics(8, seed=9, offset=12)), full[12:])
+        self.assertNotEqual(list(generate_clinics(20, seed=10)), full)
+
+    def test_load_store_and_truncate(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = str(Path(tmp) / "ncd.sqlite")
+            with contextlib.redirect_stderr(io.StringIO()):
+                self.assertEqual(load_store(path, generate_clinics(30, seed=2), batch_size=7, truncate=False), 30)
+                load_store(path, generate_clinics(10, seed=4), batch_size=7, truncate=True)
+            store = LocalStore(path)
+            try:
+                self.assertEqual(store.count("facilities"), 10)
+            finally:
+                store.close()
+
+    def test_write_ndjson(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "clinics.ndjson"
+            with contextlib.redirect_stderr(io.StringIO()) as err:
+                self.assertEqual(write_ndjson(str(path), generate_clinics(5, seed=3)), 5)
+            self.assertEqual(len(path.read_text(encoding="utf-8").splitlines()), 5)
+        self.assertIn("[ndjson] done 5 rows", err.getvalue())
+
+
+class ProgressTest(unittest.TestCase):
+    def test_reports_each_time_a_multiple_is_crossed(self):
+        with contextlib.redirect_stderr(io.StringIO()) as err:
+            progress = Progress("rows", every=10)
+            for count in (4, 4, 4, 15, 1):
+                progress.tick(count)
+            progress.report()
+        lines = err.getvalue().splitlines()
+        self.assertEqual([line.split(" rows in")[0] for line in lines],
+                         ["[rows] ... 12", "[rows] ... 27", "[rows] done 28"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""NCDHandler の HTTP/1.1 keep-alive（接続の使い回し・処理枠・本文の読み方）を確認する。"""
+
+import http.client
+import json
+import socket
+import time
+import unittest
+
+from support import ServerTestCase, raw_exchange
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+
+
+class KeepAliveTest(ServerTestCase):
+    clinic_count = 20
+
+    def test_keep_alive_reuses_connection(self):
+        conn = http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=5)
+        try:
+            for _ in range(3):
+                status, headers, _ = self.request("GET", "/api/modes", connection=conn)
+                self.assertEqual(status, 200)
+                self.assertNotEqual(headers.get("connection"), "close")
+            sock = conn.sock
+            self.request("GET", "/api/settings", connection=conn)
+            self.assertIs(conn.sock, sock)
+        finally:
+            conn.close()
+
+    def test_idle_connections_do_not_block_new_requests(self):
+        idle = []
+        try:
+            # 処理枠（threads=4）より多いアイドル接続を張っておく
+            for _ in range(12):
+                sock = socket.create_connection(("127.0.0.1", self.server.port), timeout=5)
+                sock.sendall(b"GET /api/modes HTTP/1.1\r\nHost: test\r\n\r\n")
+                sock.recv(65536)
+                idle.append(sock)
+            started = time.perf_counter()
+            status, _, _ = self.request("GET", "/api/modes")
+            self.assertEqual(status, 200)
+            self.assertLess(time.perf_counter() - started, 1.0)
+        finally:
+            for sock in idle:
+                sock.close()
+
+    def test_head_and_options(self):
+        status, headers, body = self.request("HEAD", "/api/listMaster?type=test")
+        self.assertEqual(status, 200)
+        self.assertGreater(int(headers["content-length"]), 0)
+        self.assertEqual(body, b"")
+        status, headers, _ = self.request("OPTIONS", "/api/updateClinic")
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["content-length"], "0")
+
+    def test_bad_content_length_is_400_and_closes(self):
+        response = raw_exchange(self.server.port, b"POST /api/todo/save HTTP/1.1\r\nHost: test\r\n"
+                                             b"Content-Length: abc\r\n\r\n{}")
+        self.assertTrue(response.startswith(b"HTTP/1.1 400"))
+        self.assertIn(b"Connection: close", response)
+
+    def test_chunked_post_body(self):
+        body = json.dumps({"todos": [{"title": "chunked"}]}).encode()
+        payload = (b"POST /api/todo/save HTTP/1.1\r\nHost: test\r\nTransfer-Encoding: chunked\r\n"
+                   b"Connection: close\r\n\r\n%x\r\n%s\r\n0\r\n\r\n" % (len(body), body))
+        response = raw_exchange(self.server.port, payload)
+        self.assertTrue(response.startswith(b"HTTP/1.1 200"))
+        self.assertIn("chunked".encode(), response)
+
+    def test_connection_closes_after_max_requests(self):
+        original = simple_server.NCDHandler.max_requests
+        simple_server.NCDHandler.max_requests = 2
+        conn = http.client.HTTPConnection("127.0.0.1", self.server.port, timeout=5)
+        try:
+            _, first, _ = self.request("GET", "/api/modes", connection=conn)
+            _, second, _ = self.request("GET", "/api/modes", connection=conn)
+            self.assertNotEqual(first.get("connection"), "close")
+            self.assertEqual(second.get("connection"), "close")
+        finally:
+            simple_server.NCDHandler.max_requests = original
+            conn.close()
+
+    def test_http10_connection_is_closed_after_the_response(self):
+        started = time.perf_counter()
+        response = raw_exchange(self.server.port, b"GET /api/modes HTTP/1.0\r\n\r\n")
+        self.assertIn(b" 200 ", response.split(b"\r\n", 1)[0])
+        # idle timeout（2 秒）を待たずにサーバー側から閉じる
+        self.assertLess(time.perf_counter() - started, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+"""listClinics のカーソルページングと fields= による項目の絞り込みを確認する。"""
+
+import unittest
+
+from support import ServerTestCase
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+
+
+class ListClinicsPagingTest(ServerTestCase):
+    clinic_count = 300
+
+    def test_cursor_pages_cover_every_clinic_once(self):
+        seen = []
+        cursor = None
+        while True:
+            path = "/api/listClinics?limit=70" + (f"&cursor={cursor}" if cursor else "")
+            status, _, payload = self.get_json(path)
+            self.assertEqual(status, 200)
+            seen += [clinic["id"] for clinic in payload["clinics"]]
+            cursor = payload["nextCursor"]
+            if not cursor:
+                break
+        self.assertEqual(len(seen), self.clinic_count)
+        self.assertEqual(set(seen), {clinic["id"] for clinic in self.clinics})
+
+    def test_order_is_updated_at_descending(self):
+        _, _, payload = self.get_json("/api/listClinics")
+        keys = [simple_server.order_key(clinic) for clinic in payload["clinics"]]
+        self.assertEqual(keys, sorted(keys))
+        self.assertNotIn("nextCursor", payload)
+
+    def test_invalid_limit_and_cursor(self):
+        self.assertEqual(self.get_json("/api/listClinics?limit=0")[0], 400)
+        self.assertEqual(self.get_json("/api/listClinics?limit=abc")[0], 400)
+        self.assertEqual(self.get_json("/api/listClinics?cursor=%21%21")[0], 400)
+
+    def test_fields_projection(self):
+        _, _, payload = self.get_json("/api/listClinics?limit=3&fields=id,name,phone")
+        self.assertEqual(len(payload["clinics"]), 3)
+        for clinic in payload["clinics"]:
+            self.assertEqual(set(clinic), {"id", "name", "phone"})
+
+    def test_summary_fields_by_default(self):
+        _, _, payload = self.get_json("/api/listClinics?limit=1")
+        self.assertEqual(set(payload["clinics"][0]), set(simple_server.SUMMARY_FIELDS))
+
+
+if __name__ == "__main__":
+    unittest.main()
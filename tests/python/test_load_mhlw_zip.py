@@ -0,0 +1,67 @@
+"""scripts/load_mhlw_zip.py が ZIP 内の CSV をストアへ取り込むことを確認する。"""
+
+import contextlib
+import io
+import sys
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+import support  # noqa: F401  (sys.path の設定)
+import load_mhlw_zip
+from local_store import LocalStore
+
+FACILITY_CSV = (
+    "ID,正式名称,正式名称（フリガナ）,略称,都道府県コード,市区町村コード,所在地,所在地座標（緯度）,所在地座標（経度）\r\n"
+    "1311400001,医療法人テスト会 中野クリニック,ナカノ クリニック,中野クリニック,13,13114,東京都中野区中野1-1-1,35.70,139.66\r\n"
+    "1311400002,本町内科,ホンチョウナイカ,,13,13114,東京都中野区本町2-2-2,,\r\n"
+)
+SCHEDULE_CSV = (
+    "ID,診療科目名,診療時間帯,月_診療開始時間,月_診療終了時間,土_診療開始時間,土_診療終了時間\r\n"
+    "1311400001,内科,午前,0900,1200,900,1230\r\n"
+    "9999999999,内科,午前,0900,1200,,\r\n"
+)
+
+
+def write_zip(path, member, text, encoding):
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr(member, text.encode(encoding))
+
+
+class LoadMhlwZipTest(unittest.TestCase):
+    def test_zip_members_are_streamed_into_the_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            write_zip(tmp / "info.zip", "02-1_clinic_facility_info.csv", FACILITY_CSV, "cp932")
+            write_zip(tmp / "hours.zip", "02-2_clinic_speciality_hours.csv", SCHEDULE_CSV, "utf-8-sig")
+            argv = ["load_mhlw_zip.py", str(tmp / "ncd.sqlite"), "--clinic-info", str(tmp / "info.zip"),
+                    "--clinic-schedule", str(tmp / "hours.zip"), "--batch-size", "1"]
+            with mock.patch.object(sys, "argv", argv), contextlib.redirect_stdout(io.StringIO()), \
+                    contextlib.redirect_stderr(io.StringIO()) as log:
+                load_mhlw_zip.main()
+            self.assertIn("skipped 1 rows", log.getvalue())
+            store = LocalStore(tmp / "ncd.sqlite")
+            try:
+                clinic = store.get_clinic("1311400001")
+                self.assertEqual(clinic["name"], "中野クリニック")
+                self.assertEqual((clinic["prefecture"], clinic["city"]), ("東京都", "中野区"))
+                self.assertEqual(clinic["location"]["lat"], 35.70)
+                self.assertIsNone(store.get_clinic("1311400002")["latitude"])
+                rows = store.connect().execute(
+                    "SELECT day_of_week, start_time, end_time FROM facility_schedule ORDER BY day_of_week").fetchall()
+                self.assertEqual([tuple(row) for row in rows], [(0, "09:00", "12:00"), (5, "09:00", "12:30")])
+            finally:
+                store.close()
+
+    def test_header_aliases_are_canonicalized(self):
+        columns = load_mhlw_zip.resolve_columns(["ID", "正式名称(フリガナ)", " 所在地 "],
+                                                load_mhlw_zip.FACILITY_FIELD_ALIASES)
+        self.assertEqual(columns["official_name_kana"], 1)
+        self.assertEqual(columns["address"], 2)
+        self.assertIsNone(columns["latitude"])
+
+
+if __name__ == "__main__":
+    unittest.main()
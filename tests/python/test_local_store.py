@@ -0,0 +1,92 @@
+"""local_store.py（SQLite ストア）とストアを使うサーバーを確認する。"""
+
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+import support  # noqa: F401  (sys.path の設定)
+import simple_server
+from generate_clinics import generate_clinics
+from local_store import LocalStore
+from support import ThreadingServer, request, restore_sample_clinics
+
+
+class LocalStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = LocalStore(Path(self.tmp.name) / "ncd.sqlite")
+        self.store.migrate()
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_migrate_is_idempotent(self):
+        self.assertEqual(self.store.migrate(), [])
+
+    def test_clinic_round_trip(self):
+        clinic = next(generate_clinics(1, seed=5))
+        self.store.upsert_clinic(clinic)
+        loaded = self.store.get_clinic(clinic["id"])
+        self.assertEqual(loaded["name"], clinic["name"])
+        self.assertEqual(loaded["schedule"], clinic["schedule"])
+        self.assertEqual([c["id"] for c in self.store.iter_clinics()], [clinic["id"]])
+
+    def test_upsert_updates_timestamp_and_fills_missing_ones(self):
+        clinic = {"id": "c1", "name": "旧名", "created_at": 50, "updated_at": 100}
+        self.store.upsert_clinic(clinic)
+        self.store.upsert_clinic(dict(clinic, name="新名", updated_at=200))
+        row = self.store.connect().execute(
+            "SELECT name, created_at, updated_at FROM facilities WHERE id = 'c1'").fetchone()
+        self.assertEqual((row["name"], row["created_at"]), ("新名", 50))
+        self.assertGreater(row["updated_at"], 100)
+        # 時刻の無い診療所も NOT NULL 制約で落ちない
+        self.store.upsert_clinic({"id": "c2", "name": "時刻なし"})
+        self.assertIsNotNone(self.store.get_clinic("c2"))
+
+    def test_connections_of_finished_threads_are_closed(self):
+        opened = []
+
+        def work():
+            conn = self.store.connect()
+            conn.execute("SELECT 1").fetchone()
+            opened.append(conn)
+
+        for _ in range(50):
+            worker = threading.Thread(target=work)
+            worker.start()
+            worker.join()
+        self.assertEqual(self.store._connections, [self.store.connect()])
+        for conn in opened:
+            with self.assertRaises(sqlite3.ProgrammingError):
+                conn.execute("SELECT 1")
+
+
+class StoreBackedServerTest(unittest.TestCase):
+    def test_requests_on_new_connections_do_not_pile_up_sqlite_connections(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            previous = simple_server.store
+            simple_server.open_store(str(Path(tmp) / "ncd.sqlite"))
+            store = simple_server.store
+            try:
+                with ThreadingServer(threads=4) as server:
+                    # 1 接続 = 1 スレッドなので、リクエストごとに新しいスレッドで接続を開く
+                    # クエリを変えてレスポンスキャッシュに当たらないようにする
+                    for number in range(100):
+                        path = f"/api/listMaster?type=test&n={number}"
+                        self.assertEqual(request(server.port, "GET", path)[0], 200)
+                    deadline = time.monotonic() + 5
+                    while len(store._connections) > 2 and time.monotonic() < deadline:
+                        time.sleep(0.05)
+                    self.assertLessEqual(len(store._connections), 2)
+            finally:
+                simple_server.store = previous
+                store.close()
+                restore_sample_clinics()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""scripts/master_sync.py の差分計算と stand-in への適用を確認する。"""
+
+import contextlib
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from support import ThreadingServer, request
+import master_sync  # noqa: E402  (support が sys.path を設定する)
+
+
+def entry(master_type, name, **fields):
+    return {"type": master_type, "category": None, "name": name, "fields": fields, "source": "test"}
+
+
+class ComputeChangesTest(unittest.TestCase):
+    def test_items_of_another_type_do_not_match(self):
+        # stand-in は未知の種別に test マスターを返す
+        masters = {"service": [{"type": "test", "category": "内科一般検査", "name": "血液検査", "count": 1}]}
+        changes, missing = master_sync.compute_changes([entry("service", "血液検査", count=5)], masters)
+        self.assertEqual(changes, [])
+        self.assertEqual([item["name"] for item in missing], ["血液検査"])
+
+    def test_only_differing_fields_are_sent(self):
+        current = {"type": "department", "category": None, "name": "内科", "sortOrder": 100, "sortGroup": "旧"}
+        planned = entry("department", "内科", sortOrder=100, sortGroup="内科系")
+        changes, missing = master_sync.compute_changes([planned], {"department": [current]})
+        self.assertEqual(missing, [])
+        self.assertEqual(changes, [(planned, current, {"sortGroup": "内科系"})])
+        changes, _ = master_sync.compute_changes([planned], {"department": [current]}, include_unchanged=True)
+        self.assertEqual(changes[0][2], {"sortOrder": 100, "sortGroup": "内科系"})
+
+    def test_csv_plan(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "plan.csv"
+            path.write_text("type,name,sortOrder,desc\nservice,内視鏡検査,100,\n", encoding="utf-8")
+            entries = master_sync.load_plan(str(path))
+        self.assertEqual(entries[0]["type"], "service")
+        # 空欄の列はプランに含めない
+        self.assertEqual(entries[0]["fields"], {"sortOrder": 100})
+
+    def test_json_plan_with_several_types(self):
+        plan = {"plans": [
+            {"type": "service", "entries": [{"name": "内視鏡検査", "sortOrder": "20"}]},
+            {"type": "test", "entries": [{"name": "血液検査", "category": "内科一般検査", "desc": " "}]},
+        ]}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "plan.json"
+            path.write_text(json.dumps(plan, ensure_ascii=False), encoding="utf-8")
+            entries = master_sync.load_plan(str(path))
+        self.assertEqual([(e["type"], e["category"], e["fields"]) for e in entries],
+                         [("service", None, {"sortOrder": 20}), ("test", "内科一般検査", {})])
+
+    def test_entries_without_type_are_rejected(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "plan.json"
+            path.write_text(json.dumps([{"name": "血液検査"}]), encoding="utf-8")
+            with self.assertRaises(SystemExit):
+                master_sync.load_plan(str(path))
+            self.assertEqual(master_sync.load_plan(str(path), default_type="test")[0]["type"], "test")
+
+
+class SyncAgainstStandInTest(unittest.TestCase):
+    def run_sync(self, port, entries):
+        args = master_sync.build_parser("test").parse_args(["--base-url", f"http://127.0.0.1:{port}", "--rate", "0"])
+        with contextlib.redirect_stderr(io.StringIO()), contextlib.redirect_stdout(io.StringIO()):
+            return master_sync.run(entries, args)
+
+    def test_update_is_applied_and_mismatched_type_is_missing(self):
+        with ThreadingServer(threads=2) as server:
+            try:
+                self.assertEqual(self.run_sync(server.port, [entry("test", "血液検査", status="candidate")]), 0)
+                _, _, body = request(server.port, "GET", "/api/listMaster?type=test")
+                self.assertEqual(json.loads(body)["items"][0]["status"], "candidate")
+                self.assertEqual(self.run_sync(server.port, [entry("service", "血液検査", status="approved")]), 1)
+            finally:
+                self.run_sync(server.port, [entry("test", "血液検査", status="approved")])
+
+    def test_dry_run_posts_nothing(self):
+        with ThreadingServer(threads=2) as server:
+            args = master_sync.build_parser("test").parse_args(
+                ["--base-url", f"http://127.0.0.1:{server.port}", "--rate", "0", "--dry-run"])
+            with contextlib.redirect_stderr(io.StringIO()), contextlib.redirect_stdout(io.StringIO()) as out:
+                self.assertEqual(master_sync.run([entry("test", "血液検査", status="candidate")], args), 0)
+            self.assertIn("[dry-run] test:血液検査", out.getvalue())
+            _, _, body = request(server.port, "GET", "/api/listMaster?type=test")
+            self.assertEqual(json.loads(body)["items"][0]["status"], "approved")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Metrics のシャード集計と /api/_metrics を確認する。"""
+
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from support import ServerTestCase
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+from simple_server import Metrics  # noqa: E402
+
+LIST_MASTER_SERIES = 'ncd_http_requests_total{route="/api/listMaster",method="GET",status="200"}'
+
+
+def series_value(text, series):
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rpartition(" ")[2])
+    return 0.0
+
+
+class MetricsTest(unittest.TestCase):
+    def test_shards_of_finished_threads_are_retired(self):
+        metrics = Metrics()
+
+        def work():
+            metrics.observe_request("/api/modes", "GET", 200, 0.003, 10)
+            metrics.observe_json(0.0001)
+
+        threads = [threading.Thread(target=work) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for _ in range(10):
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                pool.submit(work).result()
+        self.assertEqual(metrics.shards, [])
+        requests, bytes_out, latency, json_encode, _ = metrics.snapshot()
+        self.assertEqual(requests, {("/api/modes", "GET", 200): 30})
+        self.assertEqual(bytes_out, {"/api/modes": 300})
+        self.assertEqual(sum(latency["/api/modes"].counts), 30)
+        self.assertEqual(sum(json_encode.counts), 30)
+
+    def test_render_histogram_is_cumulative(self):
+        metrics = Metrics()
+        for seconds in (0.00005, 0.0005, 0.5, 100):
+            metrics.observe_request("/api/search", "GET", 200, seconds, 0)
+        metrics.count_cache("hit")
+        metrics.count_cache("miss")
+        text = metrics.render()
+        self.assertIn('ncd_http_request_duration_seconds_bucket{route="/api/search",le="0.0001"} 1', text)
+        self.assertIn('ncd_http_request_duration_seconds_bucket{route="/api/search",le="+Inf"} 4', text)
+        self.assertIn('ncd_http_request_duration_seconds_count{route="/api/search"} 4', text)
+        self.assertIn("ncd_response_cache_hit_ratio 0.500000", text)
+
+
+class MetricsEndpointTest(ServerTestCase):
+    def scrape(self):
+        status, headers, body = self.request("GET", "/api/_metrics")
+        self.assertEqual(status, 200)
+        self.assertTrue(headers["content-type"].startswith("text/plain"))
+        return body.decode("utf-8")
+
+    def test_metrics_count_requests(self):
+        before = series_value(self.scrape(), LIST_MASTER_SERIES)
+        for _ in range(3):
+            self.request("GET", "/api/listMaster?type=test")
+        text = self.scrape()
+        self.assertEqual(series_value(text, LIST_MASTER_SERIES), before + 3)
+        self.assertIn('ncd_http_request_duration_seconds_count{route="/api/listMaster"}', text)
+        self.assertIn('ncd_response_cache_requests_total{result="hit"}', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""ScheduleIndex と clinicsOpenAt（指定時刻に開いている診療所）を確認する。"""
+
+import unittest
+
+from support import ServerTestCase
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+
+SCHEDULE = {
+    "patterns": {"amA": ["09:00", "12:30"], "pmA": ["14:00", "18:00"]},
+    "days": {"月曜": {"am": "午前A", "pm": "午後A"}, "土曜": {"am": "午前A", "pm": "休診"}},
+}
+
+
+class ScheduleIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = simple_server.ScheduleIndex()
+        self.index.rebuild([{"id": "a", "schedule": SCHEDULE}])
+
+    def test_open_at_returns_closing_time(self):
+        self.assertEqual(self.index.open_at(0, 9 * 60), {"a": 12 * 60 + 30})
+        self.assertEqual(self.index.open_at(0, 12 * 60 + 30), {})
+        self.assertEqual(self.index.open_at(5, 15 * 60), {})
+        self.assertEqual(self.index.open_at(1, 10 * 60), {})
+
+    def test_holiday_falls_back_to_weekday_without_holiday_row(self):
+        self.assertEqual(self.index.open_at(simple_server.HOLIDAY, 10 * 60), {})
+        self.assertEqual(self.index.open_at(simple_server.HOLIDAY, 10 * 60, weekday=0), {"a": 12 * 60 + 30})
+
+    def test_replace_follows_schedule_changes(self):
+        changed = {"id": "a", "schedule": dict(SCHEDULE, days={"火曜": {"am": "午前A"}})}
+        self.index.replace({"id": "a", "schedule": SCHEDULE}, changed)
+        self.assertEqual(self.index.open_at(0, 10 * 60), {})
+        self.assertEqual(set(self.index.open_at(1, 10 * 60)), {"a"})
+
+
+class OpenAtTest(ServerTestCase):
+    clinic_count = 300
+
+    def test_pages_match_single_page(self):
+        base = "/api/clinicsOpenAt?dow=1&time=10:00"
+        _, _, whole = self.get_json(base + "&limit=2000")
+        self.assertIsNone(whole["nextCursor"])
+        expected = [clinic["id"] for clinic in whole["clinics"]]
+        self.assertTrue(expected)
+        seen, cursor = [], None
+        while True:
+            _, _, payload = self.get_json(base + "&limit=40" + (f"&cursor={cursor}" if cursor else ""))
+            self.assertLessEqual(len(payload["clinics"]), 40)
+            seen += [clinic["id"] for clinic in payload["clinics"]]
+            cursor = payload["nextCursor"]
+            if not cursor:
+                break
+        self.assertEqual(seen, expected)
+
+    def test_default_limit(self):
+        _, _, payload = self.get_json("/api/clinicsOpenAt?dow=1&time=10:00")
+        self.assertLessEqual(len(payload["clinics"]), simple_server.OPEN_AT_DEFAULT_LIMIT)
+
+    def test_weekday_names(self):
+        _, _, by_number = self.get_json("/api/clinicsOpenAt?dow=1&time=10:00&limit=2000")
+        _, _, by_name = self.get_json("/api/clinicsOpenAt?dow=%E7%81%AB&time=10:00&limit=2000")
+        self.assertEqual(by_name["dow"], "火曜")
+        self.assertEqual(by_name["clinics"], by_number["clinics"])
+
+    def test_invalid_parameters(self):
+        for query in ("dow=9&time=10:00", "dow=1&time=25:00", "dow=1&time=10:00&limit=-1",
+                      "dow=1&time=10:00&cursor=%21"):
+            with self.subTest(query=query):
+                self.assertEqual(self.get_json(f"/api/clinicsOpenAt?{query}")[0], 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""RequestProfiler と /api/_profile（--profile-token 指定時のトークン要求）を確認する。"""
+
+import json
+import unittest
+
+from support import AsyncioServer, ThreadingServer, request
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+from simple_server import PROFILE_HEADER, RequestProfiler, collapsed_stacks  # noqa: E402
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_sampling_and_token(self):
+        profiler = RequestProfiler(sample_every=3, token="secret")
+        started = [profiler.start(None) for _ in range(6)]
+        for profile in started:
+            if profile is not None:
+                profile.disable()
+        self.assertEqual([profile is not None for profile in started], [False, False, True] * 2)
+        profile = profiler.start("secret")
+        self.assertIsNotNone(profile)
+        profile.disable()
+        self.assertIsNone(RequestProfiler(sample_every=0, token="secret").start("wrong"))
+
+    def test_record_and_collapsed_output(self):
+        profiler = RequestProfiler(sample_every=1)
+        for _ in range(2):
+            profile = profiler.start(None)
+            simple_server.encode_json({"items": list(range(2000))})
+            profile.disable()
+            profiler.record("/api/listMaster", profile)
+        self.assertEqual(profiler.summary()["/api/listMaster"]["samples"], 2)
+        stacks = collapsed_stacks(profiler.merged("/api/listMaster"))
+        self.assertIn("encode_json", stacks)
+        for line in stacks.splitlines():
+            frames, _, micros = line.rpartition(" ")
+            self.assertTrue(frames)
+            self.assertGreater(int(micros), 0)
+
+
+class ProfileEndpointTest(unittest.TestCase):
+    def setUp(self):
+        self.previous = simple_server.profiler
+        self.addCleanup(setattr, simple_server, "profiler", self.previous)
+
+    def use_profiler(self, **kwargs):
+        simple_server.profiler = RequestProfiler(**kwargs)
+        profile = simple_server.profiler.start(kwargs.get("token"))
+        simple_server.encode_json({"items": list(range(100))})
+        profile.disable()
+        simple_server.profiler.record("/api/listMaster", profile)
+
+    def test_disabled_profiler_is_404(self):
+        simple_server.profiler = None
+        with ThreadingServer(threads=2) as server:
+            self.assertEqual(request(server.port, "GET", "/api/_profile")[0], 404)
+
+    def test_token_is_required_on_both_engines(self):
+        self.use_profiler(token="secret")
+        with ThreadingServer(threads=2) as threaded, AsyncioServer() as engine:
+            for port in (threaded.port, engine.port):
+                with self.subTest(port=port):
+                    for headers in ({}, {PROFILE_HEADER: "wrong"}):
+                        status, _, body = request(port, "GET", "/api/_profile", headers=headers)
+                        self.assertEqual(status, 403)
+                        self.assertFalse(json.loads(body)["ok"])
+                    status, _, body = request(port, "GET", "/api/_profile", headers={PROFILE_HEADER: "secret"})
+                    self.assertEqual(status, 200)
+                    self.assertIn("/api/listMaster", json.loads(body)["routes"])
+                    status, _, body = request(port, "GET", "/api/_profile?route=/api/listMaster&format=collapsed",
+                                              headers={PROFILE_HEADER: "secret"})
+                    self.assertEqual(status, 200)
+                    self.assertIn(b"encode_json", body)
+
+    def test_sampling_without_token_is_open(self):
+        self.use_profiler(sample_every=1)
+        with ThreadingServer(threads=2) as server:
+            status, _, body = request(server.port, "GET", "/api/_profile")
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["sampleEvery"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
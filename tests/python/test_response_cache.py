@@ -0,0 +1,44 @@
+"""読み取り専用ルートのレスポンスキャッシュと、書き込みによる無効化を確認する。"""
+
+import unittest
+
+from support import ServerTestCase
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+
+
+def cache_counts():
+    return dict(simple_server.metrics.snapshot()[4])
+
+
+class ResponseCacheTest(ServerTestCase):
+    clinic_count = 20
+
+    def test_repeated_get_is_served_from_cache(self):
+        path = "/api/listMaster?type=vaccination&cacheTest=1"
+        first = self.request("GET", path)
+        before = cache_counts()
+        second = self.request("GET", path)
+        self.assertEqual(second[2], first[2])
+        self.assertEqual(cache_counts().get("hit", 0), before.get("hit", 0) + 1)
+
+    def test_master_update_invalidates_cached_list(self):
+        path = "/api/listMaster?type=test"
+        item = {"type": "test", "category": "内科一般検査", "name": "血液検査"}
+        status, _, payload = self.get_json(path)
+        original = next(entry for entry in payload["items"] if entry["name"] == "血液検査")
+        try:
+            self.assertEqual(self.post_json("/api/updateMasterItem", dict(item, desc="キャッシュ確認"))[0], 200)
+            _, _, payload = self.get_json(path)
+            updated = next(entry for entry in payload["items"] if entry["name"] == "血液検査")
+            self.assertEqual(updated["desc"], "キャッシュ確認")
+        finally:
+            self.post_json("/api/updateMasterItem", dict(item, desc=original.get("desc")))
+
+    def test_open_at_without_explicit_time_is_not_cached(self):
+        condition = simple_server.CACHE_CONDITIONS["/api/clinicsOpenAt"]
+        self.assertFalse(condition({}))
+        self.assertTrue(condition({"dow": ["1"], "time": ["10:00"]}))
+
+
+if __name__ == "__main__":
+    unittest.main()
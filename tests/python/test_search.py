@@ -0,0 +1,62 @@
+"""NgramIndex と /api/search（診療所・マスターの n-gram 検索）を確認する。"""
+
+import unittest
+from urllib.parse import quote
+
+from support import ServerTestCase
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+
+
+def name_index(names):
+    index = simple_server.NgramIndex((("name", 1, lambda record: record.get("name")),))
+    index.rebuild([{"id": doc_id, "name": name} for doc_id, name in names.items()])
+    return index
+
+
+class NgramIndexTest(unittest.TestCase):
+    def test_exact_then_prefix_then_substring(self):
+        index = name_index({"exact": "中野内科", "prefix": "中野内科クリニック", "inner": "東中野内科医院",
+                            "other": "新宿眼科"})
+        self.assertEqual([doc_id for _, doc_id, _ in index.search("中野内科")], ["exact", "prefix", "inner"])
+
+    def test_single_character_and_kana_folding(self):
+        index = name_index({"a": "ナカノ医院", "b": "眼科"})
+        self.assertEqual([doc_id for _, doc_id, _ in index.search("なかの")], ["a"])
+        self.assertEqual([doc_id for _, doc_id, _ in index.search("眼")], ["b"])
+
+    def test_fuzzy_fallback(self):
+        index = name_index({"a": "なかのさくらクリニック"})
+        hits = index.search("なかのさくらクリニク")
+        self.assertEqual([doc_id for _, doc_id, _ in hits], ["a"])
+        self.assertIsNone(hits[0][2])
+
+    def test_replace_matches_rebuild(self):
+        index = name_index({"a": "中野内科", "b": "新宿眼科"})
+        index.replace({"id": "a", "name": "中野内科"}, {"id": "a", "name": "高円寺皮膚科"})
+        rebuilt = name_index({"a": "高円寺皮膚科", "b": "新宿眼科"})
+        self.assertEqual(index.postings, rebuilt.postings)
+        self.assertEqual(index.by_length, rebuilt.by_length)
+        self.assertEqual(index.search("中野"), [])
+
+
+class SearchRouteTest(ServerTestCase):
+    clinic_count = 300
+
+    def test_search_finds_clinic_by_name(self):
+        name = self.clinics[1]["name"]
+        status, _, payload = self.get_json(f"/api/search?q={quote(name)}&limit=100")
+        self.assertEqual(status, 200)
+        self.assertIn(self.clinics[1]["id"], [clinic["id"] for clinic in payload["clinics"]])
+        self.assertEqual(payload["clinics"][0]["matchedField"], "name")
+
+    def test_masters_are_searched_too(self):
+        _, _, payload = self.get_json(f"/api/search?q={quote('血液検査')}")
+        self.assertIn("血液検査", [master["name"] for master in payload["masters"]])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.get_json("/api/search")[0], 400)
+        self.assertEqual(self.get_json("/api/search?q=a&limit=0")[0], 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
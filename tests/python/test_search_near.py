@@ -0,0 +1,53 @@
+"""GeoIndex と searchClinicsNear（近い順の検索）を確認する。"""
+
+import unittest
+
+from support import ServerTestCase
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+
+
+class GeoIndexTest(unittest.TestCase):
+    def test_near_matches_brute_force(self):
+        points = {f"c{i}": (35.60 + (i % 17) * 0.013, 139.60 + (i // 17) * 0.011) for i in range(200)}
+        index = simple_server.GeoIndex()
+        index.rebuild([{"id": cid, "latitude": lat, "longitude": lng} for cid, (lat, lng) in points.items()])
+        lat, lng, radius = 35.70, 139.70, 3000
+        expected = sorted((simple_server.haversine_m(lat, lng, plat, plng), cid)
+                          for cid, (plat, plng) in points.items()
+                          if simple_server.haversine_m(lat, lng, plat, plng) <= radius)
+        self.assertEqual(index.near(lat, lng, radius, 500), expected)
+        self.assertEqual(index.near(lat, lng, radius, 3), expected[:3])
+
+    def test_replace_moves_and_drops_points(self):
+        index = simple_server.GeoIndex()
+        index.rebuild([{"id": "a", "latitude": 35.70, "longitude": 139.70}])
+        index.replace({"id": "a"}, {"id": "a", "location": {"lat": 35.80, "lng": 139.80}})
+        self.assertEqual([cid for _, cid in index.near(35.80, 139.80, 100, 5)], ["a"])
+        self.assertEqual(index.near(35.70, 139.70, 100, 5), [])
+        index.replace({"id": "a"}, {"id": "a", "latitude": None})
+        self.assertEqual(index.points, {})
+        self.assertEqual(index.cells, {})
+
+
+class SearchNearTest(ServerTestCase):
+    clinic_count = 300
+
+    def test_results_are_sorted_by_distance(self):
+        lat, lng = simple_server.clinic_coordinates(self.clinics[2])
+        status, _, payload = self.get_json(f"/api/searchClinicsNear?lat={lat}&lng={lng}&radius=3000&limit=50")
+        self.assertEqual(status, 200)
+        distances = [clinic["distance"] for clinic in payload["clinics"]]
+        self.assertEqual(distances, sorted(distances))
+        self.assertEqual(payload["clinics"][0]["id"], self.clinics[2]["id"])
+
+    def test_non_finite_parameters_are_400(self):
+        for query in ("lat=35.7&lng=139.7&radius=nan", "lat=nan&lng=139.7", "lat=35.7&lng=inf",
+                      "lat=35.7&lng=139.7&radius=inf", "lat=35.7&lng=139.7&limit=0", "lng=139.7"):
+            with self.subTest(query=query):
+                status, _, payload = self.get_json(f"/api/searchClinicsNear?{query}")
+                self.assertEqual(status, 400)
+                self.assertFalse(payload["ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+"""make_server と --threads / --workers の起動オプションを確認する。"""
+
+import contextlib
+import io
+import json
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from support import ServerTestCase, ThreadingServer, request
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+
+
+class MakeServerTest(unittest.TestCase):
+    def test_server_class_follows_threads(self):
+        with simple_server.make_server("127.0.0.1", 0, 1) as httpd:
+            self.assertIsInstance(httpd, simple_server.SingleThreadTCPServer)
+        with simple_server.make_server("127.0.0.1", 0, 3) as httpd:
+            self.assertIsInstance(httpd, simple_server.SlottedThreadingTCPServer)
+            # 枠は同時に処理するリクエスト数だけを数える
+            self.assertEqual(httpd.max_requests, 3)
+            for _ in range(3):
+                self.assertTrue(httpd.request_slots.acquire(blocking=False))
+            self.assertFalse(httpd.request_slots.acquire(blocking=False))
+            for _ in range(3):
+                httpd.request_slots.release()
+
+    def test_threads_and_workers_must_be_positive(self):
+        for argv in (["--threads", "0"], ["--workers", "0"]):
+            with self.subTest(argv=argv), self.assertRaises(SystemExit), \
+                    contextlib.redirect_stderr(io.StringIO()):
+                simple_server.parse_args(argv)
+
+    def test_single_thread_server_closes_each_connection(self):
+        with ThreadingServer(threads=1) as server:
+            status, headers, _ = request(server.port, "GET", "/api/modes")
+        self.assertEqual(status, 200)
+        self.assertEqual(headers.get("connection"), "close")
+
+
+class ConcurrentRequestsTest(ServerTestCase):
+    clinic_count = 50
+
+    def test_parallel_clients_get_the_same_answer(self):
+        path = "/api/listClinics?limit=20"
+        expected = self.get_json(path)[2]
+        with ThreadPoolExecutor(max_workers=12) as pool:
+            results = list(pool.map(lambda _: self.request("GET", path), range(48)))
+        self.assertEqual({status for status, _, _ in results}, {200})
+        for _, _, body in results:
+            self.assertEqual(json.loads(body), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""scripts/set_department_sort.py の引数と、並列更新に使う TokenBucket / KeepAliveClient を確認する。"""
+
+import sys
+import time
+import unittest
+from unittest import mock
+
+from support import ThreadingServer
+import master_sync  # noqa: E402  (support が sys.path を設定する)
+import set_department_sort  # noqa: E402
+
+
+class DepartmentSortArgsTest(unittest.TestCase):
+    def rate_for(self, argv):
+        seen = {}
+        with mock.patch.object(set_department_sort, "run", lambda entries, args, user_agent=None: seen.update(
+                rate=args.rate) or 0), mock.patch.object(sys, "argv", ["set_department_sort.py", *argv]):
+            with self.assertRaises(SystemExit):
+                set_department_sort.main()
+        return seen["rate"]
+
+    def test_explicit_rate_wins_over_sleep(self):
+        self.assertEqual(self.rate_for(["--rate", "20", "--sleep", "1"]), 20)
+
+    def test_sleep_is_the_fallback(self):
+        self.assertEqual(self.rate_for(["--sleep", "0.5"]), 2)
+        self.assertEqual(self.rate_for([]), 5)
+
+
+class DiffOnlyTest(unittest.TestCase):
+    def test_only_departments_that_differ_are_posted(self):
+        entries = set_department_sort.plan_entries()
+        current = [{"type": "department", "category": None, "name": entry["name"], **entry["fields"]}
+                   for entry in entries]
+        current[0] = dict(current[0], sortOrder=999)
+        current[1] = dict(current[1], sortOrder=str(current[1]["sortOrder"]))  # 文字列の数値は同じ値とみなす
+        changes, missing = master_sync.compute_changes(entries, {"department": current})
+        self.assertEqual(missing, [])
+        self.assertEqual([(entry["name"], changed) for entry, _, changed in changes],
+                         [(entries[0]["name"], {"sortOrder": entries[0]["fields"]["sortOrder"]})])
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_rate_spaces_requests_after_the_burst(self):
+        bucket = master_sync.TokenBucket(rate=50, burst=2)
+        started = time.monotonic()
+        for _ in range(7):
+            bucket.acquire()
+        # 2 件はすぐ、残り 5 件は 1/50 秒ずつ
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    def test_zero_rate_does_not_wait(self):
+        bucket = master_sync.TokenBucket(rate=0)
+        started = time.monotonic()
+        for _ in range(100):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - started, 0.05)
+
+
+class KeepAliveClientTest(unittest.TestCase):
+    def test_requests_reuse_the_thread_connection(self):
+        with ThreadingServer(threads=2) as server:
+            client = master_sync.KeepAliveClient(f"http://127.0.0.1:{server.port}")
+            try:
+                self.assertTrue(client.request("GET", "/api/modes")["ok"])
+                sock = client.connection().sock
+                self.assertTrue(client.request("GET", "/api/listMaster?type=department")["ok"])
+                self.assertIs(client.connection().sock, sock)
+                self.assertEqual(len(client.latencies), 2)
+                with self.assertRaises(master_sync.ApiError):
+                    client.request("GET", "/api/clinicDetail?id=no-such-clinic")
+            finally:
+                client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
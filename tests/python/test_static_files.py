@@ -0,0 +1,72 @@
+"""StaticFileCache（web/ のメモリ保持・Range・sendfile）を確認する。"""
+
+import gzip
+import os
+import tempfile
+import unittest
+
+from support import ServerTestCase
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+
+
+class StaticFileCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.small = os.path.join(self.tmp.name, "app.js")
+        self.large = os.path.join(self.tmp.name, "data.bin")
+        with open(self.small, "w", encoding="utf-8") as f:
+            f.write("console.log('ncd');\n" * 80)
+        with open(self.large, "wb") as f:
+            f.write(os.urandom(4096))
+        self.cache = simple_server.StaticFileCache(preload_max=2048, precompress=True)
+        self.cache.build(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_small_text_is_preloaded_with_gzip_variant(self):
+        asset = self.cache.get(self.small)
+        self.assertIsNotNone(asset.data)
+        status, headers, body, span = simple_server.static_response_parts(asset, accept_encoding="gzip")
+        self.assertEqual((status, span), (200, None))
+        self.assertEqual(gzip.decompress(body), asset.data)
+        self.assertIn(("Content-Encoding", "gzip"), headers)
+
+    def test_large_file_is_sent_from_disk(self):
+        asset = self.cache.get(self.large)
+        self.assertIsNone(asset.data)
+        self.assertEqual(simple_server.static_response_parts(asset)[3], (0, 4096))
+        self.assertEqual(simple_server.static_response_parts(asset, range_header="bytes=100-199")[3], (100, 100))
+
+    def test_changed_file_is_reloaded_and_removed_file_is_dropped(self):
+        with open(self.small, "w", encoding="utf-8") as f:
+            f.write("changed")
+        os.utime(self.small, (1, 1))
+        self.assertEqual(self.cache.get(self.small).data, b"changed")
+        os.remove(self.small)
+        self.assertIsNone(self.cache.get(self.small))
+
+
+class StaticRangeTest(ServerTestCase):
+    clinic_count = 10
+
+    def test_range(self):
+        status, headers, body = self.request("GET", "/index.html", headers={"Range": "bytes=0-9"})
+        self.assertEqual(status, 206)
+        self.assertEqual(len(body), 10)
+        self.assertTrue(headers["content-range"].startswith("bytes 0-9/"))
+
+    def test_unsatisfiable_range(self):
+        status, headers, _ = self.request("GET", "/index.html", headers={"Range": "bytes=99999999-"})
+        self.assertEqual(status, 416)
+        self.assertTrue(headers["content-range"].startswith("bytes */"))
+
+    def test_head_has_length_without_body(self):
+        status, headers, body = self.request("HEAD", "/index.html")
+        self.assertEqual(status, 200)
+        self.assertGreater(int(headers["content-length"]), 0)
+        self.assertEqual(body, b"")
+
+
+if __name__ == "__main__":
+    unittest.main()
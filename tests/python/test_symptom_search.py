@@ -0,0 +1,66 @@
+"""MasterRefIndex（マスター → 参照する診療所の転置索引）と thesaurus / searchClinicsBySymptom を確認する。"""
+
+import unittest
+from urllib.parse import quote
+
+from support import ServerTestCase
+import simple_server  # noqa: E402  (support が sys.path を設定する)
+
+
+class MasterRefIndexTest(unittest.TestCase):
+    def test_replace_matches_rebuild(self):
+        before = {"id": "a", "departments": {"master": ["内科", "小児科"]},
+                  "vaccinations": {"selected": ["master:vaccination:定期接種|MRワクチン"]}}
+        after = {"id": "a", "departments": {"master": ["内科"]},
+                 "services": [{"category": "内視鏡", "name": "胃カメラ"}]}
+        other = {"id": "b", "departments": {"master": ["小児科"]}}
+        incremental = simple_server.MasterRefIndex()
+        incremental.rebuild([before, other])
+        incremental.replace(before, after)
+        rebuilt = simple_server.MasterRefIndex()
+        rebuilt.rebuild([after, other])
+        self.assertEqual(incremental.postings, rebuilt.postings)
+        self.assertEqual(incremental.clinics_for("department:小児科"), {"b": "departments"})
+        self.assertEqual(incremental.clinics_for("service:内視鏡|胃カメラ"), {"a": "services"})
+
+
+class SymptomSearchTest(ServerTestCase):
+    clinic_count = 200
+
+    def test_department_name_finds_referencing_clinics(self):
+        department = self.clinics[0]["departments"]["master"][0]
+        status, _, payload = self.get_json(f"/api/searchClinicsBySymptom?q={quote(department)}")
+        self.assertEqual(status, 200)
+        expected = {clinic["id"] for clinic in self.clinics if department in clinic["departments"]["master"]}
+        self.assertEqual({clinic["clinicId"] for clinic in payload["clinics"]}, expected)
+        self.assertTrue(all(clinic["matchedMasters"] for clinic in payload["clinics"]))
+
+    def test_missing_and_unknown_terms(self):
+        self.assertEqual(self.get_json("/api/searchClinicsBySymptom")[0], 400)
+        self.assertEqual(self.get_json(f"/api/searchClinicsBySymptom?q={quote('存在しない症状')}")[0], 404)
+
+
+class ThesaurusTest(ServerTestCase):
+    clinic_count = 10
+
+    def test_term_matches_variants(self):
+        _, _, payload = self.get_json(f"/api/thesaurus?term={quote('メタボ')}")
+        self.assertEqual([entry["normalized"] for entry in payload["items"]], ["特定健診"])
+        _, _, payload = self.get_json("/api/thesaurus?context=vaccination")
+        self.assertEqual([entry["normalized"] for entry in payload["items"]], ["mrワクチン"])
+
+    def test_save_and_fetch(self):
+        try:
+            status, _ = self.post_json("/api/thesaurus", {"term": "テスト語", "variants": ["てすとご", ""]})
+            self.assertEqual(status, 200)
+            _, _, payload = self.get_json(f"/api/thesaurus?normalized={quote('テスト語')}")
+            self.assertEqual(payload["items"][0]["variants"], ["てすとご"])
+        finally:
+            with simple_server.thesaurus_lock:
+                simple_server.SAMPLE_THESAURUS.pop("テスト語", None)
+                simple_server.alias_index.rebuild_thesaurus(simple_server.SAMPLE_THESAURUS)
+            simple_server.bump_data_version()
+
+
+if __name__ == "__main__":
+    unittest.main()